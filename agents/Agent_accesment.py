@@ -12,18 +12,22 @@ sys.path.append(parent_path)
 from agents.Agent_dbmanager import DatabaseManagerAgent
 from src.Clinet_LLM import LLMClient
 from functions.academic_assessment_core import run_academic_assessment
+from functions.assessment_cache import AssessmentCache
 
 class AcademicAssessmentAgent:
     """学业评估Agent类（封装评估逻辑）"""
     
-    def __init__(self, llm_client: LLMClient, db_agent: DatabaseManagerAgent = None):
+    def __init__(self, llm_client: LLMClient, db_agent: DatabaseManagerAgent = None,
+                 assessment_cache: AssessmentCache = None):
         """
         初始化评估Agent
         :param llm_client: LLM客户端实例
         :param db_agent: 数据库Agent实例（可选，默认自动初始化）
+        :param assessment_cache: 评估结果缓存（可选，多个Agent共享同一实例时可复用彼此的评估结果）
         """
         self.llm_client = llm_client
         self.db_agent = db_agent or DatabaseManagerAgent(data_path="/home/lst/data/assistment2009/skill_builder_data.csv")
+        self.assessment_cache = assessment_cache
 
     def run(self, student_id: str, subject: str) -> dict:
         """
@@ -38,7 +42,8 @@ class AcademicAssessmentAgent:
                 db_agent=self.db_agent,
                 llm_client=self.llm_client,
                 student_id=student_id,
-                subject=subject
+                subject=subject,
+                assessment_cache=self.assessment_cache
             )
             return assessment_result
         
@@ -10,49 +10,59 @@ parent_path = os.path.dirname(os.path.dirname(current_path))
 sys.path.append(parent_path)
 
 from functions.academic_assessment_core import run_academic_assessment
+from functions.assessment_cache import AssessmentCache
 from functions.academic_planning_core import run_academic_planning
+from functions.plan_store import PlanStore
 from functions.coordinator_core import (
     integrate_assessment_result,
     detect_and_resolve_conflicts,
+    search_resolution_orders,
     integrate_service_output
 )
+from functions.pipeline_dag import PipelineDAG
 from agents.Agent_dbmanager import DatabaseManagerAgent
 from src.Clinet_LLM import LLMClient
 
 class CoordinatorAgent:
     """协调智能体（评估整合+冲突解决+服务输出）"""
-    def __init__(self, llm_client: LLMClient, db_agent: DatabaseManagerAgent):
+    def __init__(self, llm_client: LLMClient, db_agent: DatabaseManagerAgent,
+                 assessment_cache: Optional[AssessmentCache] = None, plan_store: Optional[PlanStore] = None):
         self.llm_client = llm_client
         self.db_agent = db_agent
+        self.assessment_cache = assessment_cache  # 可选：与其他Agent共享的评估结果缓存
+        self.plan_store = plan_store  # 可选：与规划Agent共享的已保存规划
+        self.last_stage_timings: Optional[Dict[str, Any]] = None  # 最近一次流水线各阶段耗时
     
     def run(
         self,
         student_id: str,
         subject: str,
         long_term_goal: str,
-        execution_feedback: Optional[Dict[str, Any]] = None
+        execution_feedback: Optional[Dict[str, Any]] = None,
+        search_orders: bool = False
     ) -> Dict[str, Any]:
-        """执行协调流程"""
+        """执行协调流程（各阶段以DAG声明，记录阶段耗时）
+        search_orders=True 时依次评估多个冲突解决顺序并采用得分最高者，输出附带各候选的评分与耗时
+        """
+        dag = PipelineDAG("coordination")
         # 1. 获取评估结果并整合
-        raw_assessment = run_academic_assessment(self.db_agent, self.llm_client, student_id, subject)
-        integrated_assessment = integrate_assessment_result(raw_assessment)
-        
+        dag.add_stage("raw_assessment", lambda: run_academic_assessment(
+            self.db_agent, self.llm_client, student_id, subject, assessment_cache=self.assessment_cache))
+        dag.add_stage("assessment", lambda raw_assessment: integrate_assessment_result(raw_assessment), deps=["raw_assessment"])
         # 2. 获取初始规划结果
-        raw_plan = run_academic_planning(
-            integrated_assessment,
-            long_term_goal,
-            subject,
-            self.db_agent,
-            execution_feedback
-        )
-        
+        dag.add_stage("plan", lambda assessment: run_academic_planning(
+            assessment, long_term_goal, subject, self.db_agent, execution_feedback, plan_store=self.plan_store),
+            deps=["assessment"])
         # 3. 自动化冲突检测与解决
-        conflict_result = detect_and_resolve_conflicts(integrated_assessment, raw_plan)
-        
+        resolve_conflicts = search_resolution_orders if search_orders else detect_and_resolve_conflicts
+        dag.add_stage("conflict_result", lambda assessment, plan: resolve_conflicts(
+            assessment, plan, db_agent=self.db_agent), deps=["assessment", "plan"])
         # 4. 整合最终服务输出
-        final_output = integrate_service_output(integrated_assessment, conflict_result)
-        
-        return final_output
+        dag.add_stage("final_output", integrate_service_output, deps=["assessment", "conflict_result"])
+
+        pipeline = dag.run()
+        self.last_stage_timings = pipeline.timing_summary()
+        return pipeline["final_output"]
 
 
 
@@ -1,4 +1,4 @@
-from typing import Dict, Any, Optional, List  # 补全缺失的List导入
+from typing import Dict, Any, Optional, List, Callable, Iterable, Tuple  # 补全缺失的List导入
 from termcolor import colored
 
 import sys
@@ -23,16 +23,48 @@ class DatabaseManagerAgent:
         self.student_basic_data = self.data_processor.build_student_data()
         self.resource_lib = self.data_processor.build_resource_data()
         self.knowledge_graph = self.data_processor.build_knowledge_graph()
+        self.build_resource_index()
+        # 学生数据版本号（每次更新+1，供评估缓存等判断数据是否变化）及更新监听器
+        self._student_versions: Dict[str, int] = {}
+        self._update_listeners: List[Callable[[str], None]] = []
 
     def query_student_basic(self, student_id: str) -> Dict[str, Any]:
         """查询学生基础信息（含画像）"""
         return self.student_basic_data.get(student_id, {"error": "学生ID不存在"})
 
+    def build_resource_index(self) -> None:
+        """建立资源索引（资源ID / 知识点 / (知识点, 难度, 格式)）；resource_lib被修改后需重新调用"""
+        self._resource_by_id: Dict[str, Dict[str, Any]] = {}
+        self._resources_by_kp: Dict[str, List[Dict[str, Any]]] = {}
+        self._resource_by_attrs: Dict[Tuple[Any, Any, Any], Dict[str, Any]] = {}
+        for resource in self.resource_lib:
+            self._resource_by_id.setdefault(resource["resource_id"], resource)
+            self._resources_by_kp.setdefault(resource["knowledge_point"], []).append(resource)
+            attrs = (resource["knowledge_point"], resource["difficulty_level"], resource["format"])
+            self._resource_by_attrs.setdefault(attrs, resource)  # 与query_resource一致：保留第一个匹配项
+
+    def lookup_resources(self, resource_ids: Iterable[str] = (),
+                         knowledge_points: Iterable[str] = ()) -> Dict[str, Dict[str, Any]]:
+        """批量查询资源（一次调用完成一轮冲突处理所需的全部资源查询）
+        Returns:
+            {"by_id": {资源ID: 资源}（不存在的ID不返回）,
+             "by_knowledge_point": {知识点: 该知识点全部资源}（含by_id中资源所属的知识点）}
+        """
+        by_id = {rid: self._resource_by_id[rid] for rid in resource_ids if rid in self._resource_by_id}
+        kps = set(knowledge_points) | {resource["knowledge_point"] for resource in by_id.values()}
+        return {
+            "by_id": by_id,
+            "by_knowledge_point": {kp: list(self._resources_by_kp.get(kp, [])) for kp in kps}
+        }
+
     def query_resource(self, **kwargs) -> Optional[Dict[str, Any]]:
         """多条件查询资源（适配新字段：error_rate/difficulty_level）
         Args:
             kwargs: 支持knowledge_point/difficulty_level/format/error_rate等条件
         """
+        # 常用的"知识点+难度+格式"精确查询走索引
+        if kwargs.keys() == {"knowledge_point", "difficulty_level", "format"}:
+            return self._resource_by_attrs.get((kwargs["knowledge_point"], kwargs["difficulty_level"], kwargs["format"]))
         matched_resources = []
         for resource in self.resource_lib:
             match = True
@@ -70,6 +102,14 @@ class DatabaseManagerAgent:
                 return [f"父分类：{parent_category}"] + siblings
         return ["无关联知识点"]
 
+    def get_skill_names(self) -> List[str]:
+        """全部已知知识点名（知识图谱 + 资源库，去重保序）"""
+        names = []
+        for category_info in self.knowledge_graph.values():
+            names += category_info if isinstance(category_info, list) else category_info.get("skill_names", [])
+        names += [res.get("knowledge_point") for res in self.resource_lib]
+        return list(dict.fromkeys(name for name in names if isinstance(name, str) and name))
+
     def query_resource_by_error_rate(self, min_rate: float, max_rate: float) -> List[Dict[str, Any]]:
         """新增：按错误率范围查询资源"""
         return [
@@ -96,10 +136,21 @@ class DatabaseManagerAgent:
             current_progress = self.student_basic_data[student_id].get("learning_progress", {})
             current_progress.update(progress_data)
             self.student_basic_data[student_id]["learning_progress"] = current_progress
+            self._student_versions[student_id] = self._student_versions.get(student_id, 0) + 1
+            for listener in self._update_listeners:
+                listener(student_id)
             print(f"✅ 学生{student_id}进度已更新：{current_progress}")
         else:
             print(f"❌ 学生{student_id}不存在")
 
+    def get_data_version(self, student_id: str) -> int:
+        """获取学生数据版本号（初始为0，update_student_progress每次调用后递增）"""
+        return self._student_versions.get(student_id, 0)
+
+    def register_update_listener(self, listener: Callable[[str], None]) -> None:
+        """注册学生数据更新监听器（参数为被更新的学生ID）"""
+        self._update_listeners.append(listener)
+
     def get_resource_statistics(self) -> Dict[str, Any]:
         """新增：获取资源统计信息（适配新字段）"""
         if not self.resource_lib:
@@ -1,5 +1,5 @@
 # academic_guidance_agent.py
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterator
 
 import sys
 import os
@@ -13,35 +13,144 @@ sys.path.append(parent_path)
 from agents.Agent_dbmanager import DatabaseManagerAgent
 from src.Clinet_LLM import LLMClient
 from functions.academic_assessment_core import run_academic_assessment
-from functions.academic_guidance_core import run_academic_guidance
+from functions.assessment_cache import AssessmentCache
+from functions.academic_guidance_core import (
+    build_guidance_dag, assemble_guidance_result, run_academic_guidance_stream
+)
+from functions.pipeline_dag import PipelineDAG
+from functions.guidance_session import GuidanceSession, GuidanceSessionStore
 
 class AcademicGuidanceAgent:
     """学业问题引导智能体（交互式+场景化+迁移化）"""
-    def __init__(self, llm_client: LLMClient, db_agent: DatabaseManagerAgent):
+    def __init__(self, llm_client: LLMClient, db_agent: DatabaseManagerAgent,
+                 assessment_cache: Optional[AssessmentCache] = None,
+                 session_store: Optional[GuidanceSessionStore] = None):
         self.llm_client = llm_client
         self.db_agent = db_agent
+        self.assessment_cache = assessment_cache  # 可选：与其他Agent共享的评估结果缓存
+        self.session_store = session_store if session_store is not None else GuidanceSessionStore()  # 多轮引导会话
+        self.last_stage_timings: Optional[Dict[str, Any]] = None  # 最近一次流水线各阶段耗时
     
     def run(
         self, 
         student_id: str, 
         subject: str, 
         question_desc: str, 
-        inquiry_answers: Optional[List[str]] = None
+        inquiry_answers: Optional[List[str]] = None,
+        session_id: Optional[str] = None
     ) -> Dict[str, Any]:
-        """交互式引导主入口"""
-        # 1. 获取学生评估结果（适配字典格式）
-        assessment_result = run_academic_assessment(self.db_agent, self.llm_client, student_id, subject)
-        
-        # 2. 执行引导流程
-        guidance_result = run_academic_guidance(
+        """交互式引导主入口
+        session_id: 上一轮返回的会话ID；会话有效时复用其评估结果、场景化拆解与练习资源，后续轮次只调用一次LLM
+        """
+        session = self._resume_session(session_id, student_id, subject, inquiry_answers)
+        if session is not None and not inquiry_answers:
+            # 会话内重复请求追问：直接返回第一轮保存的追问
+            return self._inquiry_result(session)
+
+        # 评估/场景化拆解/资源匹配并发执行，追问或迁移化方案等待评估完成后调用LLM
+        pipeline = self._build_dag(session, student_id, subject, question_desc, inquiry_answers).run()
+        self.last_stage_timings = pipeline.timing_summary()
+        if session is None:
+            session = self._create_session(student_id, subject, question_desc, pipeline.results)
+
+        guidance_result = assemble_guidance_result(pipeline.results, inquiry_answers)
+        guidance_result["session_id"] = session.session_id
+        return guidance_result
+
+    def run_stream(
+        self,
+        student_id: str,
+        subject: str,
+        question_desc: str,
+        inquiry_answers: Optional[List[str]] = None,
+        session_id: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """交互式引导流式入口（token事件 + 最终result事件，result中带session_id）"""
+        session = self._resume_session(session_id, student_id, subject, inquiry_answers)
+        if session is not None and not inquiry_answers:
+            yield {"event": "result", "data": self._inquiry_result(session)}
+            return
+        if session is None:
+            pipeline = self._build_dag(None, student_id, subject, question_desc, inquiry_answers,
+                                       include_llm_stage=False).run()
+            self.last_stage_timings = pipeline.timing_summary()
+            session = self._create_session(student_id, subject, question_desc, pipeline.results)
+
+        for event in run_academic_guidance_stream(
             llm_client=self.llm_client,
             db_agent=self.db_agent,
-            assessment_result=assessment_result,
-            question_desc=question_desc,
-            inquiry_answers=inquiry_answers
+            assessment_result=session.assessment,
+            question_desc=session.question_desc,
+            inquiry_answers=inquiry_answers,
+            scenario_decomp=session.scenario_decomp,
+            practice_resources=session.practice_resources
+        ):
+            if event["event"] == "result":
+                if not inquiry_answers:
+                    session.inquiry_questions = event["data"]["inquiry_questions"]
+                    self.session_store.save(session)
+                event["data"]["session_id"] = session.session_id
+            yield event
+
+    # -------------------------- 会话管理 --------------------------
+    def _build_dag(self, session: Optional[GuidanceSession], student_id: str, subject: str, question_desc: str,
+                   inquiry_answers: Optional[List[str]], include_llm_stage: bool = True) -> PipelineDAG:
+        """构建引导流水线（有会话时评估/拆解/资源直接取会话中保存的结果）"""
+        if session is not None:
+            return build_guidance_dag(
+                self.llm_client, self.db_agent, session.question_desc, session.subject,
+                assessment_fn=lambda: session.assessment,
+                inquiry_answers=inquiry_answers,
+                scenario_decomp=session.scenario_decomp,
+                practice_resources=session.practice_resources,
+                include_llm_stage=include_llm_stage
+            )
+        return build_guidance_dag(
+            self.llm_client, self.db_agent, question_desc, subject,
+            assessment_fn=lambda: run_academic_assessment(self.db_agent, self.llm_client, student_id, subject,
+                                                          assessment_cache=self.assessment_cache),
+            inquiry_answers=inquiry_answers,
+            include_llm_stage=include_llm_stage
         )
-        
-        return guidance_result
+
+    def _create_session(self, student_id: str, subject: str, question_desc: str, results: Dict[str, Any]) -> GuidanceSession:
+        """用第一轮流水线结果新建会话"""
+        return self.session_store.create(
+            student_id, subject, question_desc,
+            assessment=results["assessment"],
+            scenario_decomp=results["scenario_decomp"],
+            inquiry_questions=results.get("inquiry_questions"),
+            practice_resources=results["practice_resources"]
+        )
+
+    def _resume_session(self, session_id: Optional[str], student_id: str, subject: str,
+                        inquiry_answers: Optional[List[str]]) -> Optional[GuidanceSession]:
+        """恢复有效会话并记录本轮回答（会话不存在/已过期/不属于该学生与学科时返回None，由调用方新建）"""
+        if not session_id:
+            return None
+        session = self.session_store.get(session_id)
+        if session is None:
+            print(f"⚠️ 引导会话{session_id}不存在或已过期，重新开始")
+            return None
+        if session.student_id != student_id or session.subject.lower() != subject.lower():
+            # 不返回其他学生的评估结果与追问，也不向其会话写入回答
+            print(f"⚠️ 引导会话{session_id}与请求的学生/学科不匹配，重新开始")
+            return None
+        if inquiry_answers:
+            session.answer_history.append(list(inquiry_answers))
+            self.session_store.save(session)
+        return session
+
+    @staticmethod
+    def _inquiry_result(session: GuidanceSession) -> Dict[str, Any]:
+        return {
+            "interactive_step": "inquiry",
+            "inquiry_questions": session.inquiry_questions,
+            "step_by_step_guide": session.scenario_decomp,
+            "guide_content": [],
+            "practice_resources": [],
+            "session_id": session.session_id
+        }
 
 
 
@@ -1,6 +1,8 @@
 import os
 import sys
 import re
+import time
+import threading
 from typing import Dict, List, Any, Optional, Tuple
 from enum import Enum
 from termcolor import colored
@@ -16,6 +18,12 @@ from src.agents_wrapper import AgentsManager  # 确保AgentsManager能正确实
 from src.Clinet_LLM import LLMClient  # 修正拼写错误（原代码中是Clinet_LLM）
 from agents.Agent_dbmanager import DatabaseManagerAgent
 from utils.utils import format_result  # 复用现有结果格式化工具
+from src.prompt_builder import log_prompt_tokens
+from src.basemodel import IntentLLMOutput, EntityLLMOutput
+from utils.llm_json import generate_structured, LLMJSONError, LLMSchemaError
+from functions.pipeline_dag import PipelineDAG
+from src.intent_classifier import IntentClassifier, UtteranceLogger, model_file_path
+from src.nlu_matcher import NLUMatcher, NLUScanResult
 
 # 意图类型枚举
 class IntentType(Enum):
@@ -36,14 +44,26 @@ class EntityKeys:
     FEEDBACK_NOTE = "feedback_note"
     GOAL = "goal"              # 长期目标
     GOAL_SCORE = "goal_score"  # 目标分数（新增，解决当前错误
+    SKILL = "skill"            # 知识点（按已知知识点名匹配）
+
+# 科目别名归一化（中文说法→系统科目名）
+SUBJECT_ALIASES = {"数学": "math"}
 
 class AgentNLU:
     """自然语言理解智能体（自主解析意图+调用功能）"""
-    def __init__(self, data_path: str = "/home/lst/data/assistment2009/skill_builder_data.csv"):
-        # 初始化依赖组件
-        self.llm_client = LLMClient(model_type="cloud", model_name="llama3-edu")
+    def __init__(self, data_path: str = "/home/lst/data/assistment2009/skill_builder_data.csv", model_type: Optional[str] = None,
+                 rule_confidence_threshold: float = 0.8, intent_model_path: Optional[str] = None,
+                 classifier_threshold: float = 0.7, utterance_log_path: Optional[str] = None):
+        """
+        :param rule_confidence_threshold: 规则识别置信度阈值，达到阈值且实体完整时直接路由、不调用LLM（>1表示总是调用LLM）
+        :param intent_model_path: 本地意图分类器模型（npz，默认读取环境变量EDU_NLU_INTENT_MODEL），规则置信度不足时优先使用
+        :param classifier_threshold: 分类器置信度阈值，低于阈值时才调用LLM确认意图
+        :param utterance_log_path: 用户输入日志路径（JSONL，默认读取环境变量EDU_NLU_LOG_PATH），用于重新训练分类器
+        """
+        # 初始化依赖组件（model_type为None时读取环境变量EDU_LLM_BACKEND，支持fake离线运行）
+        self.llm_client = LLMClient(model_type=model_type, model_name="llama3-edu")
         self.db_agent = DatabaseManagerAgent(data_path=data_path)
-        self.agent_manager = AgentsManager(data_path=data_path)
+        self.agent_manager = AgentsManager(data_path=data_path, model_type=model_type)
         
         # 意图关键词库（规则+LLM混合识别）
         self.intent_keywords = {
@@ -57,65 +77,131 @@ class AgentNLU:
         # agents/Agent_nlu.py（实体模式定义部分）
         self.entity_patterns = {
             EntityKeys.STUDENT_ID: r"S\d+",
-            EntityKeys.SUBJECT: r"(math|语文|英语)",
+            EntityKeys.SUBJECT: r"(math|数学|语文|英语)",
             EntityKeys.FEEDBACK_RATE: r"(\d+)%",
             EntityKeys.FEEDBACK_TASK_ID: r"T\d+|t_\w+",
             EntityKeys.GOAL: r".+",  # 可根据实际需求优化目标提取正则
             EntityKeys.GOAL_SCORE: r"(\d+)分"  # 此处引用需与枚举成员名一致
         }
 
+        # 一次扫描完成关键词命中、知识点匹配与实体提取（关键词/知识点走Aho-Corasick自动机，实体正则预编译）
+        self.skill_names = self.db_agent.get_skill_names()
+        self.matcher = NLUMatcher(
+            self.intent_keywords,
+            self.entity_patterns,
+            skill_names=self.skill_names,
+            value_converters={
+                EntityKeys.FEEDBACK_RATE: int,
+                EntityKeys.SUBJECT: lambda value: SUBJECT_ALIASES.get(value, value)
+            }
+        )
+
+        # 规则快速路径：置信度阈值 + 路由统计（rule_only=完全未调用LLM）
+        self.rule_confidence_threshold = rule_confidence_threshold
+        self.routing_stats = {"turns": 0, "rule_only": 0, "classifier": 0, "llm_intent": 0, "llm_entities": 0}
+        self._routing_lock = threading.Lock()
+
+        # 本地意图分类器（可选）与用户输入日志（可选）
+        self.classifier_threshold = classifier_threshold
+        self.intent_classifier: Optional[IntentClassifier] = None
+        intent_model_path = intent_model_path or os.environ.get("EDU_NLU_INTENT_MODEL")
+        if intent_model_path:
+            intent_model_path = model_file_path(intent_model_path)
+        if intent_model_path and os.path.exists(intent_model_path):
+            self.intent_classifier = IntentClassifier.load(intent_model_path)
+            print(f"✅ 已加载本地意图分类器：{intent_model_path}")
+        utterance_log_path = utterance_log_path or os.environ.get("EDU_NLU_LOG_PATH")
+        self.utterance_logger = UtteranceLogger(utterance_log_path) if utterance_log_path else None
+
+    def _rule_based_intent_scores(self, text: str) -> Dict[IntentType, int]:
+        """各意图的关键词命中数（只包含有命中的意图）"""
+        return self.matcher.scan(text).intent_hits
+
     def _rule_based_intent_detect(self, text: str) -> IntentType:
-        """基于规则的意图识别（快速匹配关键词）"""
-        text_lower = text.lower()
-        for intent, keywords in self.intent_keywords.items():
-            if any(keyword in text_lower for keyword in keywords):
-                return intent
-        return IntentType.UNKNOWN
+        """基于规则的意图识别（快速匹配关键词，命中数最多的意图优先）"""
+        scores = self._rule_based_intent_scores(text)
+        return max(scores, key=scores.get) if scores else IntentType.UNKNOWN
+
+    def rule_intent_confidence(self, text: str, entities: Optional[Dict[str, Any]] = None,
+                               intent_hits: Optional[Dict[IntentType, int]] = None) -> Tuple[IntentType, float]:
+        """规则识别结果及其置信度（0~1）
+        - 关键词命中：命中1个0.3，2个及以上0.4
+        - 意图冲突：其他意图也有命中时按领先幅度折减（满分0.35）
+        - 实体完整度：按check_entity_completeness的必要实体齐全比例（满分0.25）
+        """
+        scores = intent_hits if intent_hits is not None else self._rule_based_intent_scores(text)
+        if not scores:
+            return IntentType.UNKNOWN, 0.0
+        ranked = sorted(scores.values(), reverse=True)
+        intent = max(scores, key=scores.get)
+        top_hits = ranked[0]
+        runner_up = ranked[1] if len(ranked) > 1 else 0
+
+        keyword_score = 0.4 if top_hits >= 2 else 0.3
+        margin_score = 0.35 * (top_hits - runner_up) / top_hits
+        if entities is None:
+            entities = self._rule_based_entities(text)
+        _, missing = self.check_entity_completeness(intent, entities)
+        required = len(self._required_entities.get(intent, [])) or 1
+        completeness_score = 0.25 * (required - len(missing)) / required
+        return intent, round(keyword_score + margin_score + completeness_score, 4)
 
     def _llm_based_intent_confirm(self, text: str, rule_intent: IntentType) -> IntentType:
-        """基于LLM的意图确认（解决模糊场景）"""
+        """基于LLM的意图确认（解决模糊场景；LLM失败时返回规则识别的意图）"""
+        confirmed = self._llm_intent(text, rule_intent)
+        return confirmed if confirmed is not None else rule_intent
+
+    def _llm_intent(self, text: str, rule_intent: IntentType) -> Optional[IntentType]:
+        """LLM意图确认结果（调用或解析失败时返回None）"""
         prompt = f"""
         请分析用户输入的意图，只能从以下选项中选择：{[i.value for i in IntentType]}
         用户输入：{text}
         初步识别结果：{rule_intent.value}
-        若初步识别准确，直接返回该意图；否则修正为正确意图（仅返回意图名称）。
+        若初步识别准确，直接返回该意图；否则修正为正确意图。
+        输出格式：JSON对象 {{"intent": "意图名称"}}
         """
-        #########################这个地方重写一下,需要真的参考rule，+LLM分析意图###########################
+        log_prompt_tokens("nlu_intent", prompt)
         try:
-            result = self.llm_client.generate_edu_response(prompt, temperature=0.1).strip()
-            print(colored(result, "red"))
-            
-            # 解析JSON提取intent字段
-            result_data = json.loads(result)
-            intent_str = result_data.get("intent", "").strip()  # 获取intent值
-            
-            # 匹配IntentType
-            return next((i for i in IntentType if i.value == intent_str), IntentType.UNKNOWN)
-        
-        except json.JSONDecodeError:
-            # 若JSON解析失败，直接用原始字符串匹配（兼容非JSON返回）
-            return next((i for i in IntentType if i.value == result), rule_intent)
+            result_data = generate_structured(self.llm_client, prompt, IntentLLMOutput, "nlu_intent", temperature=0.1)
+            return IntentType(result_data["intent"])
+        except (LLMJSONError, LLMSchemaError) as e:
+            print(f"⚠️ 意图解析失败，使用规则识别结果：{e}")
+            return None
         except Exception as e:
             print(f"⚠️ 意图解析异常：{e}")
-            return rule_intent  # 兜底返回规则识别的意图
-        #################################################################
+            return None  # 由调用方兜底为规则识别的意图
     def detect_intent(self, text: str) -> IntentType:
-        """意图识别主流程（规则+LLM混合）"""
-        rule_intent = self._rule_based_intent_detect(text)
+        """意图识别主流程（规则置信度达到阈值时直接返回，否则LLM确认）"""
+        rule_intent, confidence = self.rule_intent_confidence(text)
+        if confidence >= self.rule_confidence_threshold:
+            return rule_intent
+        classified = self._classify_intent(text)
+        if classified is not None and classified[1] >= self.classifier_threshold:
+            return classified[0]
         return self._llm_based_intent_confirm(text, rule_intent)
 
-    def extract_entities(self, text: str) -> Dict[str, Any]:
+    def _classify_intent(self, text: str) -> Optional[Tuple[IntentType, float]]:
+        """本地分类器预测（未加载模型或标签无法识别时返回None）"""
+        if self.intent_classifier is None:
+            return None
+        label, confidence = self.intent_classifier.predict(text)
+        try:
+            return IntentType(label), confidence
+        except ValueError:
+            return None
+
+    def _rule_based_entities(self, text: str, scan: Optional[NLUScanResult] = None) -> Dict[str, Any]:
+        """规则提取结构化实体（预编译正则 + 知识点名匹配，不调用LLM）"""
+        scan = scan or self.matcher.scan(text)
+        entities = dict(scan.entities)
+        if scan.skills:
+            entities[EntityKeys.SKILL] = scan.skills[0]
+        return entities
+
+    def extract_entities(self, text: str, rule_entities: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """实体提取（规则+语义理解）"""
-        entities = {}
-        
         # 规则提取结构化实体
-        for key, pattern in self.entity_patterns.items():
-            matches = re.findall(pattern, text)
-            if matches:
-                if key == EntityKeys.FEEDBACK_RATE:
-                    entities[key] = int(matches[0].replace("%", ""))  # 提取数字
-                else:
-                    entities[key] = matches[0]
+        entities = dict(rule_entities) if rule_entities is not None else self._rule_based_entities(text)
         
         # 语义提取非结构化实体（通过LLM）
         prompt = f"""
@@ -128,27 +214,91 @@ class AgentNLU:
         
         用户输入：{text}
         已提取的结构化信息：{entities}
-        输出格式：JSON对象，键为{[k for k in EntityKeys.__dict__ if not k.startswith('__')]}
+        输出格式：JSON对象，键为{[v for k, v in vars(EntityKeys).items() if not k.startswith('__')]}
         """
+        log_prompt_tokens("nlu_entity", prompt)
         try:
-            llm_entities = self.llm_client.generate_edu_response(prompt, temperature=0.1)
-            if isinstance(llm_entities, dict):
-                entities.update(llm_entities)
-        except:
+            llm_entities = generate_structured(self.llm_client, prompt, EntityLLMOutput, "nlu_entity", temperature=0.1)
+            # 规则提取的结构化实体优先，LLM只补充缺失项
+            entities.update({k: v for k, v in llm_entities.items() if v not in (None, "") and k not in entities})
+        except Exception:
             pass
         
         return entities
 
+    def understand(self, text: str) -> Tuple[IntentType, Dict[str, Any]]:
+        """单轮NLU：规则快速路径 → 本地分类器 → LLM，需要LLM时意图确认与实体提取并发执行
+        - 规则置信度达到阈值（或分类器置信度达到阈值）且必要实体齐全：不调用LLM
+        - 意图已确定但实体不全：只调用LLM补充实体
+        - 否则：意图确认与实体提取并发调用LLM（耗时约为两次往返中较慢的一次）
+        """
+        scan = self.matcher.scan(text)  # 每句只扫描一次
+        rule_entities = self._rule_based_entities(text, scan)
+        intent, confidence = self.rule_intent_confidence(text, rule_entities, scan.intent_hits)
+        source = "rule" if confidence >= self.rule_confidence_threshold else None
+        if source is None:
+            classified = self._classify_intent(text)
+            if classified is not None and classified[1] >= self.classifier_threshold:
+                (intent, confidence), source = classified, "classifier"
+
+        if source is not None:
+            entities_complete = self.check_entity_completeness(intent, rule_entities)[0]
+            self._record_route(source, llm_entities=not entities_complete)
+            if source == "rule":  # 分类器自身的预测不写入训练日志
+                self._log_utterance(text, intent, source, confidence)
+            return intent, rule_entities if entities_complete else self.extract_entities(text, rule_entities)
+
+        self._record_route("llm", llm_entities=True)
+        rule_intent = intent
+        dag = PipelineDAG("nlu", max_workers=2)
+        dag.add_stage("intent", lambda: self._llm_intent(text, rule_intent))
+        dag.add_stage("entities", lambda: self.extract_entities(text, rule_entities))
+        results = dag.run().results
+        if results["intent"] is None:
+            # LLM确认失败：沿用规则结果，且不作为LLM标注写入分类器训练日志
+            return rule_intent, results["entities"]
+        self._log_utterance(text, results["intent"], "llm")
+        return results["intent"], results["entities"]
+
+    def _record_route(self, intent_source: str, llm_entities: bool) -> None:
+        """intent_source: rule / classifier / llm"""
+        with self._routing_lock:
+            self.routing_stats["turns"] += 1
+            if intent_source == "rule" and not llm_entities:
+                self.routing_stats["rule_only"] += 1
+            self.routing_stats["classifier"] += int(intent_source == "classifier")
+            self.routing_stats["llm_intent"] += int(intent_source == "llm")
+            self.routing_stats["llm_entities"] += int(llm_entities)
+
+    def _log_utterance(self, text: str, intent: IntentType, source: str, confidence: Optional[float] = None) -> None:
+        """记录已确认意图的用户输入（未知意图不记录）"""
+        if self.utterance_logger is not None and intent != IntentType.UNKNOWN:
+            self.utterance_logger.log(text, intent.value, source, confidence)
+
+    def get_routing_stats(self) -> Dict[str, Any]:
+        """NLU路由统计：纯规则路由率 / 分类器路由率 / LLM意图确认率 / LLM实体补充率"""
+        with self._routing_lock:
+            stats = dict(self.routing_stats)
+        turns = stats["turns"] or 1
+        stats.update({
+            "rule_only_rate": round(stats["rule_only"] / turns, 4),
+            "classifier_rate": round(stats["classifier"] / turns, 4),
+            "llm_intent_rate": round(stats["llm_intent"] / turns, 4),
+            "llm_entities_rate": round(stats["llm_entities"] / turns, 4),
+        })
+        return stats
+
+    # 各意图的必要实体
+    _required_entities = {
+        IntentType.ASSESSMENT: [EntityKeys.STUDENT_ID, EntityKeys.SUBJECT],
+        IntentType.PLANNING: [EntityKeys.STUDENT_ID, EntityKeys.SUBJECT, EntityKeys.GOAL],
+        IntentType.GUIDANCE: [EntityKeys.STUDENT_ID, EntityKeys.SUBJECT, EntityKeys.QUESTION],
+        IntentType.COORDINATION: [EntityKeys.STUDENT_ID, EntityKeys.SUBJECT, EntityKeys.GOAL]
+    }
+
     def check_entity_completeness(self, intent: IntentType, entities: Dict[str, Any]) -> Tuple[bool, List[str]]:
         """检查实体完整性（根据意图判断必要信息）"""
-        required_entities = {
-            IntentType.ASSESSMENT: [EntityKeys.STUDENT_ID, EntityKeys.SUBJECT],
-            IntentType.PLANNING: [EntityKeys.STUDENT_ID, EntityKeys.SUBJECT, EntityKeys.GOAL],
-            IntentType.GUIDANCE: [EntityKeys.STUDENT_ID, EntityKeys.SUBJECT, EntityKeys.QUESTION],
-            IntentType.COORDINATION: [EntityKeys.STUDENT_ID, EntityKeys.SUBJECT, EntityKeys.GOAL]
-        }
-        
-        missing = [e for e in required_entities.get(intent, []) if e not in entities or not entities[e]]
+        missing = [e for e in self._required_entities.get(intent, []) if e not in entities or not entities[e]]
         return len(missing) == 0, missing
 
     def generate_prompt_for_missing(self, missing_entities: List[str]) -> str:
@@ -226,6 +376,23 @@ class AgentNLU:
         else:
             return {"error": "无法理解意图，请重新描述你的需求"}
 
+    def stream_guidance(self, entities: Dict[str, Any]) -> Dict[str, Any]:
+        """流式执行问题引导：实时打印LLM输出，返回最终结构化结果"""
+        result = {}
+        print("🤖 ", end="", flush=True)
+        for event in self.agent_manager.run_guidance_stream(
+            student_id=entities[EntityKeys.STUDENT_ID],
+            subject=entities[EntityKeys.SUBJECT],
+            question_desc=entities[EntityKeys.QUESTION],
+            inquiry_answers=entities.get("inquiry_answers")
+        ):
+            if event["event"] == "token":
+                print(event["data"], end="", flush=True)
+            elif event["event"] == "result":
+                result = event["data"]
+        print()
+        return result
+
     def run_interactive_loop(self) -> None:
         """启动持续交互循环"""
         print("🎓 教育智能助手（自然语言交互模式）")
@@ -236,15 +403,13 @@ class AgentNLU:
         while True:
             user_input = input("\n你：").strip()
             if user_input.lower() in ["退出", "exit"]:
+                print(f"（NLU路由统计：{self.get_routing_stats()}）")
                 print("👋 再见！")
                 break
             
-            # 1. 意图识别
-            intent = self.detect_intent(user_input)
+            # 1-2. 意图识别 + 实体提取（并发执行）
+            intent, current_entities = self.understand(user_input)
             print(f"（系统识别意图：{intent.value}）")
-            
-            # 2. 实体提取（结合上下文）
-            current_entities = self.extract_entities(user_input)
             context_entities.update(current_entities)  # 上下文融合
             
             # 3. 检查实体完整性
@@ -253,9 +418,12 @@ class AgentNLU:
                 print(f"🤖 {self.generate_prompt_for_missing(missing)}")
                 continue
             
-            # 4. 执行对应功能
+            # 4. 执行对应功能（问题引导走流式输出，边生成边显示）
             try:
-                result = self.process_intent(intent, context_entities)
+                if intent == IntentType.GUIDANCE:
+                    result = self.stream_guidance(context_entities)
+                else:
+                    result = self.process_intent(intent, context_entities)
                 print("\n" + format_result(result, f"{intent.value}结果"))
             except Exception as e:
                 print(f"❌ 操作失败：{str(e)}")
@@ -264,7 +432,48 @@ class AgentNLU:
             context_entities = {k: v for k, v in context_entities.items() 
                               if k in [EntityKeys.STUDENT_ID, EntityKeys.SUBJECT]}
 
+
+def benchmark_nlu_latency(turns: int = 20, latency_ms: float = 200) -> Dict[str, Any]:
+    """离线对比单轮NLU耗时：串行（意图→实体） vs 并发（understand，关闭规则快速路径） vs 规则快速路径
+    使用带固定延迟的Fake后端模拟LLM往返，无需网络
+    """
+    from src.llm_backends import FakeLLMBackend
+
+    nlu_agent = AgentNLU(model_type="fake", rule_confidence_threshold=1.01)  # 先强制走LLM，对比串行与并发
+    nlu_agent.llm_client = LLMClient(backend=FakeLLMBackend(seed=0, latency={"type": "constant", "ms": latency_ms}))
+    utterances = [
+        "帮我评估S92523的math水平",
+        "给S92523制定math学习计划，目标期末90分",
+        "S92523的math问题：为什么函数单调性要看导数？",
+        "S92523的math计划进度落后了，帮我协调一下",
+    ]
+
+    def timed(func) -> float:
+        start = time.perf_counter()
+        for i in range(turns):
+            func(utterances[i % len(utterances)])
+        return (time.perf_counter() - start) * 1000 / turns
+
+    sequential_ms = timed(lambda text: (nlu_agent.detect_intent(text), nlu_agent.extract_entities(text)))
+    concurrent_ms = timed(nlu_agent.understand)
+    nlu_agent.rule_confidence_threshold = 0.8
+    nlu_agent.routing_stats = {key: 0 for key in nlu_agent.routing_stats}
+    fast_path_ms = timed(nlu_agent.understand)
+    return {
+        "turns": turns,
+        "llm_latency_ms": latency_ms,
+        "sequential_avg_ms": round(sequential_ms, 1),
+        "concurrent_avg_ms": round(concurrent_ms, 1),
+        "speedup": round(sequential_ms / concurrent_ms, 2) if concurrent_ms else 0.0,
+        "fast_path_avg_ms": round(fast_path_ms, 1),
+        "routing": nlu_agent.get_routing_stats(),
+    }
+
 if __name__ == "__main__":
-    # 启动自然语言交互
-    nlu_agent = AgentNLU()
-    nlu_agent.run_interactive_loop()
\ No newline at end of file
+    if "--benchmark" in sys.argv:
+        # 离线NLU耗时对比：python agents/Agent_nlu.py --benchmark
+        print(json.dumps(benchmark_nlu_latency(), ensure_ascii=False, indent=2))
+    else:
+        # 启动自然语言交互
+        nlu_agent = AgentNLU()
+        nlu_agent.run_interactive_loop()
\ No newline at end of file
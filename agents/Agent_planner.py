@@ -14,21 +14,28 @@ sys.path.append(parent_path)
 from agents.Agent_dbmanager import DatabaseManagerAgent
 from src.Clinet_LLM import LLMClient
 from functions.academic_assessment_core import run_academic_assessment
+from functions.assessment_cache import AssessmentCache
 from functions.academic_planning_core import run_academic_planning
+from functions.plan_store import PlanStore
 
 class AcademicPlanningAgent:
     """学业规划智能体（调用核心函数实现功能）"""
-    def __init__(self, llm_client: LLMClient, db_agent: DatabaseManagerAgent):
+    def __init__(self, llm_client: LLMClient, db_agent: DatabaseManagerAgent,
+                 assessment_cache: Optional[AssessmentCache] = None, plan_store: Optional[PlanStore] = None):
         self.llm_client = llm_client
         self.db_agent = db_agent
+        self.assessment_cache = assessment_cache  # 可选：与其他Agent共享的评估结果缓存
+        self.plan_store = plan_store  # 可选：已保存规划（反馈作为增量作用于已保存规划）
     
     def run(self, student_id: str, subject: str, long_term_goal: str, execution_feedback: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """执行学业规划（集成评估+规划）"""
         # 1. 先调用评估智能体获取评估结果
-        assessment_result = run_academic_assessment(self.db_agent, self.llm_client, student_id, subject)
+        assessment_result = run_academic_assessment(self.db_agent, self.llm_client, student_id, subject,
+                                            assessment_cache=self.assessment_cache)
         
         # 2. 执行规划生成/优化
-        plan_result = run_academic_planning(assessment_result, long_term_goal, subject, self.db_agent, execution_feedback)
+        plan_result = run_academic_planning(assessment_result, long_term_goal, subject, self.db_agent, execution_feedback,
+                                            plan_store=self.plan_store)
         
         return plan_result
 
@@ -41,7 +48,7 @@ def main():
     llm_client = LLMClient(model_type="cloud", model_name=None)
     
     # 初始化规划Agent
-    planning_agent = AcademicPlanningAgent(llm_client=llm_client, db_agent=db_agent)
+    planning_agent = AcademicPlanningAgent(llm_client=llm_client, db_agent=db_agent, plan_store=PlanStore())
     
     # 1. 生成初始规划
     student_id = "S92523"
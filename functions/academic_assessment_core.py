@@ -1,5 +1,5 @@
 # academic_assessment_core.py
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import json
 import sys
 import os
@@ -11,13 +11,17 @@ sys.path.append(parent_path)
 
 from agents.Agent_dbmanager import DatabaseManagerAgent
 from src.Clinet_LLM import LLMClient
+from src.prompt_builder import PromptBuilder
+from src.basemodel import AssessmentLLMOutput, InvalidRequestError
+from utils.llm_json import generate_structured, LLMJSONError, LLMSchemaError
+from functions.assessment_cache import AssessmentCache, FALLBACK_FLAG, is_fallback_result
 
 # -------------------------- 数据获取函数 --------------------------
 def get_student_basic_data(db_agent: DatabaseManagerAgent, student_id: str) -> Dict[str, Any]:
     """从DatabaseManagerAgent获取学生基础信息"""
     basic_data = db_agent.query_student_basic(student_id)
     if "error" in basic_data:
-        raise ValueError(f"学生{student_id}不存在（DatabaseManagerAgent返回错误）")
+        raise InvalidRequestError(f"学生{student_id}不存在（DatabaseManagerAgent返回错误）")
     # 标准化字段格式
     return {
         "student_id": student_id,
@@ -85,49 +89,26 @@ def _mock_class_data(subject: str) -> Dict[str, int]:
     return class_map.get(subject.lower(), {})
 
 # -------------------------- Prompt生成函数 --------------------------
-def generate_assessment_prompt(basic_data: Dict[str, Any], dynamic_data: Dict[str, Any], subject: str) -> str:
-    """生成学业评估的LLM Prompt"""
-    mastery_threshold = 60
-    return f"""
-    ### 学生学业评估指令 ###
-    评估对象：{basic_data['grade']}学生（ID：{basic_data['student_id']}）
-    评估学科：{subject}
-    基础信息：{json.dumps(basic_data, ensure_ascii=False)}
-    多源动态数据：{json.dumps(dynamic_data, ensure_ascii=False)}
-    
-    ### 输出要求（必须返回JSON格式）###
-    {{
-        "knowledge_mastery": {{知识点: 掌握度(0-{mastery_threshold}为未掌握)}},
-        "ability_level": {{"comprehensive": 1-5, "understand": 1-5, "apply": 1-5}},
-        "learning_habits": {{"preference": "visual/auditory/text", "delay_rate": 0-1}},
-        "role_goals": {{"student": "目标", "parent": "目标", "teacher": "目标"}},
-        "diagnosis": "核心问题结论",
-        "error_points": ["未掌握知识点列表"],
-        "improvement_suggestions": {{
-            "knowledge": "知识点建议",
-            "resource": "资源使用建议"
-        }}
-    }}
-    """
+# 默认Prompt构建器（紧凑编码学生上下文，Token预算内生成）
+DEFAULT_ASSESSMENT_PROMPT_BUILDER = PromptBuilder(agent="assessment", token_budget=800, top_n_skills=10)
 
-# -------------------------- LLM调用函数 --------------------------
-import re  # 顶部导入正则模块
-from termcolor import colored
+def generate_assessment_prompt(basic_data: Dict[str, Any], dynamic_data: Dict[str, Any], subject: str,
+                               prompt_builder: Optional[PromptBuilder] = None) -> str:
+    """生成学业评估的LLM Prompt（去重技能+Top-N+短键名，按Token预算压缩）"""
+    builder = prompt_builder or DEFAULT_ASSESSMENT_PROMPT_BUILDER
+    return builder.build_assessment_prompt(basic_data, dynamic_data, subject)
 
+# -------------------------- LLM调用函数 --------------------------
 def call_llm_for_assessment(llm_client: LLMClient, prompt: str, temperature: float = 0.2) -> Dict[str, Any]:
-    """调用LLM生成评估结果（适配LLMClient的参数）"""
+    """调用LLM生成评估结果（JSON模式+模型校验，仅在结果不符合AssessmentLLMOutput时重试）"""
     try:
-        llm_result_str = llm_client.generate_edu_response(prompt, temperature=temperature)
-        # 清理JSON包裹符（```json ... ```）
-        cleaned_result = re.sub(r'```json|\n|```', '', llm_result_str).strip()
-        
-        return json.loads(cleaned_result)  # 解析清理后的JSON
-    except json.JSONDecodeError as e:
-        print(f"LLM返回的结果不是合法JSON：{e}\n原始结果：{llm_result_str}")
-        return get_default_assessment_result(subject="math")
+        return generate_structured(llm_client, prompt, AssessmentLLMOutput, "assessment", temperature=temperature)
+    except (LLMJSONError, LLMSchemaError) as e:
+        print(f"LLM返回的结果不符合评估格式：{e}")
     except Exception as e:
         print(f"LLM调用失败，使用默认结果：{str(e)}")
-        return get_default_assessment_result(subject="math")
+    # 默认结果带FALLBACK_FLAG标记（不写入评估缓存，批量任务计为失败），学科在整合结果时替换为实际学科
+    return {**get_default_assessment_result(subject="math"), FALLBACK_FLAG: True}
 
 
 def get_default_assessment_result(subject: str) -> Dict[str, Any]:
@@ -151,8 +132,10 @@ def get_default_assessment_result(subject: str) -> Dict[str, Any]:
 
 # -------------------------- 结果整合函数 --------------------------
 def integrate_assessment_result(llm_result: Dict[str, Any], student_id: str, subject: str, dynamic_data: Dict[str, Any]) -> Dict[str, Any]:
-    """整合评估结果为统一字典格式"""
-    return {
+    """整合评估结果为统一字典格式（LLM失败时的默认结果保留FALLBACK_FLAG标记）"""
+    if is_fallback_result(llm_result):
+        llm_result = {**get_default_assessment_result(subject), FALLBACK_FLAG: True}
+    result = {
         "student_id": student_id,
         "subject": subject,
         "knowledge_mastery": llm_result.get("knowledge_mastery", {}),
@@ -164,18 +147,34 @@ def integrate_assessment_result(llm_result: Dict[str, Any], student_id: str, sub
         "error_points": llm_result.get("error_points", []),
         "improvement_suggestions": llm_result.get("improvement_suggestions", {})
     }
+    if is_fallback_result(llm_result):
+        result[FALLBACK_FLAG] = True
+    return result
 
 # -------------------------- 主流程函数 --------------------------
-def run_academic_assessment(db_agent: DatabaseManagerAgent, llm_client: LLMClient, student_id: str, subject: str) -> Dict[str, Any]:
-    """学业评估主流程（串联所有函数）"""
+def run_academic_assessment(db_agent: DatabaseManagerAgent, llm_client: LLMClient, student_id: str, subject: str,
+                            prompt_builder: Optional[PromptBuilder] = None, batcher: Optional[Any] = None,
+                            assessment_cache: Optional[AssessmentCache] = None) -> Dict[str, Any]:
+    """学业评估主流程（串联所有函数）
+    batcher: 可选的AssessmentMicroBatcher，传入时LLM调用与其他学生的评估请求合并发送
+    assessment_cache: 可选的AssessmentCache，学生数据未变化时直接复用已有评估结果
+    """
+    if assessment_cache is not None:
+        return assessment_cache.get_or_compute(
+            student_id, subject, db_agent.get_data_version(student_id),
+            lambda: run_academic_assessment(db_agent, llm_client, student_id, subject, prompt_builder, batcher)
+        )
     # 1. 获取基础数据
     basic_data = get_student_basic_data(db_agent, student_id)
     # 2. 获取动态数据
     dynamic_data = get_student_dynamic_data(db_agent, student_id, subject)
     # 3. 生成Prompt
-    prompt = generate_assessment_prompt(basic_data, dynamic_data, subject)
+    prompt = generate_assessment_prompt(basic_data, dynamic_data, subject, prompt_builder)
     # 4. 调用LLM（修正：传temperature而非subject）
-    llm_result = call_llm_for_assessment(llm_client, prompt, temperature=0.2)  # 评估场景用低温度
+    if batcher is not None:
+        llm_result = batcher.assess(student_id, prompt)
+    else:
+        llm_result = call_llm_for_assessment(llm_client, prompt, temperature=0.2)  # 评估场景用低温度
     # 5. 整合结果
     assessment_result = integrate_assessment_result(llm_result, student_id, subject, dynamic_data)
     
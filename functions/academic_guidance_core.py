@@ -1,5 +1,5 @@
 # academic_guidance_core.py
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterator, Callable
 
 import sys
 import os
@@ -11,6 +11,8 @@ parent_path = os.path.dirname(os.path.dirname(current_path))
 sys.path.append(parent_path)
 
 from agents.Agent_dbmanager import DatabaseManagerAgent
+from src.prompt_builder import log_prompt_tokens
+from functions.pipeline_dag import PipelineDAG
 
 # -------------------------- 学生水平适配函数 --------------------------
 def get_student_adapted_context(assessment: Dict[str, Any], question_desc: str) -> str:
@@ -28,10 +30,9 @@ def get_student_adapted_context(assessment: Dict[str, Any], question_desc: str)
     """
 
 # -------------------------- 交互式追问函数 --------------------------
-def generate_inquiry_questions(llm_client: Any, question_desc: str, assessment: Dict[str, Any]) -> List[str]:
-    """生成场景化追问（聚焦根源+场景关联）"""
+def build_inquiry_prompt(question_desc: str, assessment: Dict[str, Any]) -> str:
+    """生成追问Prompt（同步/流式调用共用）"""
     adapted_context = get_student_adapted_context(assessment, question_desc)
-    
     prompt = f"""
     {adapted_context}
     Task: Generate 3 interactive inquiry questions to clarify the root cause of the student's confusion.
@@ -42,23 +43,35 @@ def generate_inquiry_questions(llm_client: Any, question_desc: str, assessment:
     
     Output format: List of 3 questions (only the questions, no extra text).
     """
+    log_prompt_tokens("guidance_inquiry", prompt)
+    return prompt
+
+def parse_inquiry_questions(llm_result: Any) -> List[str]:
+    """解析LLM返回的追问列表（兼容JSON或纯文本）"""
+    if isinstance(llm_result, str):
+        # 处理纯文本列表（如"- 问题1\n- 问题2"）
+        lines = [line.strip("- ").strip() for line in llm_result.split("\n") if line.strip()]
+        return [line for line in lines if line and "?" in line][:3]
+    return llm_result[:3]
+
+def default_inquiry_questions(assessment: Dict[str, Any]) -> List[str]:
+    """默认追问（场景化，LLM不可用时兜底）"""
+    weak_point = assessment.get("error_points", ["函数单调性"])[0]
+    return [
+        f"你能举一个生活中用到{weak_point}的例子吗？",
+        f"你觉得这个问题和你之前做过的{weak_point}题目有什么不同？",
+        f"你在哪个具体步骤卡住了（比如审题/公式应用/计算）？"
+    ]
+
+def generate_inquiry_questions(llm_client: Any, question_desc: str, assessment: Dict[str, Any]) -> List[str]:
+    """生成场景化追问（聚焦根源+场景关联）"""
+    prompt = build_inquiry_prompt(question_desc, assessment)
     
     try:
-        llm_result = llm_client.generate_edu_response(prompt, temperature=0.4)
-        # 解析LLM返回的列表（兼容JSON或纯文本）
-        if isinstance(llm_result, str):
-            # 处理纯文本列表（如"- 问题1\n- 问题2"）
-            lines = [line.strip("- ").strip() for line in llm_result.split("\n") if line.strip()]
-            return [line for line in lines if line and "?" in line][:3]
-        return llm_result[:3]
+        llm_result = llm_client.generate_edu_response(prompt, temperature=0.4, call_site="guidance_inquiry")
+        return parse_inquiry_questions(llm_result)
     except Exception as e:
-        # 默认追问（场景化）
-        weak_point = assessment.get("error_points", ["函数单调性"])[0]
-        return [
-            f"你能举一个生活中用到{weak_point}的例子吗？",
-            f"你觉得这个问题和你之前做过的{weak_point}题目有什么不同？",
-            f"你在哪个具体步骤卡住了（比如审题/公式应用/计算）？"
-        ]
+        return default_inquiry_questions(assessment)
 
 # -------------------------- 场景化问题拆解函数 --------------------------
 def scenario_based_problem_decomposition(question_desc: str, subject: str) -> List[str]:
@@ -83,11 +96,9 @@ def scenario_based_problem_decomposition(question_desc: str, subject: str) -> Li
     ]
 
 # -------------------------- 迁移化解决方案函数 --------------------------
-def generate_transferable_solution(llm_client: Any, question_desc: str, inquiry_answers: List[str], assessment: Dict[str, Any]) -> List[str]:
-    """生成迁移化解决方案（当前问题→同类场景）"""
+def build_transfer_prompt(question_desc: str, inquiry_answers: List[str], assessment: Dict[str, Any], scenario_decomp: List[str]) -> str:
+    """生成迁移化方案Prompt（同步/流式调用共用）"""
     adapted_context = get_student_adapted_context(assessment, question_desc)
-    scenario_decomp = scenario_based_problem_decomposition(question_desc, assessment.get("subject", "math"))
-    
     prompt = f"""
     {adapted_context}
     Student's answers to inquiries: {inquiry_answers}
@@ -101,20 +112,35 @@ def generate_transferable_solution(llm_client: Any, question_desc: str, inquiry_
     
     Output format: List of guidance steps + transfer tips.
     """
+    log_prompt_tokens("guidance_transfer", prompt)
+    return prompt
+
+def default_transferable_solution(assessment: Dict[str, Any], scenario_decomp: List[str]) -> List[str]:
+    """默认迁移化方案（LLM不可用时兜底）"""
+    weak_point = assessment.get("error_points", ["函数单调性"])[0]
+    return [
+        f"1. 先回忆{weak_point}的核心判定方法（如导数符号法）",
+        f"2. 标记题目中的关键条件（如定义域/参数范围）",
+        f"3. 尝试用{scenario_decomp[0].split('：')[1]}的场景类比解题",
+        f"\n迁移应用：",
+        f"- 场景1：分析{scenario_decomp[1].split('：')[1]}时，可用同样的判定方法",
+        f"- 场景2：解决{weak_point}的实际问题时，重点关注变量变化规律"
+    ]
+
+def generate_transferable_solution(llm_client: Any, question_desc: str, inquiry_answers: List[str], assessment: Dict[str, Any],
+                                   scenario_decomp: Optional[List[str]] = None) -> List[str]:
+    """生成迁移化解决方案（当前问题→同类场景）
+    scenario_decomp: 已有的场景化拆解（如引导会话中保存的第一轮结果），不传时重新计算
+    """
+    if scenario_decomp is None:
+        scenario_decomp = scenario_based_problem_decomposition(question_desc, assessment.get("subject", "math"))
+    prompt = build_transfer_prompt(question_desc, inquiry_answers, assessment, scenario_decomp)
     
     try:
-        llm_result = llm_client.generate_edu_response(prompt, temperature=0.3)
+        llm_result = llm_client.generate_edu_response(prompt, temperature=0.3, call_site="guidance_transfer")
         return llm_result if isinstance(llm_result, list) else llm_result.split("\n")
     except Exception as e:
-        weak_point = assessment.get("error_points", ["函数单调性"])[0]
-        return [
-            f"1. 先回忆{weak_point}的核心判定方法（如导数符号法）",
-            f"2. 标记题目中的关键条件（如定义域/参数范围）",
-            f"3. 尝试用{scenario_decomp[0].split('：')[1]}的场景类比解题",
-            f"\n迁移应用：",
-            f"- 场景1：分析{scenario_decomp[1].split('：')[1]}时，可用同样的判定方法",
-            f"- 场景2：解决{weak_point}的实际问题时，重点关注变量变化规律"
-        ]
+        return default_transferable_solution(assessment, scenario_decomp)
 
 # -------------------------- 学习资源匹配函数 --------------------------
 def match_scenario_based_resources(db_agent: DatabaseManagerAgent, question_desc: str, subject: str) -> List[Dict[str, Any]]:
@@ -151,37 +177,139 @@ def match_scenario_based_resources(db_agent: DatabaseManagerAgent, question_desc
     return matched_resources
 
 # -------------------------- 主流程函数 --------------------------
-def run_academic_guidance(
+def build_guidance_dag(
     llm_client: Any,
     db_agent: DatabaseManagerAgent,
-    assessment_result: Dict[str, Any],
     question_desc: str,
-    inquiry_answers: Optional[List[str]] = None
-) -> Dict[str, Any]:
-    """学业引导主流程（交互式+场景化+迁移化）"""
-    # 在 run_academic_guidance 函数中，当无答案时（第一轮追问）
+    subject: str,
+    assessment_fn: Callable[[], Dict[str, Any]],
+    inquiry_answers: Optional[List[str]] = None,
+    scenario_decomp: Optional[List[str]] = None,
+    practice_resources: Optional[List[Dict[str, Any]]] = None,
+    include_llm_stage: bool = True,
+    dag_name: str = "guidance"
+) -> PipelineDAG:
+    """构建引导流程DAG
+    评估（assessment_fn）、场景化拆解、练习资源匹配互不依赖，并发执行；
+    第一轮追问只依赖评估，第二轮迁移化方案依赖评估与场景化拆解。
+    已有的scenario_decomp/practice_resources（如会话中保存的结果）直接复用，不再计算。
+    include_llm_stage=False时只做准备阶段（流式输出场景由调用方自行流式调用LLM）。
+    """
+    dag = PipelineDAG(dag_name)
+    dag.add_stage("assessment", assessment_fn)
+    dag.add_stage("scenario_decomp", lambda: scenario_decomp if scenario_decomp is not None
+                  else scenario_based_problem_decomposition(question_desc, subject))
+    dag.add_stage("practice_resources", lambda: practice_resources if practice_resources is not None
+                  else match_scenario_based_resources(db_agent, question_desc, subject))
+    if not include_llm_stage:
+        return dag
+    if not inquiry_answers:
+        dag.add_stage("inquiry_questions",
+                      lambda assessment: generate_inquiry_questions(llm_client, question_desc, assessment),
+                      deps=["assessment"])
+    else:
+        dag.add_stage("guide_content",
+                      lambda assessment, scenario_decomp: generate_transferable_solution(
+                          llm_client, question_desc, inquiry_answers, assessment, scenario_decomp),
+                      deps=["assessment", "scenario_decomp"])
+    return dag
+
+def assemble_guidance_result(results: Dict[str, Any], inquiry_answers: Optional[List[str]] = None) -> Dict[str, Any]:
+    """由DAG各阶段结果组装引导输出"""
+    # 当无答案时（第一轮追问），练习资源只预取不返回
     if not inquiry_answers:
-        inquiry_questions = generate_inquiry_questions(llm_client, question_desc, assessment_result)
         return {
             "interactive_step": "inquiry",
-            "inquiry_questions": inquiry_questions,
+            "inquiry_questions": results["inquiry_questions"],
             # 关键修改：将 scenario_decomposition 改为 step_by_step_guide
-            "step_by_step_guide": scenario_based_problem_decomposition(question_desc, assessment_result.get("subject", "math")),
+            "step_by_step_guide": results["scenario_decomp"],
             "guide_content": [],
             "practice_resources": []
         }
 
     # 当有答案时（第二轮引导）
+    return {
+        "interactive_step": "solution",
+        "inquiry_questions": [],
+        # 关键修改：将 scenario_decomposition 改为 step_by_step_guide
+        "step_by_step_guide": results["scenario_decomp"],
+        "guide_content": results["guide_content"],
+        "practice_resources": results["practice_resources"],
+        "transfer_tips": "记住：同类场景的解题方法可迁移，重点关注核心规律！"
+    }
+
+def run_academic_guidance(
+    llm_client: Any,
+    db_agent: DatabaseManagerAgent,
+    assessment_result: Dict[str, Any],
+    question_desc: str,
+    inquiry_answers: Optional[List[str]] = None,
+    scenario_decomp: Optional[List[str]] = None,
+    practice_resources: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """学业引导主流程（交互式+场景化+迁移化）
+    scenario_decomp/practice_resources: 已有的场景化拆解与练习资源（多轮会话复用第一轮结果），不传时重新计算
+    """
+    dag = build_guidance_dag(
+        llm_client, db_agent, question_desc, assessment_result.get("subject", "math"),
+        assessment_fn=lambda: assessment_result,
+        inquiry_answers=inquiry_answers,
+        scenario_decomp=scenario_decomp,
+        practice_resources=practice_resources
+    )
+    return assemble_guidance_result(dag.run().results, inquiry_answers)
+
+# -------------------------- 流式主流程函数 --------------------------
+def run_academic_guidance_stream(
+    llm_client: Any,
+    db_agent: DatabaseManagerAgent,
+    assessment_result: Dict[str, Any],
+    question_desc: str,
+    inquiry_answers: Optional[List[str]] = None,
+    scenario_decomp: Optional[List[str]] = None,
+    practice_resources: Optional[List[Dict[str, Any]]] = None
+) -> Iterator[Dict[str, Any]]:
+    """学业引导流式主流程（逐段推送LLM输出，最后推送完整结果）
+    Yields:
+        {"event": "token", "data": 文本片段} 若干条，最后一条为 {"event": "result", "data": 与run_academic_guidance一致的结果字典}
+    """
+    subject = assessment_result.get("subject", "math")
+    if scenario_decomp is None:
+        scenario_decomp = scenario_based_problem_decomposition(question_desc, subject)
+
+    if not inquiry_answers:
+        prompt = build_inquiry_prompt(question_desc, assessment_result)
     else:
-        guide_content = generate_transferable_solution(llm_client, question_desc, inquiry_answers, assessment_result)
-        practice_resources = match_scenario_based_resources(db_agent, question_desc, assessment_result.get("subject", "math"))
-        
-        return {
+        prompt = build_transfer_prompt(question_desc, inquiry_answers, assessment_result, scenario_decomp)
+
+    chunks = []
+    try:
+        temperature, call_site = (0.4, "guidance_inquiry_stream") if not inquiry_answers else (0.3, "guidance_transfer_stream")
+        for chunk in llm_client.stream_edu_response(prompt, temperature=temperature, call_site=call_site):
+            chunks.append(chunk)
+            yield {"event": "token", "data": chunk}
+        llm_text = "".join(chunks)
+    except Exception as e:
+        llm_text = None
+
+    if not inquiry_answers:
+        inquiry_questions = parse_inquiry_questions(llm_text) if llm_text is not None else default_inquiry_questions(assessment_result)
+        yield {"event": "result", "data": {
+            "interactive_step": "inquiry",
+            "inquiry_questions": inquiry_questions,
+            "step_by_step_guide": scenario_decomp,
+            "guide_content": [],
+            "practice_resources": []
+        }}
+    else:
+        guide_content = llm_text.split("\n") if llm_text is not None else default_transferable_solution(assessment_result, scenario_decomp)
+        if practice_resources is None:
+            practice_resources = match_scenario_based_resources(db_agent, question_desc, subject)
+        yield {"event": "result", "data": {
             "interactive_step": "solution",
             "inquiry_questions": [],
-            # 关键修改：将 scenario_decomposition 改为 step_by_step_guide
-            "step_by_step_guide": scenario_based_problem_decomposition(question_desc, assessment_result.get("subject", "math")),
+            "step_by_step_guide": scenario_decomp,
             "guide_content": guide_content,
             "practice_resources": practice_resources,
             "transfer_tips": "记住：同类场景的解题方法可迁移，重点关注核心规律！"
-        }
\ No newline at end of file
+        }}
@@ -12,6 +12,9 @@ parent_path = os.path.dirname(os.path.dirname(current_path))
 sys.path.append(parent_path)
 
 from agents.Agent_dbmanager import DatabaseManagerAgent
+from functions.plan_store import PlanStore, PlanRecord, plan_fingerprint
+from functions.assessment_cache import is_fallback_result
+from functions.indexed_plan import IndexedPlan
 
 # -------------------------- 日期工具函数 --------------------------
 def get_deadline(month: int) -> str:
@@ -103,24 +106,29 @@ def generate_initial_plan(assessment: Dict[str, Any], long_term_goal: str, subje
 
 # -------------------------- 反馈调整函数 --------------------------
 def extend_task_cycle(plan: Dict[str, Any], task_id: str) -> Dict[str, Any]:
-    """延长任务周期（适配字典格式规划）"""
-    for idx, week_task in enumerate(plan["weekly_tasks"]):
-        for task in week_task["tasks"]:
-            if task["task_id"] == task_id:
-                # 在下一周插入延长任务
-                new_task = {**task, "task_id": f"{task_id}_extend", "completion_rate": 0}
-                if idx + 1 < len(plan["weekly_tasks"]):
-                    plan["weekly_tasks"][idx + 1]["tasks"].insert(0, new_task)
-                else:
-                    plan["weekly_tasks"].append({"week": "延长周", "tasks": [new_task]})
-                # 顺延月度截止日期
-                for month_plan in plan["monthly_plans"]:
-                    month_plan["deadline"] = postpone_date(month_plan["deadline"], 1)
-                return plan
+    """延长任务周期（适配字典格式规划，也可传入IndexedPlan；按索引定位任务，写时复制的IndexedPlan只修改新版本）"""
+    indexed = IndexedPlan.of(plan)
+    found = indexed.find(task_id)
+    if found is None:
+        return plan
+    idx, task = found
+    # 在下一周插入延长任务
+    new_task = {**task, "task_id": f"{task_id}_extend", "completion_rate": 0}
+    if idx + 1 < len(indexed.weeks):
+        indexed.insert_task(idx + 1, new_task, position=0)
+    else:
+        indexed.append_week({"week": "延长周", "tasks": [new_task]})
+    # 顺延月度截止日期
+    _postpone_monthly_deadlines(indexed, 1)
     return plan
 
+def _postpone_monthly_deadlines(indexed: IndexedPlan, weeks: int) -> None:
+    for i in range(len(indexed["monthly_plans"])):
+        month_plan = indexed.edit_monthly_plan(i)
+        month_plan["deadline"] = postpone_date(month_plan["deadline"], weeks)
+
 def advance_task_level(plan: Dict[str, Any], task_id: str, assessment: Dict[str, Any], db_agent: DatabaseManagerAgent) -> Dict[str, Any]:
-    """提前进阶（适配字典格式）"""
+    """提前进阶（适配字典格式规划，也可传入IndexedPlan；写时复制的IndexedPlan只修改新版本）"""
     knowledge_point = assessment["error_points"][0] if assessment["error_points"] else "基础知识点"
     preference = assessment["learning_habits"].get("preference", "text")
     ability_level = assessment["ability_level"].get("comprehensive", 2) + 2  # 提升2级难度
@@ -132,30 +140,121 @@ def advance_task_level(plan: Dict[str, Any], task_id: str, assessment: Dict[str,
         format=preference
     ) or {"resource_id": "default_r3", "completion_standard": "完成高阶拓展题"}
 
-    # 更新任务
-    for week_task in plan["weekly_tasks"]:
-        for task in week_task["tasks"]:
-            if task["task_id"] == task_id or task["task_id"].startswith(f"t_adv_{knowledge_point}"):
-                task["content"] = task["content"].replace(task["content"].split("（")[0], f"学习{knowledge_point}高阶知识点")
-                task["content"] = task["content"].replace(task["content"].split("：")[-1], f"资源ID：{advanced_resource['resource_id']}）")
-                task["completion_standard"] = advanced_resource["completion_standard"]
-                task["duration_hour"] = 5
+    # 更新任务（只遍历任务ID索引，不再逐周逐任务扫描）
+    indexed = IndexedPlan.of(plan)
+    prefix = f"t_adv_{knowledge_point}"
+    target_ids = [tid for tid in indexed.task_ids() if tid == task_id or tid.startswith(prefix)]
+    for tid in target_ids:
+        for task in indexed.edit_tasks(tid):
+            task["content"] = task["content"].replace(task["content"].split("（")[0], f"学习{knowledge_point}高阶知识点")
+            task["content"] = task["content"].replace(task["content"].split("：")[-1], f"资源ID：{advanced_resource['resource_id']}）")
+            task["completion_standard"] = advanced_resource["completion_standard"]
+            task["duration_hour"] = 5
     return plan
 
+def reschedule_plan(plan: Dict[str, Any], weeks: int) -> Dict[str, Any]:
+    """整体调整进度：月度截止日期顺延（weeks为负时提前）N周，不增删任务"""
+    _postpone_monthly_deadlines(IndexedPlan.of(plan), weeks)
+    return plan
+
+def classify_feedback(feedback: Dict[str, Any]) -> str:
+    """反馈对应的调整动作：reschedule（携带postpone_weeks，只调整截止日期）/ extend（延长周期并顺延截止日期）/
+    advance（提前进阶）/ keep（保持不变）"""
+    if feedback.get("postpone_weeks"):
+        return "reschedule"
+    completion_rate = feedback.get("completion_rate", 100)
+    if completion_rate < 70:
+        return "extend"
+    if completion_rate > 90:
+        return "advance"
+    return "keep"
+
 def adjust_plan_by_feedback(plan: Dict[str, Any], feedback: Dict[str, Any], assessment: Dict[str, Any], db_agent: DatabaseManagerAgent) -> Dict[str, Any]:
     """反馈驱动调整（核心逻辑）"""
-    completion_rate = feedback.get("completion_rate", 100)
+    action = classify_feedback(feedback)
     task_id = feedback.get("task_id", "")
     
-    if completion_rate < 70:
+    if action == "extend":
         plan = extend_task_cycle(plan, task_id)
-    elif completion_rate > 90:
+    elif action == "advance":
         plan = advance_task_level(plan, task_id, assessment, db_agent)
+    elif action == "reschedule":
+        plan = reschedule_plan(plan, int(feedback["postpone_weeks"]))
     return plan
 
+# -------------------------- 已保存规划的增量更新 --------------------------
+def _applied_feedback_ids(history: List[Dict[str, Any]]) -> set:
+    """当前规划（最近一次生成/重新生成之后）已应用过的反馈标识"""
+    applied = set()
+    for entry in reversed(history):
+        if entry.get("action") in ("generated", "regenerated"):
+            break
+        if entry.get("feedback_id"):
+            applied.add(entry["feedback_id"])
+    return applied
+
+def _history_entry(action: str, version: int, feedback: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    entry = {"version": version, "action": action, "applied_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    if feedback:
+        entry.update({
+            "task_id": feedback.get("task_id", ""),
+            "completion_rate": feedback.get("completion_rate", 100),
+            "feedback_note": feedback.get("feedback_note", "")
+        })
+        if feedback.get("postpone_weeks"):
+            entry["postpone_weeks"] = feedback["postpone_weeks"]
+        if feedback.get("feedback_id"):
+            entry["feedback_id"] = str(feedback["feedback_id"])
+    return entry
+
+def _plan_output(record: PlanRecord) -> Dict[str, Any]:
+    """已保存规划 → 返回给调用方的规划（附带版本号与调整历史）"""
+    return {**record.plan, "plan_version": record.version, "adjustment_history": record.history}
+
+def run_stored_planning(assessment_result: Dict[str, Any], long_term_goal: str, subject: str, db_agent: DatabaseManagerAgent,
+                        plan_store: PlanStore, execution_feedback: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """基于已保存规划的增量更新
+    - 无已保存规划，或评估结果中决定规划的字段变化：整体（重新）生成，此前的反馈调整作废
+      （评估为LLM失败时的默认结果时不视为评估变化，沿用已保存规划）
+    - 否则在已保存规划上只应用本次反馈（延长/进阶/调整截止日期），无反馈或携带的feedback_id已应用过时直接返回已保存规划
+      （未携带feedback_id的反馈每次都应用：同一学生下周如实再次提交相同内容的反馈是新的反馈）
+    """
+    student_id = str(assessment_result.get("student_id", ""))
+    fingerprint = plan_fingerprint(assessment_result)
+
+    def updater(record: Optional[PlanRecord]):
+        assessment_changed = record is not None and record.assessment_fingerprint != fingerprint \
+            and not is_fallback_result(assessment_result)
+        if record is None or assessment_changed:
+            stat = "generated" if record is None else "regenerated"
+            version = record.version + 1 if record is not None else 1
+            history = (record.history if record is not None else []) + [_history_entry(stat, version)]
+            record = PlanRecord(student_id=student_id, subject=subject, long_term_goal=long_term_goal,
+                                plan=generate_initial_plan(assessment_result, long_term_goal, subject, db_agent),
+                                assessment_fingerprint=fingerprint, version=version, history=history)
+        elif not execution_feedback or (execution_feedback.get("feedback_id")
+                                        and str(execution_feedback["feedback_id"]) in _applied_feedback_ids(record.history)):
+            return record, None
+        else:
+            stat = "adjusted"
+        if execution_feedback:
+            action = classify_feedback(execution_feedback)
+            if action != "keep":
+                record.plan = adjust_plan_by_feedback(record.plan, execution_feedback, assessment_result, db_agent)
+                record.version += 1
+            record.history.append(_history_entry(action, record.version, execution_feedback))
+        return record, stat
+
+    record = plan_store.update(student_id, subject, long_term_goal, updater)
+    return _plan_output(record)
+
 # -------------------------- 主流程函数 --------------------------
-def run_academic_planning(assessment_result: Dict[str, Any], long_term_goal: str, subject: str, db_agent: DatabaseManagerAgent, execution_feedback: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-    """学业规划主流程"""
+def run_academic_planning(assessment_result: Dict[str, Any], long_term_goal: str, subject: str, db_agent: DatabaseManagerAgent, execution_feedback: Optional[Dict[str, Any]] = None,
+                          plan_store: Optional[PlanStore] = None) -> Dict[str, Any]:
+    """学业规划主流程（传入plan_store时保存规划，反馈作为增量作用于已保存规划）"""
+    if plan_store is not None:
+        return run_stored_planning(assessment_result, long_term_goal, subject, db_agent, plan_store, execution_feedback)
+
     # 生成初始规划
     initial_plan = generate_initial_plan(assessment_result, long_term_goal, subject, db_agent)
     
@@ -165,4 +264,68 @@ def run_academic_planning(assessment_result: Dict[str, Any], long_term_goal: str
     else:
         optimized_plan = initial_plan
     
-    return optimized_plan
\ No newline at end of file
+    return optimized_plan
+
+# -------------------------- 功能测试 --------------------------
+def _test_planning_inputs():
+    from functions.academic_assessment_core import get_default_assessment_result, integrate_assessment_result
+    db_agent = DatabaseManagerAgent(data_path="x.csv")  # 数据集不存在时使用模拟数据（学生S1-S3）
+    assessment = integrate_assessment_result(get_default_assessment_result("math"), "S1", "math", {})
+    return db_agent, assessment
+
+
+def test_stored_planning_feedback_idempotent():
+    """同一feedback_id的反馈重复提交只应用一次（内存与目录持久化两种模式，持久化时新的存储实例读到同样的结果）；
+    未携带feedback_id的相同内容反馈每次都应用"""
+    import tempfile
+    db_agent, assessment = _test_planning_inputs()
+    goal = "期末数学成绩提升至90分以上"
+    with tempfile.TemporaryDirectory() as persist_dir:
+        for persist_path in (None, persist_dir):
+            store = PlanStore(persist_path=persist_path)
+            plan = run_stored_planning(assessment, goal, "math", db_agent, store)
+            task_id = plan["weekly_tasks"][0]["tasks"][0]["task_id"]
+            feedback = {"task_id": task_id, "completion_rate": 40, "feedback_note": "基础知识点理解不透彻",
+                        "feedback_id": "week-1"}
+            for _ in range(3):
+                plan = run_stored_planning(assessment, goal, "math", db_agent, store, dict(feedback))
+            assert plan["plan_version"] == 2
+            assert [entry["action"] for entry in plan["adjustment_history"]] == ["generated", "extend"]
+
+            if persist_path is not None:
+                store = PlanStore(persist_path=persist_path)
+                plan = run_stored_planning(assessment, goal, "math", db_agent, store, dict(feedback))
+                assert plan["plan_version"] == 2 and len(plan["adjustment_history"]) == 2
+
+            plan = run_stored_planning(assessment, goal, "math", db_agent, store, {**feedback, "feedback_id": "week-2"})
+            assert plan["plan_version"] == 3
+            repeated = {key: value for key, value in feedback.items() if key != "feedback_id"}
+            for version in (4, 5):
+                plan = run_stored_planning(assessment, goal, "math", db_agent, store, dict(repeated))
+                assert plan["plan_version"] == version
+    print("✅ 规划存储：同一feedback_id只应用一次，未携带feedback_id的重复反馈每次都应用")
+
+
+def test_feedback_edits_copy_on_write():
+    """延长/进阶/顺延作用于写时复制的IndexedPlan时只修改新版本，原规划保持不变"""
+    import copy
+    db_agent, assessment = _test_planning_inputs()
+    plan = generate_initial_plan(assessment, "期末数学成绩提升至90分以上", "math", db_agent)
+    task_id = plan["weekly_tasks"][0]["tasks"][0]["task_id"]
+    before = copy.deepcopy(plan)
+
+    evolved = IndexedPlan.evolve(plan)
+    extend_task_cycle(evolved, task_id)
+    advance_task_level(evolved, task_id, assessment, db_agent)
+    reschedule_plan(evolved, 2)
+    assert plan == before
+    new_plan = evolved.to_dict()
+    assert new_plan["weekly_tasks"][1]["tasks"][0]["task_id"] == f"{task_id}_extend"
+    assert new_plan["weekly_tasks"][0]["tasks"][0]["duration_hour"] == 5
+    assert new_plan["monthly_plans"][0]["deadline"] == postpone_date(before["monthly_plans"][0]["deadline"], 3)
+    print("✅ 反馈调整：写时复制版本上的修改不影响原规划")
+
+
+if __name__ == "__main__":
+    test_stored_planning_feedback_idempotent()
+    test_feedback_edits_copy_on_write()
@@ -0,0 +1,244 @@
+# assessment_batcher.py
+"""评估LLM调用的微批处理队列
+设计意图：按班级批量评估时，每个学生一次LLM往返的固定开销（连接、前言、排队）占比很高。
+这里把 max_wait_ms 时间窗内（最多 max_batch_size 个）的评估请求合并成一次结构化调用，
+按学生拆分结果回填给各自的调用方；批量结果解析失败的学生自动回退为单独调用。
+"""
+from typing import Dict, Any, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+import json
+import queue
+import threading
+import time
+import sys
+import os
+
+# 添加项目路径
+current_path = os.path.abspath(__file__)
+parent_path = os.path.dirname(os.path.dirname(current_path))
+sys.path.append(parent_path)
+
+from src.Clinet_LLM import LLMClient
+from src.prompt_builder import ASSESSMENT_OUTPUT_SPEC, log_prompt_tokens
+from src.basemodel import AssessmentLLMOutput
+from utils.llm_json import parse_llm_json, validate_schema, LLMSchemaError
+from functions.academic_assessment_core import call_llm_for_assessment
+
+
+class _BatchItem:
+    """队列中的单个评估请求"""
+    __slots__ = ("student_id", "prompt", "future")
+
+    def __init__(self, student_id: str, prompt: str):
+        self.student_id = student_id
+        self.prompt = prompt
+        self.future: Future = Future()
+
+
+class AssessmentMicroBatcher:
+    """评估请求微批处理器（凑满N个学生或等待T毫秒后合并发送）"""
+
+    def __init__(self, llm_client: LLMClient, max_batch_size: int = 8, max_wait_ms: float = 50,
+                 temperature: float = 0.2, fallback_workers: int = 4, max_inflight_batches: int = 4):
+        """
+        Args:
+            llm_client: LLM客户端实例
+            max_batch_size: 单批最多包含的学生数（N）
+            max_wait_ms: 首个请求到达后最多等待的毫秒数（T）
+            temperature: 评估调用温度
+            fallback_workers: 单独回退调用的并发线程数
+            max_inflight_batches: 同时在途的批量调用数（收集线程不等待批量调用返回，可继续凑下一批）
+        """
+        self.llm_client = llm_client
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.temperature = temperature
+        self.stats = {"requests": 0, "batches": 0, "batched_requests": 0, "single_calls": 0, "fallbacks": 0}
+        self._stats_lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[_BatchItem]]" = queue.Queue()
+        self._fallback_pool = ThreadPoolExecutor(max_workers=fallback_workers, thread_name_prefix="assess-fallback")
+        self._batch_pool = ThreadPoolExecutor(max_workers=max(1, max_inflight_batches), thread_name_prefix="assess-batch")
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="assessment-batcher", daemon=True)
+        self._worker.start()
+
+    # -------------------------- 对外接口 --------------------------
+    def submit(self, student_id: str, prompt: str) -> Future:
+        """提交单个学生的评估Prompt，返回可等待的Future（结果为评估JSON字典）"""
+        if self._closed:
+            raise RuntimeError("AssessmentMicroBatcher已关闭")
+        item = _BatchItem(student_id, prompt)
+        self._bump("requests")
+        self._queue.put(item)
+        return item.future
+
+    def assess(self, student_id: str, prompt: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """提交并阻塞等待评估结果"""
+        return self.submit(student_id, prompt).result(timeout=timeout)
+
+    def close(self) -> None:
+        """停止收集新请求，处理完队列中剩余请求后退出"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+        self._batch_pool.shutdown(wait=True)  # 批量调用可能再提交回退调用，需先于回退线程池关闭
+        self._fallback_pool.shutdown(wait=True)
+
+    def __enter__(self) -> "AssessmentMicroBatcher":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # -------------------------- 批次收集与发送 --------------------------
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._batch_pool.submit(self._dispatch, batch)
+            if stop:
+                return
+
+    def _dispatch(self, batch: List[_BatchItem]) -> None:
+        if len(batch) == 1:
+            self._fallback_pool.submit(self._call_single, batch[0], "single_calls")
+            return
+
+        keys = self._batch_keys(batch)
+        self._bump("batches")
+        self._bump("batched_requests", len(batch))
+        try:
+            prompt = build_batch_assessment_prompt(list(zip(keys, (item.prompt for item in batch))))
+            log_prompt_tokens("assessment_batch", prompt)
+            raw = self.llm_client.generate_edu_response(prompt, temperature=self.temperature, json_mode=True,
+                                                        call_site="assessment_batch")
+            results = parse_batch_assessment_result(raw)
+        except Exception as e:
+            print(f"批量评估失败，回退为单独调用：{str(e)}")
+            results = {}
+
+        for key, item in zip(keys, batch):
+            try:
+                item.future.set_result(validate_schema(results.get(key), AssessmentLLMOutput))
+            except LLMSchemaError:
+                self._fallback_pool.submit(self._call_single, item, "fallbacks")
+
+    def _call_single(self, item: _BatchItem, stat_key: str) -> None:
+        """单独调用（批大小为1，或批量结果缺失/不合法时回退）"""
+        self._bump(stat_key)
+        try:
+            item.future.set_result(call_llm_for_assessment(self.llm_client, item.prompt, temperature=self.temperature))
+        except Exception as e:
+            item.future.set_exception(e)
+
+    @staticmethod
+    def _batch_keys(batch: List[_BatchItem]) -> List[str]:
+        """批内唯一键（同一学生重复出现时追加序号）"""
+        keys, seen = [], {}
+        for item in batch:
+            count = seen.get(item.student_id, 0)
+            seen[item.student_id] = count + 1
+            keys.append(item.student_id if count == 0 else f"{item.student_id}#{count}")
+        return keys
+
+    def _bump(self, key: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[key] += n
+
+
+# -------------------------- 批量Prompt与结果解析 --------------------------
+def build_batch_assessment_prompt(keyed_prompts: List[Any]) -> str:
+    """合并多名学生的评估Prompt（输出格式说明只保留一份）"""
+    sections = [
+        f"[{key}]\n{prompt.replace(ASSESSMENT_OUTPUT_SPEC, '').strip()}"
+        for key, prompt in keyed_prompts
+    ]
+    keys = [key for key, _ in keyed_prompts]
+    return (
+        f"### 批量学业评估（共{len(keys)}名学生）###\n"
+        + "\n\n".join(sections)
+        + f"\n\n### 输出要求 ###\n仅返回一个JSON对象，键为学生编号{json.dumps(keys, ensure_ascii=False)}，"
+          f"值为该学生的评估结果，单个学生的评估结果格式如下：\n{ASSESSMENT_OUTPUT_SPEC}"
+    )
+
+
+def parse_batch_assessment_result(raw: str) -> Dict[str, Any]:
+    """解析批量评估结果（{学生编号: 评估JSON}），非法格式抛出ValueError；单个学生的校验由调用方完成"""
+    data = parse_llm_json(raw, prompt_type="assessment_batch")
+    if not isinstance(data, dict):
+        raise ValueError("批量评估结果不是JSON对象")
+    return data
+
+
+# -------------------------- 功能测试 --------------------------
+class _ScriptedLLMClient:
+    """测试用LLM客户端：批量调用返回预设结果，单独调用返回标记为single的合法评估结果"""
+
+    def __init__(self, batch_response: Any):
+        self.batch_response = batch_response
+        self.call_sites: List[str] = []
+        self._lock = threading.Lock()
+
+    def generate_edu_response(self, prompt: str, temperature: float = 0.2, json_mode: bool = False,
+                              call_site: str = "default") -> str:
+        with self._lock:
+            self.call_sites.append(call_site)
+        if call_site == "assessment_batch":
+            if isinstance(self.batch_response, Exception):
+                raise self.batch_response
+            return json.dumps(self.batch_response, ensure_ascii=False)
+        return json.dumps(_test_assessment("single"), ensure_ascii=False)
+
+
+def _test_assessment(diagnosis: str) -> Dict[str, Any]:
+    return {
+        "knowledge_mastery": {"函数单调性": 55}, "ability_level": {"comprehensive": 3},
+        "learning_habits": {"preference": "visual"}, "diagnosis": diagnosis, "error_points": ["函数单调性"]
+    }
+
+
+def test_micro_batcher_batch_and_fallback():
+    """合法的批量结果直接回填；批量结果中缺失/不合法的学生回退为单独调用"""
+    client = _ScriptedLLMClient({"S1": _test_assessment("batch"), "S2": {"diagnosis": "缺少必填字段"}})
+    with AssessmentMicroBatcher(client, max_batch_size=3, max_wait_ms=500) as batcher:
+        futures = {sid: batcher.submit(sid, f"评估{sid}") for sid in ("S1", "S2", "S3")}
+        results = {sid: future.result(timeout=10)["diagnosis"] for sid, future in futures.items()}
+    assert results == {"S1": "batch", "S2": "single", "S3": "single"}
+    assert batcher.stats["batches"] == 1 and batcher.stats["batched_requests"] == 3
+    assert batcher.stats["fallbacks"] == 2
+    assert sorted(client.call_sites) == ["assessment", "assessment", "assessment_batch"]
+    print("✅ 微批处理：批量结果回填与缺失学生回退正常")
+
+
+def test_micro_batcher_batch_failure():
+    """批量调用整体失败时，批内每个学生都回退为单独调用并拿到各自结果"""
+    client = _ScriptedLLMClient(RuntimeError("批量接口不可用"))
+    with AssessmentMicroBatcher(client, max_batch_size=2, max_wait_ms=500) as batcher:
+        futures = [batcher.submit(sid, f"评估{sid}") for sid in ("S1", "S2")]
+        results = [future.result(timeout=10)["diagnosis"] for future in futures]
+    assert results == ["single", "single"]
+    assert batcher.stats["fallbacks"] == 2
+    print("✅ 微批处理：批量调用失败时全部回退单独调用")
+
+
+if __name__ == "__main__":
+    test_micro_batcher_batch_and_fallback()
+    test_micro_batcher_batch_failure()
@@ -0,0 +1,125 @@
+# assessment_cache.py
+"""评估结果缓存（各Agent共享）
+设计意图：同一学生先评估、再规划、再引导时，会在几分钟内触发多次完全相同的LLM评估。
+按 (学生ID, 学科, 数据版本号) 缓存评估结果，带TTL；学生数据更新时（update_student_progress）
+版本号变化且主动失效该学生的全部缓存，保证不会返回过期结果。
+同一键的并发未命中只计算一次（单飞合并），其余调用等待并拿到同一结果的副本。
+LLM失败时返回的默认评估结果（带FALLBACK_FLAG标记）不写入缓存，LLM恢复后下一次调用重新评估。
+"""
+from typing import Dict, Any, Callable, Optional, Tuple
+from collections import OrderedDict
+import copy
+import threading
+import time
+import sys
+import os
+
+# 添加项目路径
+current_path = os.path.abspath(__file__)
+parent_path = os.path.dirname(os.path.dirname(current_path))
+sys.path.append(parent_path)
+
+from src.llm_telemetry import telemetry
+from utils.singleflight import SingleFlight
+
+CacheKey = Tuple[str, str, int]
+
+# 评估结果为LLM失败时的默认结果（非真实评估）的标记字段
+FALLBACK_FLAG = "_fallback"
+
+
+def is_fallback_result(result: Optional[Dict[str, Any]]) -> bool:
+    return bool(result and result.get(FALLBACK_FLAG))
+
+
+class AssessmentCache:
+    """评估结果缓存（TTL + 容量上限LRU淘汰 + 按学生失效，线程安全）"""
+
+    def __init__(self, ttl_seconds: float = 900, max_entries: int = 10000):
+        """
+        Args:
+            ttl_seconds: 缓存有效期（秒）
+            max_entries: 最大缓存条目数（超出后淘汰最久未使用的条目）
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "invalidated": 0, "evicted": 0, "coalesced": 0,
+                      "fallback_not_cached": 0}
+        self._flight = SingleFlight("assessment_cache", copy_result=True)
+
+    @staticmethod
+    def make_key(student_id: str, subject: str, data_version: int) -> CacheKey:
+        return (student_id, subject.lower(), data_version)
+
+    def get(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        """查询缓存（过期条目视为未命中并删除），返回结果副本"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+        # 返回副本，避免调用方修改结果污染其他Agent拿到的缓存
+        return copy.deepcopy(value)
+
+    def put(self, key: CacheKey, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evicted"] += 1
+
+    def get_or_compute(self, student_id: str, subject: str, data_version: int,
+                       compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """命中则直接返回，否则调用compute计算并写入缓存（同一键已在计算时等待其结果，不重复计算）
+        命中/合并只计入遥测的缓存事件计数，不计入LLM延迟直方图；默认结果（LLM失败）不写入缓存
+        """
+        key = self.make_key(student_id, subject, data_version)
+        cached = self.get(key)
+        if cached is not None:
+            telemetry.record_cache_event("assessment", "hit")
+            return cached
+
+        def compute_and_put() -> Dict[str, Any]:
+            result = compute()
+            if is_fallback_result(result):
+                with self._lock:
+                    self.stats["fallback_not_cached"] += 1
+            else:
+                self.put(key, result)  # 先写缓存再结束单飞，之后到达的调用直接命中缓存
+            return result
+
+        result, coalesced = self._flight.do_with_status(key, compute_and_put)
+        if coalesced:
+            with self._lock:
+                self.stats["coalesced"] += 1
+            telemetry.record_cache_event("assessment", "coalesced")
+        return result
+
+    def invalidate(self, student_id: str, subject: Optional[str] = None) -> int:
+        """失效某学生（可选指定学科）的全部缓存，返回删除条目数"""
+        with self._lock:
+            keys = [k for k in self._entries if k[0] == student_id and (subject is None or k[1] == subject.lower())]
+            for key in keys:
+                del self._entries[key]
+            self.stats["invalidated"] += len(keys)
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def bind(self, db_agent: Any) -> "AssessmentCache":
+        """订阅DatabaseManagerAgent的学生数据更新事件，数据变化时主动失效缓存"""
+        db_agent.register_update_listener(self.invalidate)
+        return self
@@ -0,0 +1,373 @@
+# cohort_assessment_job.py
+"""全体学生离线评估任务（夜间批量刷新）
+设计意图：原先只有单个学生的评估入口，全量刷新数千名学生只能串行调用。
+这里用线程池并发执行 run_academic_assessment，并用全局信号量限制同时在途的LLM调用数（保护配额/本地模型）；
+可选接入微批处理器合并LLM请求。结果按分片流式写出为列式文件（安装pyarrow时为parquet，否则为每列一个数组的npz），
+每个分片落盘后才把其中的学生ID写入检查点，崩溃后重跑会跳过已完成学生、清理未登记的残留分片，保证每名学生恰好输出一次。
+每个分片另写一份掌握度与三源数据的长表数组（part-XXXXX.kp.npz），全班冲突扫描可直接读取构建矩阵
+（CohortConflictMatrices.from_cohort_output）。
+
+命令行：
+    python -m functions.cohort_assessment_job --subject math --output-dir cohort_out --workers 32 --llm-concurrency 16
+"""
+from typing import Dict, Any, Iterator, List, Optional, Set
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
+import json
+import math
+import threading
+import time
+import sys
+import os
+
+import numpy as np
+
+# 添加项目路径
+current_path = os.path.abspath(__file__)
+parent_path = os.path.dirname(os.path.dirname(current_path))
+sys.path.append(parent_path)
+
+from agents.Agent_dbmanager import DatabaseManagerAgent
+from src.Clinet_LLM import LLMClient
+from functions.academic_assessment_core import run_academic_assessment
+from functions.assessment_cache import is_fallback_result
+from functions.cohort_conflict_scan import assessments_to_long_arrays
+from functions.assessment_batcher import AssessmentMicroBatcher
+
+try:  # 可选依赖：安装pyarrow时输出parquet，否则输出npz列式文件
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+CHECKPOINT_FILE = "checkpoint.jsonl"
+ERROR_FILE = "errors.jsonl"
+PART_PREFIX = "part-"
+LONG_ARRAYS_SUFFIX = ".kp.npz"  # 与分片同名的长表数组文件（随分片一起登记）
+
+
+class ConcurrencyLimitedLLMClient:
+    """LLM客户端代理：所有线程共享一个信号量，限制同时在途的LLM调用数"""
+
+    def __init__(self, llm_client: LLMClient, max_concurrency: int):
+        self._inner = llm_client
+        self._semaphore = threading.BoundedSemaphore(max(1, max_concurrency))
+
+    def generate_edu_response(self, *args, **kwargs) -> str:
+        with self._semaphore:
+            return self._inner.generate_edu_response(*args, **kwargs)
+
+    def stream_edu_response(self, *args, **kwargs) -> Iterator[str]:
+        with self._semaphore:
+            yield from self._inner.stream_edu_response(*args, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._inner, name)
+
+
+# -------------------------- 列式输出 --------------------------
+def assessment_to_row(result: Dict[str, Any], assessed_at: str) -> Dict[str, Any]:
+    """评估结果 → 扁平行（常用指标单独成列，完整结果保留为JSON列；不含输入侧的multi_source_data）"""
+    mastery = result.get("knowledge_mastery") or {}
+    mastery_values = [float(v) for v in mastery.values() if isinstance(v, (int, float))]
+    comprehensive = (result.get("ability_level") or {}).get("comprehensive")
+    payload = {k: v for k, v in result.items() if k != "multi_source_data"}
+    return {
+        "student_id": str(result.get("student_id", "")),
+        "subject": str(result.get("subject", "")),
+        "assessed_at": assessed_at,
+        "mastery_avg": sum(mastery_values) / len(mastery_values) if mastery_values else math.nan,
+        "ability_comprehensive": float(comprehensive) if isinstance(comprehensive, (int, float)) else math.nan,
+        "error_point_count": len(result.get("error_points") or []),
+        "diagnosis": str(result.get("diagnosis", "")),
+        "knowledge_mastery": json.dumps(mastery, ensure_ascii=False),
+        "error_points": json.dumps(result.get("error_points") or [], ensure_ascii=False),
+        "result_json": json.dumps(payload, ensure_ascii=False, default=str),
+    }
+
+
+_FLOAT_COLUMNS = {"mastery_avg", "ability_comprehensive"}
+_INT_COLUMNS = {"error_point_count"}
+
+def _column_arrays(rows: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    columns = {}
+    for name in rows[0]:
+        values = [row[name] for row in rows]
+        if name in _FLOAT_COLUMNS:
+            columns[name] = np.array(values, dtype=np.float64)
+        elif name in _INT_COLUMNS:
+            columns[name] = np.array(values, dtype=np.int64)
+        else:
+            columns[name] = np.array(values, dtype=np.str_)
+    return columns
+
+def write_part(output_dir: str, part_index: int, rows: List[Dict[str, Any]]) -> str:
+    """写出一个分片（先写临时文件再原子替换），返回分片文件名"""
+    suffix = ".parquet" if pq is not None else ".npz"
+    name = f"{PART_PREFIX}{part_index:05d}{suffix}"
+    path = os.path.join(output_dir, name)
+    tmp_path = path + ".tmp"
+    if pq is not None:
+        pq.write_table(pa.Table.from_pylist(rows), tmp_path, compression="zstd")
+    else:
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, **_column_arrays(rows))
+    os.replace(tmp_path, path)
+    return name
+
+def write_long_arrays(output_dir: str, part_index: int, results: List[Dict[str, Any]]) -> str:
+    """写出分片对应的长表数组（冲突扫描用；先于分片写出，随分片一起登记到检查点）"""
+    path = os.path.join(output_dir, f"{PART_PREFIX}{part_index:05d}{LONG_ARRAYS_SUFFIX}")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **assessments_to_long_arrays(results))
+    os.replace(tmp_path, path)
+    return os.path.basename(path)
+
+def read_cohort_long_arrays(output_dir: str) -> List[Dict[str, np.ndarray]]:
+    """读取全部已登记分片的长表数组（按检查点顺序；缺少长表文件的旧分片跳过）"""
+    parts = []
+    for record in _read_checkpoint(output_dir):
+        path = os.path.join(output_dir, record["part"].split(".")[0] + LONG_ARRAYS_SUFFIX)
+        if not os.path.exists(path):
+            continue
+        with np.load(path, allow_pickle=False) as data:
+            parts.append({name: data[name] for name in data.files})
+    return parts
+
+def read_cohort_output(output_dir: str) -> "Any":
+    """读取全部已登记分片为pandas.DataFrame（parquet/npz均支持）"""
+    import pandas as pd
+    frames = []
+    for record in _read_checkpoint(output_dir):
+        path = os.path.join(output_dir, record["part"])
+        if path.endswith(".parquet"):
+            frames.append(pd.read_parquet(path))
+        else:
+            with np.load(path, allow_pickle=False) as data:
+                frames.append(pd.DataFrame({name: data[name] for name in data.files}))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+# -------------------------- 检查点 --------------------------
+def _read_checkpoint(output_dir: str) -> List[Dict[str, Any]]:
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue  # 崩溃时写了一半的行：跳过，对应分片未登记，重跑时重新计算
+    return records
+
+def _truncate_torn_tail(path: str) -> None:
+    """截掉检查点末尾不完整的行（崩溃时只写了一半），之后追加的记录从新行开始"""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        if not data or data.endswith(b"\n"):
+            return
+        f.truncate(data.rfind(b"\n") + 1)
+        f.flush()
+        os.fsync(f.fileno())
+
+def load_resume_state(output_dir: str) -> Dict[str, Any]:
+    """恢复状态：已完成学生ID、下一个分片序号；截掉检查点末尾的半行，删除未登记到检查点的残留分片"""
+    _truncate_torn_tail(os.path.join(output_dir, CHECKPOINT_FILE))
+    records = _read_checkpoint(output_dir)
+    done: Set[str] = set()
+    registered = set()
+    for record in records:
+        done.update(record["student_ids"])
+        registered.add(record["part"])
+    registered_files = registered | {part.split(".")[0] + LONG_ARRAYS_SUFFIX for part in registered}
+    next_index = 0
+    for name in os.listdir(output_dir):
+        if not name.startswith(PART_PREFIX):
+            continue
+        if name not in registered_files:
+            os.remove(os.path.join(output_dir, name))  # 写出后未登记（或临时文件）：重跑时重新计算
+            continue
+        next_index = max(next_index, int(name[len(PART_PREFIX):].split(".")[0]) + 1)
+    return {"done": done, "next_part": next_index, "parts": len(registered)}
+
+def append_checkpoint(output_dir: str, part_name: str, student_ids: List[str]) -> None:
+    with open(os.path.join(output_dir, CHECKPOINT_FILE), "a", encoding="utf-8") as f:
+        f.write(json.dumps({"part": part_name, "student_ids": student_ids, "ts": time.strftime("%Y-%m-%d %H:%M:%S")},
+                           ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# -------------------------- 主流程 --------------------------
+class AssessmentFallbackError(RuntimeError):
+    """评估退回为默认结果（LLM不可用或输出无法解析）"""
+
+def _format_eta(seconds: float) -> str:
+    if not math.isfinite(seconds):
+        return "--:--:--"
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def run_cohort_assessment(
+    db_agent: DatabaseManagerAgent,
+    llm_client: LLMClient,
+    subject: str,
+    output_dir: str,
+    workers: int = 16,
+    llm_concurrency: int = 8,
+    part_size: int = 500,
+    batch_size: int = 1,
+    student_ids: Optional[List[str]] = None,
+    progress_interval_s: float = 10.0
+) -> Dict[str, Any]:
+    """全体学生评估
+    Args:
+        workers: 并发评估线程数（数据查询/Prompt构建/结果整合与LLM调用重叠执行）
+        llm_concurrency: 全局同时在途的LLM调用上限
+        part_size: 每个输出分片的学生数（同时也是检查点粒度）
+        batch_size: >1时启用微批处理，把最多batch_size名学生的评估合并为一次LLM调用
+        student_ids: 指定学生（默认student_basic_data中的全部学生）
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    state = load_resume_state(output_dir)
+    all_ids = list(student_ids) if student_ids is not None else list(db_agent.student_basic_data.keys())
+    pending = [sid for sid in all_ids if sid not in state["done"]]
+    print(f"📋 学生总数{len(all_ids)}，已完成{len(all_ids) - len(pending)}，待评估{len(pending)}"
+          f"（输出格式：{'parquet' if pq is not None else 'npz'}）")
+
+    limited_client = ConcurrencyLimitedLLMClient(llm_client, llm_concurrency)
+    batcher = AssessmentMicroBatcher(limited_client, max_batch_size=batch_size, fallback_workers=llm_concurrency,
+                                     max_inflight_batches=llm_concurrency) if batch_size > 1 else None
+
+    part_index = state["next_part"]
+    buffer: List[Dict[str, Any]] = []
+    buffer_results: List[Dict[str, Any]] = []  # 与buffer对应的完整评估结果（写长表数组用）
+    completed, failed = 0, 0
+    start = last_report = time.perf_counter()
+
+    def assess(student_id: str) -> Dict[str, Any]:
+        result = run_academic_assessment(db_agent, limited_client, student_id, subject, batcher=batcher)
+        if is_fallback_result(result):
+            # LLM失败时的默认结果不是真实评估：按失败处理（不写入分片与检查点，重跑时重试）
+            raise AssessmentFallbackError("LLM调用或结果解析失败，得到的是默认评估结果")
+        return result
+
+    def flush() -> None:
+        nonlocal part_index, buffer, buffer_results
+        if not buffer:
+            return
+        write_long_arrays(output_dir, part_index, buffer_results)
+        name = write_part(output_dir, part_index, buffer)
+        append_checkpoint(output_dir, name, [row["student_id"] for row in buffer])
+        part_index += 1
+        buffer, buffer_results = [], []
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="cohort-assess") as pool, \
+                open(os.path.join(output_dir, ERROR_FILE), "a", encoding="utf-8") as error_file:
+            futures = {pool.submit(assess, sid): sid for sid in pending}
+            for future in as_completed(futures):
+                student_id = futures[future]
+                try:
+                    result = future.result()
+                    buffer.append(assessment_to_row(result, time.strftime("%Y-%m-%dT%H:%M:%S")))
+                    buffer_results.append(result)
+                    completed += 1
+                except Exception as e:
+                    failed += 1  # 失败学生不写检查点，重跑时自动重试
+                    error_file.write(json.dumps({"student_id": student_id, "error": f"{type(e).__name__}: {e}"},
+                                                ensure_ascii=False) + "\n")
+                if len(buffer) >= part_size:
+                    flush()
+
+                now = time.perf_counter()
+                if now - last_report >= progress_interval_s:
+                    last_report = now
+                    rate = (completed + failed) / (now - start)
+                    remaining = len(pending) - completed - failed
+                    print(f"⏳ {completed + failed}/{len(pending)}  {rate:.1f} 人/秒  "
+                          f"ETA {_format_eta(remaining / rate if rate else math.inf)}  失败{failed}")
+            flush()
+    finally:
+        if batcher is not None:
+            batcher.close()
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        "subject": subject,
+        "total": len(all_ids),
+        "skipped_done": len(all_ids) - len(pending),
+        "completed": completed,
+        "failed": failed,
+        "parts": part_index,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_per_s": round(completed / elapsed, 2) if elapsed else 0.0,
+    }
+    print(f"✅ 评估完成：{json.dumps(summary, ensure_ascii=False)}")
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="全体学生离线评估（支持断点续跑）")
+    parser.add_argument("--data-path", default="/home/lst/data/assistment2009/skill_builder_data.csv")
+    parser.add_argument("--subject", default="math")
+    parser.add_argument("--output-dir", default="cohort_assessment")
+    parser.add_argument("--workers", type=int, default=16, help="评估线程数")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="全局LLM并发上限")
+    parser.add_argument("--part-size", type=int, default=500, help="每个输出分片/检查点的学生数")
+    parser.add_argument("--batch-size", type=int, default=1, help=">1时启用微批处理合并LLM调用")
+    parser.add_argument("--model-type", default=None, help="LLM后端（local/cloud/fake，默认读取EDU_LLM_BACKEND）")
+    parser.add_argument("--limit", type=int, default=None, help="只评估前N名学生（试跑用）")
+    parser.add_argument("--progress-interval", type=float, default=10.0, help="进度输出间隔（秒）")
+    args = parser.parse_args(argv)
+
+    db_agent = DatabaseManagerAgent(data_path=args.data_path)
+    llm_client = LLMClient(model_type=args.model_type, model_name="llama3-edu")
+    student_ids = list(db_agent.student_basic_data.keys())
+    if args.limit is not None:
+        student_ids = student_ids[:args.limit]
+    run_cohort_assessment(
+        db_agent, llm_client, args.subject, args.output_dir,
+        workers=args.workers, llm_concurrency=args.llm_concurrency, part_size=args.part_size,
+        batch_size=args.batch_size, student_ids=student_ids, progress_interval_s=args.progress_interval
+    )
+
+
+# -------------------------- 功能测试 --------------------------
+def test_resume_after_torn_checkpoint():
+    """崩溃（检查点写了半行+残留分片）→ 续跑 → 再次崩溃 → 续跑：每名学生恰好输出一次，检查点记录全部可读"""
+    import tempfile
+    db_agent = DatabaseManagerAgent(data_path="x.csv")  # 数据集不存在时使用模拟数据（学生S1-S3）
+    llm_client = LLMClient(model_type="fake", model_name="llama3-edu")
+    students = ["S1", "S2", "S3"]
+
+    def crash(output_dir: str) -> None:
+        with open(os.path.join(output_dir, CHECKPOINT_FILE), "a", encoding="utf-8") as f:
+            f.write('{"part": "part-09999.npz", "student_i')
+        open(os.path.join(output_dir, f"{PART_PREFIX}09999.npz"), "wb").close()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        for count in range(1, len(students) + 1):
+            run_cohort_assessment(db_agent, llm_client, "math", output_dir, workers=2, llm_concurrency=2,
+                                  part_size=1, student_ids=students[:count], progress_interval_s=60)
+            if count < len(students):
+                crash(output_dir)
+
+        records = _read_checkpoint(output_dir)
+        assert [record["student_ids"] for record in records] == [["S1"], ["S2"], ["S3"]]
+        assert load_resume_state(output_dir) == {"done": set(students), "next_part": 3, "parts": 3}
+        assert sorted(read_cohort_output(output_dir)["student_id"]) == students
+    print("✅ 断点续跑：检查点半行被截掉，续跑后的分片全部登记，每名学生恰好输出一次")
+
+
+if __name__ == "__main__":
+    main()
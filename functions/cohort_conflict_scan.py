@@ -0,0 +1,331 @@
+# cohort_conflict_scan.py
+"""全班/全年级冲突扫描（向量化）
+设计意图：统计哪些学生当前存在多源数据矛盾、薄弱点与难题冲突，原先只能逐个学生调用 detect_and_resolve_conflicts，
+其中 check_data_inconsistency 对每个知识点做 Python 循环。这里把全体学生的 考试/作业/课堂互动 掌握度
+以及评估掌握度堆叠为 学生×知识点 矩阵，冲突判定改为整矩阵运算：
+- 多源数据矛盾：三源 max-min > 30（只看该学生评估掌握度中出现的知识点，缺失的源数据按0计，与check_data_inconsistency一致）
+- 薄弱点与难题冲突：存在掌握度 < 60 的知识点，且该学生规划中有难题/压轴题任务（规划任务文本只能逐份遍历，结果为布尔向量）
+字典展开为矩阵仍需逐项遍历（耗时与全部源数据条目数成正比，比逐学生判定本身还慢，只适合一次构建、多次按不同阈值重扫）；
+全体学生离线评估任务（cohort_assessment_job）在评估时就把掌握度与三源数据按 (学生, 知识点, 值) 长表写入列式分片，
+from_cohort_output 直接读取这些数组散布成矩阵（纯numpy，毫秒级），端到端才比逐学生判定快。
+
+离线耗时对比（逐学生判定 vs 字典构建+扫描 vs 列式读取+扫描）：
+    python -m functions.cohort_conflict_scan --students 5000 --knowledge-points 40
+"""
+from typing import Dict, List, Any, Iterable, Optional
+import argparse
+import json
+import tempfile
+import time
+import sys
+import os
+
+import numpy as np
+
+# 添加项目路径
+current_path = os.path.abspath(__file__)
+parent_path = os.path.dirname(os.path.dirname(current_path))
+sys.path.append(parent_path)
+
+from functions.coordinator_core import HARD_TASK_KEYWORDS
+
+SOURCES = ("exam", "homework", "class_interaction")
+DATA_SPREAD_THRESHOLD = 30  # 与check_data_inconsistency一致
+WEAK_MASTERY_THRESHOLD = 60  # 与ConflictFeatures.has_weak_point一致
+
+
+def plan_has_hard_task(plan: Optional[Dict[str, Any]]) -> bool:
+    """规划中是否含难题/压轴题任务（无规划视为没有）"""
+    if not plan:
+        return False
+    for week in plan.get("weekly_tasks", []):
+        for task in week.get("tasks", []):
+            content = task.get("content", "")
+            if any(keyword in content for keyword in HARD_TASK_KEYWORDS):
+                return True
+    return False
+
+
+class CohortConflictMatrices:
+    """全体学生的 学生×知识点 掌握度矩阵"""
+
+    def __init__(self, student_ids: List[str], knowledge_points: List[str], sources: np.ndarray,
+                 mastery: np.ndarray, has_hard_task: Optional[np.ndarray] = None):
+        """
+        Args:
+            sources: 形状 (3, 学生数, 知识点数)，依次为 考试/作业/课堂互动 掌握度，缺失按0填充
+            mastery: 形状 (学生数, 知识点数)，评估掌握度，缺失为NaN（非NaN的位置即参与判定的知识点）
+            has_hard_task: 形状 (学生数,)，规划中是否有难题任务（默认全为False）
+        """
+        num_students, num_kps = len(student_ids), len(knowledge_points)
+        if sources.shape != (len(SOURCES), num_students, num_kps) or mastery.shape != (num_students, num_kps):
+            raise ValueError(f"矩阵形状与学生数{num_students}/知识点数{num_kps}不一致")
+        self.student_ids = list(student_ids)
+        self.knowledge_points = list(knowledge_points)
+        self.sources = sources
+        self.mastery = mastery
+        self.has_hard_task = has_hard_task if has_hard_task is not None else np.zeros(num_students, dtype=bool)
+
+    @classmethod
+    def from_assessments(cls, assessments: Iterable[Dict[str, Any]],
+                         plans: Optional[Dict[str, Dict[str, Any]]] = None) -> "CohortConflictMatrices":
+        """由评估结果（含knowledge_mastery与multi_source_data）构建矩阵
+        Args:
+            plans: {学生ID: 当前规划}，用于判断难题任务；缺失的学生视为没有难题任务
+        """
+        assessments = list(assessments)
+        layers = [[assessment.get("knowledge_mastery") or {} for assessment in assessments]]
+        for source in SOURCES:
+            layers.append([(assessment.get("multi_source_data") or {}).get(source) or {} for assessment in assessments])
+        # 先并集得到知识点表，再按层收集 (行, 列, 值) 一次性散布写入矩阵（extend/map在C层迭代，避免逐项append）
+        vocabulary: Dict[str, None] = {}
+        for layer in layers:
+            for values in layer:
+                vocabulary.update(dict.fromkeys(values))
+        kp_index = {kp: col for col, kp in enumerate(vocabulary)}
+        shape = (len(assessments), len(kp_index))
+        mastery = np.full(shape, np.nan, dtype=np.float32)
+        sources = np.zeros((len(SOURCES),) + shape, dtype=np.float32)
+        for depth, layer in enumerate(layers):
+            rows: List[int] = []
+            cols: List[int] = []
+            cell_values: List[Any] = []
+            for row, values in enumerate(layer):
+                rows.extend([row] * len(values))
+                cols.extend(map(kp_index.__getitem__, values))
+                cell_values.extend(values.values())
+            count = len(rows)
+            target = mastery if depth == 0 else sources[depth - 1]
+            target[np.fromiter(rows, np.intp, count), np.fromiter(cols, np.intp, count)] = \
+                np.fromiter(cell_values, np.float32, count)
+
+        student_ids = [str(assessment.get("student_id", "")) for assessment in assessments]
+        plans = plans or {}
+        has_hard_task = np.fromiter((plan_has_hard_task(plans.get(sid)) for sid in student_ids),
+                                    dtype=bool, count=len(student_ids))
+        return cls(student_ids, list(kp_index), sources, mastery, has_hard_task)
+
+    @classmethod
+    def from_long_arrays(cls, parts: Iterable[Dict[str, np.ndarray]],
+                         plans: Optional[Dict[str, Dict[str, Any]]] = None) -> "CohortConflictMatrices":
+        """由若干分片的长表数组（assessments_to_long_arrays的输出）构建矩阵（合并知识点表与散布写入均为数组运算）"""
+        parts = list(parts)
+        student_ids = np.concatenate([part["student_ids"] for part in parts]).tolist() if parts else []
+        part_kps = [part["knowledge_points"] for part in parts]
+        knowledge_points, kp_inverse = np.unique(np.concatenate(part_kps) if part_kps else np.array([], dtype=np.str_),
+                                                 return_inverse=True)
+        shape = (len(student_ids), len(knowledge_points))
+        mastery = np.full(shape, np.nan, dtype=np.float32)
+        sources = np.zeros((len(SOURCES),) + shape, dtype=np.float32)
+        student_offset = kp_offset = 0
+        for part in parts:
+            rows = part["rows"] + student_offset
+            cols = kp_inverse[kp_offset + part["cols"]]
+            values = part["values"]
+            mastery[rows, cols] = values[0]
+            sources[:, rows, cols] = np.nan_to_num(values[1:], nan=0.0)  # 缺失的源数据按0计
+            student_offset += len(part["student_ids"])
+            kp_offset += len(part["knowledge_points"])
+        plans = plans or {}
+        has_hard_task = np.fromiter((plan_has_hard_task(plans.get(sid)) for sid in student_ids),
+                                    dtype=bool, count=len(student_ids))
+        return cls(student_ids, knowledge_points.tolist(), sources, mastery, has_hard_task)
+
+    @classmethod
+    def from_cohort_output(cls, output_dir: str,
+                           plans: Optional[Dict[str, Dict[str, Any]]] = None) -> "CohortConflictMatrices":
+        """读取全体学生离线评估任务的输出目录（已登记分片的长表数组）构建矩阵"""
+        from functions.cohort_assessment_job import read_cohort_long_arrays
+        return cls.from_long_arrays(read_cohort_long_arrays(output_dir), plans)
+
+    def __len__(self) -> int:
+        return len(self.student_ids)
+
+
+def assessments_to_long_arrays(assessments: Iterable[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """评估结果 → 长表数组（评估时逐学生展开一次，写入列式分片供from_long_arrays直接读取）
+    student_ids (学生数,) / knowledge_points (本分片知识点数,) / rows, cols (条目数,) /
+    values (4, 条目数)：依次为评估掌握度与 考试/作业/课堂互动，缺失为NaN
+    """
+    student_ids: List[str] = []
+    kp_index: Dict[str, int] = {}
+    rows: List[int] = []
+    cols: List[int] = []
+    values: List[List[float]] = [[] for _ in range(len(SOURCES) + 1)]
+    for row, assessment in enumerate(assessments):
+        student_ids.append(str(assessment.get("student_id", "")))
+        multi_source = assessment.get("multi_source_data") or {}
+        layers = [assessment.get("knowledge_mastery") or {}] + [multi_source.get(source) or {} for source in SOURCES]
+        kps: Dict[str, None] = {}
+        for layer in layers:
+            kps.update(dict.fromkeys(layer))
+        for kp in kps:
+            rows.append(row)
+            cols.append(kp_index.setdefault(kp, len(kp_index)))
+            for depth, layer in enumerate(layers):
+                values[depth].append(layer.get(kp, np.nan))
+    return {
+        "student_ids": np.array(student_ids, dtype=np.str_),
+        "knowledge_points": np.array(list(kp_index), dtype=np.str_),
+        "rows": np.array(rows, dtype=np.int64),
+        "cols": np.array(cols, dtype=np.int64),
+        "values": np.array(values, dtype=np.float32).reshape(len(SOURCES) + 1, len(rows)),
+    }
+
+
+class CohortConflictScan:
+    """冲突扫描结果（各判定均为按学生的布尔向量）"""
+
+    def __init__(self, matrices: CohortConflictMatrices, data_conflict_cells: np.ndarray, weak_cells: np.ndarray):
+        self.matrices = matrices
+        self.data_conflict_cells = data_conflict_cells  # (学生数, 知识点数) 三源差值超阈值的知识点
+        self.weak_cells = weak_cells                    # (学生数, 知识点数) 掌握度低于阈值的知识点
+        self.data_conflict = data_conflict_cells.any(axis=1)
+        self.has_weak_point = weak_cells.any(axis=1)
+        self.weak_hard_conflict = self.has_weak_point & matrices.has_hard_task
+
+    def flagged_student_ids(self, conflict_type: str) -> List[str]:
+        """conflict_type: data_conflict / weak_hard_conflict"""
+        mask = getattr(self, conflict_type)
+        return [self.matrices.student_ids[i] for i in np.flatnonzero(mask)]
+
+    def summary(self) -> Dict[str, Any]:
+        total = len(self.matrices)
+        return {
+            "students": total,
+            "data_conflict": int(self.data_conflict.sum()),
+            "weak_hard_conflict": int(self.weak_hard_conflict.sum()),
+            "any_conflict": int((self.data_conflict | self.weak_hard_conflict).sum()),
+        }
+
+    def to_rows(self, only_flagged: bool = True) -> List[Dict[str, Any]]:
+        """看板用的逐学生明细（含矛盾/薄弱知识点名）"""
+        kps = self.matrices.knowledge_points
+        mask = self.data_conflict | self.weak_hard_conflict if only_flagged else np.ones(len(self.matrices), bool)
+        rows = []
+        for i in np.flatnonzero(mask):
+            rows.append({
+                "student_id": self.matrices.student_ids[i],
+                "data_conflict": bool(self.data_conflict[i]),
+                "weak_hard_conflict": bool(self.weak_hard_conflict[i]),
+                "conflicting_knowledge_points": [kps[j] for j in np.flatnonzero(self.data_conflict_cells[i])],
+                "weak_knowledge_points": [kps[j] for j in np.flatnonzero(self.weak_cells[i])],
+            })
+        return rows
+
+
+def scan_cohort_conflicts(matrices: CohortConflictMatrices,
+                          spread_threshold: float = DATA_SPREAD_THRESHOLD,
+                          weak_threshold: float = WEAK_MASTERY_THRESHOLD) -> CohortConflictScan:
+    """对全体学生计算冲突判定（整矩阵运算，无逐学生/逐知识点循环）"""
+    assessed = ~np.isnan(matrices.mastery)  # 只判定评估掌握度中出现的知识点
+    spread = matrices.sources.max(axis=0) - matrices.sources.min(axis=0)
+    data_conflict_cells = (spread > spread_threshold) & assessed
+    with np.errstate(invalid="ignore"):
+        weak_cells = matrices.mastery < weak_threshold  # NaN比较结果为False
+    return CohortConflictScan(matrices, data_conflict_cells, weak_cells)
+
+
+# -------------------------- 离线耗时对比 --------------------------
+def _synthetic_cohort(num_students: int, num_kps: int, seed: int = 0) -> Dict[str, Any]:
+    """合成评估结果与规划：每名学生随机评估部分知识点，源数据偶有缺失或明显偏离，约三成学生的规划含难题任务"""
+    rng = np.random.default_rng(seed)
+    kps = [f"知识点{j:03d}" for j in range(num_kps)]
+    assessments, plans = [], {}
+    for i in range(num_students):
+        sid = f"S{i:06d}"
+        assessed = rng.random(num_kps) < 0.7
+        base = rng.integers(30, 95, num_kps)
+        multi_source = {}
+        for source in SOURCES:
+            present = rng.random(num_kps) < 0.998
+            # 多数知识点三源接近，偶有明显偏离
+            noise = np.where(rng.random(num_kps) < 0.004, rng.integers(-40, 41, num_kps), rng.integers(-8, 9, num_kps))
+            multi_source[source] = {kps[j]: int(np.clip(base[j] + noise[j], 0, 100))
+                                    for j in range(num_kps) if present[j]}
+        assessments.append({
+            "student_id": sid,
+            "knowledge_mastery": {kps[j]: int(base[j]) for j in range(num_kps) if assessed[j]},
+            "multi_source_data": multi_source,
+        })
+        content = "压轴题专项训练" if rng.random() < 0.3 else "基础题型巩固"
+        plans[sid] = {"weekly_tasks": [{"week": "第1周", "tasks": [
+            {"task_id": f"t_{i}_1", "content": "知识点梳理", "duration_hour": 2},
+            {"task_id": f"t_{i}_2", "content": content, "duration_hour": 2},
+        ]}]}
+    return {"assessments": assessments, "plans": plans}
+
+
+def run_scan_benchmark(num_students: int = 5000, num_kps: int = 40, seed: int = 0, part_size: int = 500) -> Dict[str, Any]:
+    """对比 逐学生调用原判定函数 vs 字典构建矩阵+扫描 vs 读取评估任务列式输出+扫描 的端到端耗时，并核对判定结果一致
+    列式输出按评估任务的分片格式预先写入临时目录（评估时逐学生写出，不计入扫描耗时）
+    """
+    from functions.coordinator_core import check_data_inconsistency
+    from functions.cohort_assessment_job import write_long_arrays, append_checkpoint
+
+    cohort = _synthetic_cohort(num_students, num_kps, seed)
+    assessments, plans = cohort["assessments"], cohort["plans"]
+
+    start = time.perf_counter()
+    legacy_data, legacy_weak_hard = [], []
+    for assessment in assessments:
+        plan = plans[assessment["student_id"]]
+        legacy_data.append(check_data_inconsistency(assessment, plan))
+        has_weak = any(v < WEAK_MASTERY_THRESHOLD for v in assessment["knowledge_mastery"].values())
+        legacy_weak_hard.append(has_weak and plan_has_hard_task(plan))
+    legacy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matrices = CohortConflictMatrices.from_assessments(assessments, plans)
+    build_s = time.perf_counter() - start
+    start = time.perf_counter()
+    scan = scan_cohort_conflicts(matrices)
+    scan_s = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        for part_index, offset in enumerate(range(0, num_students, part_size)):
+            part = assessments[offset:offset + part_size]
+            name = write_long_arrays(output_dir, part_index, part)
+            append_checkpoint(output_dir, name, [assessment["student_id"] for assessment in part])
+        start = time.perf_counter()
+        columnar = CohortConflictMatrices.from_cohort_output(output_dir, plans)
+        load_s = time.perf_counter() - start
+    start = time.perf_counter()
+    columnar_scan = scan_cohort_conflicts(columnar)
+    columnar_scan_s = time.perf_counter() - start
+
+    def matches(result: CohortConflictScan) -> bool:
+        order = {sid: i for i, sid in enumerate(result.matrices.student_ids)}
+        index = [order[assessment["student_id"]] for assessment in assessments]
+        return bool(np.array_equal(result.data_conflict[index], legacy_data)
+                    and np.array_equal(result.weak_hard_conflict[index], legacy_weak_hard))
+
+    dict_total_s = build_s + scan_s
+    columnar_total_s = load_s + columnar_scan_s
+    return {
+        "students": num_students,
+        "knowledge_points": num_kps,
+        "legacy_ms": round(legacy_s * 1000, 2),
+        "dict_build_ms": round(build_s * 1000, 2),
+        "dict_scan_ms": round(scan_s * 1000, 2),
+        "dict_total_ms": round(dict_total_s * 1000, 2),
+        "columnar_load_ms": round(load_s * 1000, 2),
+        "columnar_scan_ms": round(columnar_scan_s * 1000, 2),
+        "columnar_total_ms": round(columnar_total_s * 1000, 2),
+        # 端到端（构建/读取 + 扫描）相对逐学生判定的加速比；<1 表示更慢
+        "dict_speedup": round(legacy_s / dict_total_s, 2),
+        "columnar_speedup": round(legacy_s / columnar_total_s, 2),
+        "parity": matches(scan) and matches(columnar_scan),
+        "summary": scan.summary(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="全体学生冲突扫描耗时对比（合成数据）")
+    parser.add_argument("--students", type=int, default=5000)
+    parser.add_argument("--knowledge-points", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--part-size", type=int, default=500, help="列式输出每个分片的学生数")
+    args = parser.parse_args()
+    print(json.dumps(run_scan_benchmark(args.students, args.knowledge_points, args.seed, args.part_size),
+                     ensure_ascii=False, indent=2))
@@ -0,0 +1,246 @@
+# conflict_rules.py
+"""冲突规则注册表
+设计意图：冲突规则原先是协调模块里写死的字典，新增规则要改核心循环，也无从得知线上哪些规则命中多、哪些解决策略耗时长。
+这里每条规则声明 检测函数、解决策略、优先级、依赖规则 与 受影响的特征分组，注册表据此给出默认处理顺序
+（满足依赖的前提下按优先级，同优先级按注册顺序）；冲突处理循环统一通过注册表调用检测/解决，
+注册表按规则累计调用次数、命中次数、失败次数与耗时，供 /metrics 导出；
+检测耗时不含规则首次读取特征时的特征提取，提取耗时按特征分组单独统计。
+"""
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional
+import heapq
+import threading
+import time
+
+# 检测函数：detect(features) -> bool；解决策略：resolve(assessment, plan, features) -> 新规划
+DetectFunc = Callable[[Any], bool]
+ResolveFunc = Callable[[Dict[str, Any], Dict[str, Any], Any], Dict[str, Any]]
+
+
+class ConflictRule:
+    """单条冲突规则"""
+    __slots__ = ("name", "detect", "resolve", "priority", "depends_on", "affects")
+
+    def __init__(self, name: str, detect: DetectFunc, resolve: ResolveFunc, priority: int,
+                 depends_on: Iterable[str], affects: Iterable[str]):
+        self.name = name
+        self.detect = detect
+        self.resolve = resolve
+        self.priority = priority
+        self.depends_on = tuple(depends_on)  # 须先于本规则处理的规则
+        self.affects = tuple(affects)        # 解决策略会改变的特征分组
+
+
+class ConflictRuleRegistry:
+    """冲突规则注册表（线程安全；统计为进程内累计值）"""
+
+    def __init__(self, record_stats: bool = True):
+        """
+        Args:
+            record_stats: 是否累计统计（without_stats()生成的副本为False，用于假设性评估）
+        """
+        self._rules: Dict[str, ConflictRule] = {}
+        self._order: Optional[List[str]] = None
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._feature_stats: Dict[str, Dict[str, float]] = {}
+        self.record_stats = record_stats
+
+    def without_stats(self) -> "ConflictRuleRegistry":
+        """规则相同但不累计统计的副本（如评估多个候选解决顺序，避免假设性调用计入线上统计）"""
+        scratch = ConflictRuleRegistry(record_stats=False)
+        with self._lock:
+            scratch._rules = dict(self._rules)
+            scratch._order = list(self._order) if self._order is not None else None
+        return scratch
+
+    # -------------------------- 注册 --------------------------
+    def register(self, name: str, detect: DetectFunc, resolve: ResolveFunc, priority: int = 100,
+                 depends_on: Iterable[str] = (), affects: Iterable[str] = ("tasks",),
+                 replace: bool = False) -> ConflictRule:
+        """注册规则（priority越小越先处理；depends_on中的规则必须已注册）"""
+        depends_on = tuple(depends_on)
+        with self._lock:
+            if name in self._rules and not replace:
+                raise ValueError(f"冲突规则{name}已注册")
+            missing = [dep for dep in depends_on if dep not in self._rules]
+            if missing:
+                raise ValueError(f"冲突规则{name}依赖的规则未注册：{missing}")
+            rule = ConflictRule(name, detect, resolve, priority, depends_on, affects)
+            previous = self._rules.get(name)
+            self._rules[name] = rule
+            try:
+                self._order = self._topological_order()
+            except ValueError:
+                # 替换规则引入循环依赖：恢复原规则
+                if previous is None:
+                    del self._rules[name]
+                else:
+                    self._rules[name] = previous
+                raise
+            self._stats.setdefault(name, _empty_stats())
+        return rule
+
+    def rule(self, name: str, detect: DetectFunc, priority: int = 100, depends_on: Iterable[str] = (),
+             affects: Iterable[str] = ("tasks",)) -> Callable[[ResolveFunc], ResolveFunc]:
+        """装饰器形式注册：被装饰函数作为解决策略
+            @CONFLICT_RULES.rule("overload", detect=lambda f: f.first_week_hours > 20, priority=60)
+            def resolve_overload(assessment, plan, features): ...
+        """
+        def decorator(resolve: ResolveFunc) -> ResolveFunc:
+            self.register(name, detect, resolve, priority, depends_on, affects)
+            return resolve
+        return decorator
+
+    def unregister(self, name: str) -> None:
+        with self._lock:
+            dependents = [rule.name for rule in self._rules.values() if name in rule.depends_on]
+            if dependents:
+                raise ValueError(f"冲突规则{name}被以下规则依赖，无法移除：{dependents}")
+            del self._rules[name]
+            self._order = None
+
+    # -------------------------- 顺序 --------------------------
+    def ordered_names(self) -> List[str]:
+        """默认处理顺序：依赖在前，其余按 (优先级, 注册顺序)"""
+        with self._lock:
+            if self._order is None:
+                self._order = self._topological_order()
+            return list(self._order)
+
+    def _topological_order(self) -> List[str]:
+        rank = {name: (rule.priority, index) for index, (name, rule) in enumerate(self._rules.items())}
+        pending = {name: set(rule.depends_on) for name, rule in self._rules.items()}
+        ready = [(rank[name], name) for name, deps in pending.items() if not deps]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            _, name = heapq.heappop(ready)
+            order.append(name)
+            for other, deps in pending.items():
+                if name in deps:
+                    deps.discard(name)
+                    if not deps:
+                        heapq.heappush(ready, (rank[other], other))
+        if len(order) < len(self._rules):
+            raise ValueError(f"冲突规则存在循环依赖：{sorted(set(self._rules) - set(order))}")
+        return order
+
+    def respects_dependencies(self, order: Iterable[str]) -> bool:
+        """给定顺序中，每条规则的依赖（若也在该顺序中）是否都排在它前面"""
+        order = list(order)
+        position = {name: index for index, name in enumerate(order)}
+        return all(position.get(dep, -1) < position[name]
+                   for name in order for dep in self._rules[name].depends_on if dep in position)
+
+    def __getitem__(self, name: str) -> ConflictRule:
+        return self._rules[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._rules
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.ordered_names())
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    # -------------------------- 计时调用 --------------------------
+    def detect(self, name: str, features: Any) -> bool:
+        """执行检测并计入统计（检测抛出的异常原样抛出）
+        特征带有按分组累计的提取耗时（extract_ms）时，本次检测触发的特征提取从检测耗时中扣除并单独统计
+        """
+        extract_before = dict(getattr(features, "extract_ms", None) or {})
+        start = time.perf_counter()
+        hit = bool(self._rules[name].detect(features))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if not self.record_stats:
+            return hit
+        extracted_ms = 0.0
+        for group, total_ms in (getattr(features, "extract_ms", None) or {}).items():
+            delta = total_ms - extract_before.get(group, 0.0)
+            if delta > 0:
+                extracted_ms += delta
+                self._record_feature(group, delta)
+        self._record(name, "detect", max(0.0, elapsed_ms - extracted_ms), hit=hit)
+        return hit
+
+    def resolve(self, name: str, assessment: Dict[str, Any], plan: Dict[str, Any], features: Any) -> Dict[str, Any]:
+        """执行解决策略并计入统计（失败计数后原样抛出异常）"""
+        start = time.perf_counter()
+        try:
+            result = self._rules[name].resolve(assessment, plan, features)
+        except Exception:
+            if self.record_stats:
+                self._record(name, "resolve", (time.perf_counter() - start) * 1000, failed=True)
+            raise
+        if self.record_stats:
+            self._record(name, "resolve", (time.perf_counter() - start) * 1000)
+        return result
+
+    def _record_feature(self, group: str, elapsed_ms: float) -> None:
+        with self._lock:
+            entry = self._feature_stats.setdefault(group, {"extract_calls": 0, "extract_ms": 0.0})
+            entry["extract_calls"] += 1
+            entry["extract_ms"] += elapsed_ms
+
+    def _record(self, name: str, phase: str, elapsed_ms: float, hit: bool = False, failed: bool = False) -> None:
+        with self._lock:
+            entry = self._stats.setdefault(name, _empty_stats())
+            entry[f"{phase}_calls"] += 1
+            entry[f"{phase}_ms"] += elapsed_ms
+            entry[f"{phase}_max_ms"] = max(entry[f"{phase}_max_ms"], elapsed_ms)
+            if hit:
+                entry["hits"] += 1
+            if failed:
+                entry["resolve_failures"] += 1
+
+    # -------------------------- 统计导出 --------------------------
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """按规则返回累计统计（含命中率与平均耗时），按解决策略总耗时降序"""
+        with self._lock:
+            stats = {}
+            for name, entry in self._stats.items():
+                row = {key: round(value, 3) if isinstance(value, float) else value for key, value in entry.items()}
+                row["hit_rate"] = round(entry["hits"] / entry["detect_calls"], 4) if entry["detect_calls"] else 0.0
+                for phase in ("detect", "resolve"):
+                    calls = entry[f"{phase}_calls"]
+                    row[f"{phase}_avg_ms"] = round(entry[f"{phase}_ms"] / calls, 4) if calls else 0.0
+                stats[name] = row
+        return dict(sorted(stats.items(), key=lambda kv: kv[1]["resolve_ms"], reverse=True))
+
+    def get_feature_stats(self) -> Dict[str, Dict[str, float]]:
+        """按特征分组返回检测时触发的特征提取次数与耗时"""
+        with self._lock:
+            return {group: {"extract_calls": entry["extract_calls"], "extract_ms": round(entry["extract_ms"], 3)}
+                    for group, entry in self._feature_stats.items()}
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = {name: _empty_stats() for name in self._rules}
+            self._feature_stats = {}
+
+    def render_prometheus(self) -> str:
+        lines = ["# HELP edu_conflict_rule_events_total Conflict rule detect calls, hits, resolve calls and failures",
+                 "# TYPE edu_conflict_rule_events_total counter"]
+        stats = self.get_stats()
+        for name, entry in sorted(stats.items()):
+            for event in ("detect_calls", "hits", "resolve_calls", "resolve_failures"):
+                lines.append(f'edu_conflict_rule_events_total{{rule="{name}",event="{event}"}} {entry[event]}')
+        lines += ["# HELP edu_conflict_rule_milliseconds Conflict rule detect/resolve durations",
+                  "# TYPE edu_conflict_rule_milliseconds summary"]
+        for name, entry in sorted(stats.items()):
+            for phase in ("detect", "resolve"):
+                labels = f'rule="{name}",phase="{phase}"'
+                lines.append(f'edu_conflict_rule_milliseconds_sum{{{labels}}} {entry[f"{phase}_ms"]:.3f}')
+                lines.append(f'edu_conflict_rule_milliseconds_count{{{labels}}} {entry[f"{phase}_calls"]}')
+        lines += ["# HELP edu_conflict_feature_extract_milliseconds Conflict feature extraction durations by group",
+                  "# TYPE edu_conflict_feature_extract_milliseconds summary"]
+        for group, entry in sorted(self.get_feature_stats().items()):
+            lines.append(f'edu_conflict_feature_extract_milliseconds_sum{{group="{group}"}} {entry["extract_ms"]:.3f}')
+            lines.append(f'edu_conflict_feature_extract_milliseconds_count{{group="{group}"}} {entry["extract_calls"]}')
+        return "\n".join(lines) + "\n"
+
+
+def _empty_stats() -> Dict[str, float]:
+    return {"detect_calls": 0, "hits": 0, "detect_ms": 0.0, "detect_max_ms": 0.0,
+            "resolve_calls": 0, "resolve_failures": 0, "resolve_ms": 0.0, "resolve_max_ms": 0.0}
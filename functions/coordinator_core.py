@@ -1,5 +1,19 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterable, Iterator, Optional
 from datetime import datetime, timedelta
+from itertools import permutations
+import threading
+import time
+import sys
+import os
+
+# 添加项目路径
+current_path = os.path.abspath(__file__)
+parent_path = os.path.dirname(os.path.dirname(current_path))
+sys.path.append(parent_path)
+
+from functions.indexed_plan import IndexedPlan
+from functions.plan_snapshot import PlanSnapshots
+from functions.conflict_rules import ConflictRuleRegistry
 
 # -------------------------- 评估结果整合函数 --------------------------
 def integrate_assessment_result(assessment: Dict[str, Any]) -> Dict[str, Any]:
@@ -29,19 +43,24 @@ def get_progress_lag(plan: Dict[str, Any]) -> int:
     ) or 1  # 避免除以0
     return int(total_unfinished // weekly_avg)
 
-def check_resource_ability_mismatch(assessment: Dict[str, Any], plan: Dict[str, Any]) -> bool:
+def check_resource_ability_mismatch(assessment: Dict[str, Any], plan: Dict[str, Any],
+                                    resources: Optional["ResourceResolver"] = None) -> bool:
     """检测资源与能力/偏好不匹配"""
     student_ability = assessment["ability_level"].get("comprehensive", 3)
     learning_preference = assessment["learning_habits"].get("preference", "text")
+    resources = resources or ResourceResolver()
     
     for resource_id in plan.get("resource_mapping", {}).values():
-        resource = query_resource_detail(resource_id)
-        if (resource["difficulty_level"] > student_ability + 1) or \
-           (learning_preference == "visual" and resource["format"] == "text") or \
-           (learning_preference == "auditory" and resource["format"] == "video"):
+        if is_resource_mismatched(resources.detail(resource_id), student_ability, learning_preference):
             return True
     return False
 
+def is_resource_mismatched(resource: Dict[str, Any], student_ability: int, learning_preference: str) -> bool:
+    """单个资源是否与能力/偏好不匹配"""
+    return (resource["difficulty_level"] > student_ability + 1) or \
+           (learning_preference == "visual" and resource["format"] == "text") or \
+           (learning_preference == "auditory" and resource["format"] == "video")
+
 def check_role_goal_mismatch(assessment: Dict[str, Any], plan: Dict[str, Any]) -> bool:
     """检测多角色目标冲突"""
     role_goals = assessment.get("role_goals", {})
@@ -70,18 +89,121 @@ def check_data_inconsistency(assessment: Dict[str, Any], plan: Dict[str, Any]) -
             return True
     return False
 
+# -------------------------- 冲突检测特征提取 --------------------------
+HARD_TASK_KEYWORDS = ("难题", "压轴题")
+FEATURE_GROUPS = ("assessment", "tasks", "resources")
+
+class ConflictFeatures:
+    """冲突检测特征（规则只对特征做判断，不再各自遍历规划）
+    特征按来源分三组，按需计算、计算后缓存：
+    - assessment：薄弱知识点、能力/偏好、多角色目标冲突、多源数据差值（解决策略不修改评估结果，只计算一次）
+    - tasks：一次遍历全部任务得到 难题/压轴题标记、未完成学时、首周学时（进而得到进度滞后周数）
+    - resources：资源映射中是否存在能力/偏好不匹配的资源（资源详情由ResourceResolver批量预取并备忘）
+    解决策略执行后调用 invalidate(受影响的分组)，只有这些分组在下次读取时重算。
+    """
+
+    def __init__(self, assessment: Dict[str, Any], plan: Dict[str, Any],
+                 resources: Optional["ResourceResolver"] = None):
+        self.assessment = assessment
+        self.plan = plan
+        self.resources = resources or ResourceResolver()
+        self._values: Dict[str, Any] = {}
+        self._dirty = set(FEATURE_GROUPS)
+        self.extract_counts = {group: 0 for group in FEATURE_GROUPS}  # 各分组实际计算次数
+        self.extract_ms = {group: 0.0 for group in FEATURE_GROUPS}    # 各分组累计计算耗时（毫秒）
+
+    def invalidate(self, plan: Dict[str, Any], groups: Iterable[str]) -> None:
+        """规划被解决策略修改后调用：更新规划引用，标记受影响的特征分组待重算"""
+        self.plan = plan
+        self._dirty.update(groups)
+
+    def _get(self, group: str, name: str) -> Any:
+        if group in self._dirty:
+            start = time.perf_counter()
+            getattr(self, f"_extract_{group}")()
+            self.extract_ms[group] += (time.perf_counter() - start) * 1000
+            self._dirty.discard(group)
+            self.extract_counts[group] += 1
+        return self._values[name]
+
+    # -------------------------- 各分组提取 --------------------------
+    def _extract_assessment(self) -> None:
+        assessment = self.assessment
+        multi_source = assessment.get("multi_source_data", {})
+        spreads = {}
+        for kp in assessment["knowledge_mastery"].keys():
+            scores = [multi_source.get(source, {}).get(kp, 0) for source in ("exam", "homework", "class_interaction")]
+            spreads[kp] = max(scores) - min(scores)
+        self._values.update({
+            "has_weak_point": any(v < 60 for v in assessment["knowledge_mastery"].values()),
+            "student_ability": assessment["ability_level"].get("comprehensive", 3),
+            "learning_preference": assessment["learning_habits"].get("preference", "text"),
+            "role_goal_conflict": check_role_goal_mismatch(assessment, self.plan),
+            "source_spreads": spreads,
+            "data_inconsistent": any(spread > 30 for spread in spreads.values()),
+        })
+
+    def _extract_tasks(self) -> None:
+        has_hard_task, unfinished_hours, first_week_hours = False, 0, 0
+        hard_a, hard_b = HARD_TASK_KEYWORDS
+        weeks = self.plan.get("weekly_tasks", [])
+        if weeks:
+            first_week_hours = sum(task["duration_hour"] for task in weeks[0].get("tasks", []))
+        for week in weeks:
+            for task in week.get("tasks", []):
+                if task.get("completion_rate", 0) < 100:
+                    unfinished_hours += task["duration_hour"]
+                if not has_hard_task:
+                    content = task["content"]
+                    has_hard_task = hard_a in content or hard_b in content
+        self._values.update({
+            "has_hard_task": has_hard_task,
+            "unfinished_hours": unfinished_hours,
+            "first_week_hours": first_week_hours,
+            # 与get_progress_lag一致：首周学时为0时按1计
+            "progress_lag": int(unfinished_hours // (first_week_hours or 1)),
+        })
+
+    def _extract_resources(self) -> None:
+        ability, preference = self.student_ability, self.learning_preference
+        mismatch = False
+        for resource_id in self.plan.get("resource_mapping", {}).values():
+            if is_resource_mismatched(self.resources.detail(resource_id), ability, preference):
+                mismatch = True
+                break
+        self._values["resource_mismatch"] = mismatch
+
+    # -------------------------- 特征读取 --------------------------
+    has_weak_point = property(lambda self: self._get("assessment", "has_weak_point"))
+    student_ability = property(lambda self: self._get("assessment", "student_ability"))
+    learning_preference = property(lambda self: self._get("assessment", "learning_preference"))
+    role_goal_conflict = property(lambda self: self._get("assessment", "role_goal_conflict"))
+    source_spreads = property(lambda self: self._get("assessment", "source_spreads"))
+    data_inconsistent = property(lambda self: self._get("assessment", "data_inconsistent"))
+    has_hard_task = property(lambda self: self._get("tasks", "has_hard_task"))
+    unfinished_hours = property(lambda self: self._get("tasks", "unfinished_hours"))
+    first_week_hours = property(lambda self: self._get("tasks", "first_week_hours"))
+    progress_lag = property(lambda self: self._get("tasks", "progress_lag"))
+    resource_mismatch = property(lambda self: self._get("resources", "resource_mismatch"))
+
 # -------------------------- 冲突解决策略函数 --------------------------
-def resolve_weak_hard_conflict(assessment: Dict[str, Any], plan: Dict[str, Any]) -> Dict[str, Any]:
+# 各解决策略不修改传入的规划：基于IndexedPlan.evolve写时复制，返回与原规划共享未修改周/任务的新版本
+def resolve_weak_hard_conflict(assessment: Dict[str, Any], plan: Dict[str, Any],
+                               resources: Optional["ResourceResolver"] = None) -> Dict[str, Any]:
     """解决基础薄弱vs高难度规划冲突"""
     weak_points = assessment["error_points"]
     if not weak_points:
         return plan
+    resources = resources or ResourceResolver()
     
-    for weekly_task in plan.get("weekly_tasks", []):
+    indexed = IndexedPlan.evolve(plan)
+    for idx, weekly_task in enumerate(indexed.weeks):
+        if not any("难题" in task["content"] or "压轴题" in task["content"] for task in weekly_task.get("tasks", [])):
+            continue  # 无需替换的周保持共享
         new_tasks = []
         for task in weekly_task.get("tasks", []):
             if "难题" in task["content"] or "压轴题" in task["content"]:
-                base_resource = query_base_resource(weak_points[0])
+                base_resource = resources.base(weak_points[0])
                 new_task = {
                     "task_id": task["task_id"].replace("hard", "base"),
                     "content": f"学习{weak_points[0]}基础知识点（资源ID：{base_resource}）",
@@ -91,64 +213,67 @@ def resolve_weak_hard_conflict(assessment: Dict[str, Any], plan: Dict[str, Any])
                 new_tasks.append(new_task)
             else:
                 new_tasks.append(task)
-        weekly_task["tasks"] = new_tasks
+        indexed.replace_week_tasks(idx, new_tasks)
     
-    if plan.get("monthly_plans"):
-        plan["monthly_plans"][0]["goal"] = f"延期1周：{plan['monthly_plans'][0]['goal']}"
-    return plan
+    if indexed.get("monthly_plans"):
+        first_month = indexed.edit_monthly_plan(0)
+        first_month["goal"] = f"延期1周：{first_month['goal']}"
+    return indexed.to_dict()
 
-def resolve_progress_plan_conflict(plan: Dict[str, Any]) -> Dict[str, Any]:
-    """解决进度滞后vs规划周期冲突"""
-    lag_weeks = get_progress_lag(plan)
+def resolve_progress_plan_conflict(plan: Dict[str, Any], lag_weeks: Optional[int] = None) -> Dict[str, Any]:
+    """解决进度滞后vs规划周期冲突（lag_weeks为已算出的滞后周数，未传入时重新计算）"""
+    if lag_weeks is None:
+        lag_weeks = get_progress_lag(plan)
     if lag_weeks <= 0:
         return plan
     
     # 提取未完成任务
-    unfinished_tasks = [
-        t for week in plan.get("weekly_tasks", [])
-        for t in week.get("tasks", []) if t.get("completion_rate", 0) < 100
-    ]
+    indexed = IndexedPlan.evolve(plan)
+    unfinished_tasks = [t for _, t in indexed.iter_tasks() if t.get("completion_rate", 0) < 100]
     
-    # 插入补漏周
-    for i in range(lag_weeks):
-        supplement_week = {
+    # 插入补漏周（一次性插入到规划开头；滞后周数可与规划周数同量级，逐个insert为平方开销）
+    indexed.insert_weeks(0, [
+        {
             "week": f"补漏周{i+1}",
             "tasks": [
                 {**task, "task_id": f"supplement_{task['task_id']}"}
                 for task in unfinished_tasks[i::lag_weeks]
             ]
         }
-        plan["weekly_tasks"].insert(i, supplement_week)
+        for i in range(lag_weeks)
+    ])
     
     # 顺延月度截止日期
-    for idx, monthly_plan in enumerate(plan.get("monthly_plans", [])):
-        plan["monthly_plans"][idx]["deadline"] = postpone_date(monthly_plan["deadline"], lag_weeks)
-    return plan
+    for idx in range(len(indexed.get("monthly_plans", []))):
+        monthly_plan = indexed.edit_monthly_plan(idx)
+        monthly_plan["deadline"] = postpone_date(monthly_plan["deadline"], lag_weeks)
+    return indexed.to_dict()
 
-def resolve_resource_ability_conflict(assessment: Dict[str, Any], plan: Dict[str, Any]) -> Dict[str, Any]:
+def resolve_resource_ability_conflict(assessment: Dict[str, Any], plan: Dict[str, Any],
+                                      resources: Optional["ResourceResolver"] = None) -> Dict[str, Any]:
     """解决资源与能力/偏好不匹配冲突"""
     student_ability = assessment["ability_level"].get("comprehensive", 3)
     learning_preference = assessment["learning_habits"].get("preference", "text")
+    resources = resources or ResourceResolver()
     
+    indexed = IndexedPlan.evolve(plan)
     new_resource_mapping = {}
-    for task_id, resource_id in plan.get("resource_mapping", {}).items():
-        old_resource = query_resource_detail(resource_id)
-        new_resource = query_matched_resource(
+    for task_id, resource_id in indexed["resource_mapping"].items():
+        old_resource = resources.detail(resource_id)
+        new_resource = resources.matched(
             old_resource["knowledge_point"],
             student_ability,
             learning_preference
         )
         new_resource_mapping[task_id] = new_resource["resource_id"]
         
-        # 更新任务内容
-        for week in plan.get("weekly_tasks", []):
-            for task in week.get("tasks", []):
-                if task["task_id"] == task_id:
-                    task["content"] = task["content"].replace(resource_id, new_resource["resource_id"])
-                    task["completion_standard"] = new_resource["completion_standard"]
+        # 更新任务内容（按任务ID索引定位，不再为每个映射项扫描全部任务）
+        for task in indexed.edit_tasks(task_id):
+            task["content"] = task["content"].replace(resource_id, new_resource["resource_id"])
+            task["completion_standard"] = new_resource["completion_standard"]
     
-    plan["resource_mapping"] = new_resource_mapping
-    return plan
+    indexed.replace_resource_mapping(new_resource_mapping)
+    return indexed.to_dict()
 
 def resolve_role_goal_conflict(assessment: Dict[str, Any], plan: Dict[str, Any]) -> Dict[str, Any]:
     """解决多角色目标冲突"""
@@ -173,20 +298,23 @@ def resolve_role_goal_conflict(assessment: Dict[str, Any], plan: Dict[str, Any])
     )
     
     # 更新规划目标
-    plan["long_term_goal"] = reconstruct_goal(final_keywords, plan.get("long_term_goal", ""))
+    indexed = IndexedPlan.evolve(plan)
+    indexed["long_term_goal"] = reconstruct_goal(final_keywords, indexed.get("long_term_goal", ""))
     
-    # 插入融合任务
-    for week in plan.get("weekly_tasks", []):
-        week["tasks"].insert(0, {
+    # 插入融合任务（每周都被修改：复制周与任务列表，任务本身仍共享）
+    for idx, week in enumerate(indexed.weeks):
+        indexed.insert_task(idx, {
             "task_id": f"fusion_goal_task_{week['week']}",
             "content": f"融合多角色目标：{', '.join(final_keywords[:3])}（优先完成）",
             "duration_hour": 2,
             "completion_standard": "完成对应资源学习+1道综合题"
-        })
-    return plan
+        }, position=0)
+    return indexed.to_dict()
 
-def resolve_data_conflict(assessment: Dict[str, Any], plan: Dict[str, Any]) -> Dict[str, Any]:
+def resolve_data_conflict(assessment: Dict[str, Any], plan: Dict[str, Any],
+                          resources: Optional["ResourceResolver"] = None) -> Dict[str, Any]:
     """解决多源数据矛盾冲突"""
+    resources = resources or ResourceResolver()
     knowledge_points = assessment["knowledge_mastery"].keys()
     conflicting_kps = []
     
@@ -207,27 +335,112 @@ def resolve_data_conflict(assessment: Dict[str, Any], plan: Dict[str, Any]) -> D
             "content": f"补充评估：{kp}知识点（数据矛盾验证）",
             "duration_hour": 1.5,
             "completion_standard": "8道验证题正确率≥70%（确认真实掌握度）",
-            "resource_id": query_verification_resource(kp)
+            "resource_id": resources.verification(kp)
         }
         for kp, _ in conflicting_kps
     ]
-    plan["weekly_tasks"].insert(0, {
+    indexed = IndexedPlan.evolve(plan)
+    indexed.insert_weeks(0, [{
         "week": "补充评估周",
         "tasks": supplement_tasks
-    })
+    }])
     
-    # 临时调整任务难度（修正切片语法错误）
-    for week in plan.get("weekly_tasks", [])[1:]:  # 跳过补充评估周
-        for task in week.get("tasks", []):
+    # 临时调整任务难度（只复制内容实际变化的任务）
+    for idx in range(1, len(indexed.weeks)):  # 跳过补充评估周
+        for pos, task in enumerate(indexed.weeks[idx].get("tasks", [])):
+            content = task["content"]
             for kp, true_mastery in conflicting_kps:
-                if kp in task["content"]:
+                if kp in content:
                     if true_mastery < 60:
-                        task["content"] = task["content"].replace("进阶", "基础").replace("难题", "基础题")
+                        content = content.replace("进阶", "基础").replace("难题", "基础题")
                     else:
-                        task["content"] = task["content"].replace("基础", "进阶")
-    return plan
+                        content = content.replace("基础", "进阶")
+            if content != task["content"]:
+                indexed.edit_task_at(idx, pos)["content"] = content
+    return indexed.to_dict()
+
+# -------------------------- 资源批量查询 --------------------------
+class ResourceResolver:
+    """一轮冲突处理内的资源查询
+    prefetch 用一次 DatabaseManagerAgent.lookup_resources 批量取回规划中全部资源ID及相关知识点的资源，
+    之后按资源ID/知识点备忘，同一资源只查询一次；冲突处理耗时只与规划中的资源数相关。
+    未接入数据库、或资源ID/知识点在资源库中不存在时，退回按资源ID推断的规则（query_resource_detail等）。
+    """
+
+    def __init__(self, db_agent: Optional[Any] = None):
+        self.db_agent = db_agent
+        self._details: Dict[str, Dict[str, Any]] = {}
+        self._by_kp: Dict[str, List[Dict[str, Any]]] = {}
+        self._matched: Dict[tuple, Dict[str, Any]] = {}
+        self._missing_ids: set = set()
+        self._lock = threading.Lock()  # 查询器可被多个线程共享
+        self.round_trips = 0  # 实际访问数据库的次数
+
+    def prefetch(self, resource_ids: Iterable[str] = (), knowledge_points: Iterable[str] = ()) -> None:
+        """批量预取（已备忘的资源ID/知识点不再查询）"""
+        if self.db_agent is None:
+            return
+        with self._lock:
+            ids = [rid for rid in dict.fromkeys(resource_ids) if rid not in self._details and rid not in self._missing_ids]
+            kps = [kp for kp in dict.fromkeys(knowledge_points) if kp not in self._by_kp]
+            if not ids and not kps:
+                return
+            result = self.db_agent.lookup_resources(resource_ids=ids, knowledge_points=kps)
+            self.round_trips += 1
+            self._details.update(result["by_id"])
+            self._missing_ids.update(rid for rid in ids if rid not in result["by_id"])
+            for kp, kp_resources in result["by_knowledge_point"].items():
+                self._by_kp.setdefault(kp, kp_resources)
+            for kp in kps:
+                self._by_kp.setdefault(kp, [])
+
+    def _candidates(self, knowledge_point: str) -> List[Dict[str, Any]]:
+        if knowledge_point not in self._by_kp:
+            self.prefetch(knowledge_points=[knowledge_point])
+        return self._by_kp.get(knowledge_point, [])
+
+    def detail(self, resource_id: str) -> Dict[str, Any]:
+        """资源详情"""
+        detail = self._details.get(resource_id)
+        if detail is None:
+            self.prefetch(resource_ids=[resource_id])
+            detail = self._details.get(resource_id)
+            if detail is None:
+                detail = self._details[resource_id] = query_resource_detail(resource_id)
+        return detail
+
+    def matched(self, knowledge_point: str, target_ability: int, preferred_format: str) -> Dict[str, Any]:
+        """与能力/偏好匹配的资源：该知识点下不冲突的资源中难度最接近能力等级者（同等接近时优先偏好格式）"""
+        key = (knowledge_point, target_ability, preferred_format)
+        resource = self._matched.get(key)
+        if resource is None:
+            candidates = [r for r in self._candidates(knowledge_point)
+                          if not is_resource_mismatched(r, target_ability, preferred_format)]
+            if candidates:
+                resource = min(candidates, key=lambda r: (abs(r["difficulty_level"] - target_ability),
+                                                          r["format"] != preferred_format))
+            else:
+                resource = query_matched_resource(knowledge_point, target_ability, preferred_format)
+            self._matched[key] = resource
+            self._details.setdefault(resource["resource_id"], resource)
+        return resource
+
+    def base(self, knowledge_point: str) -> str:
+        """基础资源ID：该知识点难度最低的资源"""
+        candidates = self._candidates(knowledge_point)
+        if not candidates:
+            return query_base_resource(knowledge_point)
+        return min(candidates, key=lambda r: r["difficulty_level"])["resource_id"]
+
+    def verification(self, knowledge_point: str) -> str:
+        """验证资源ID：该知识点区分度最高（错误率最接近50%）的资源"""
+        candidates = self._candidates(knowledge_point)
+        if not candidates:
+            return query_verification_resource(knowledge_point)
+        return min(candidates, key=lambda r: abs(r.get("error_rate", 0.5) - 0.5))["resource_id"]
 
 # -------------------------- 通用辅助函数 --------------------------
+# 以下query_*为未接入资源库时的回退规则（按资源ID/知识点推断）
 def query_base_resource(knowledge_point: str) -> str:
     """查询基础资源"""
     return f"base_{knowledge_point}_r{hash(knowledge_point)%1000}"
@@ -283,57 +496,206 @@ def postpone_date(date_str: str, weeks: int) -> str:
     return (date + timedelta(weeks=weeks)).strftime("%Y-%m-%d")
 
 # -------------------------- 冲突检测与解决主函数 --------------------------
-def detect_and_resolve_conflicts(assessment: Dict[str, Any], plan: Dict[str, Any]) -> Dict[str, Any]:
-    """自动化冲突检测与解决"""
-    # 定义冲突规则映射（修正lambda换行语法）
-    conflict_rules = {
-        "weak_vs_hard": {
-            "detect": lambda a, p: (any(v < 60 for v in a["knowledge_mastery"].values()) and
-                                   any("难题" in t["content"] or "压轴题" in t["content"] 
-                                       for week in p.get("weekly_tasks", []) 
-                                       for t in week.get("tasks", []))),
-            "resolve": resolve_weak_hard_conflict
-        },
-        "progress_vs_plan": {
-            "detect": lambda a, p: get_progress_lag(p) > 2,
-            "resolve": resolve_progress_plan_conflict
-        },
-        "resource_vs_ability": {
-            "detect": check_resource_ability_mismatch,
-            "resolve": resolve_resource_ability_conflict
-        },
-        "role_goal_conflict": {
-            "detect": check_role_goal_mismatch,
-            "resolve": resolve_role_goal_conflict
-        },
-        "data_conflict": {
-            "detect": check_data_inconsistency,
-            "resolve": resolve_data_conflict
-        }
-    }
-    
+# 内置冲突规则（优先级即默认解决顺序）：detect为特征上的判断，affects为解决策略会改变的特征分组
+# 新规则通过 CONFLICT_RULES.register / @CONFLICT_RULES.rule 注册，无需修改处理循环
+CONFLICT_RULES = ConflictRuleRegistry()
+CONFLICT_RULES.register(
+    "weak_vs_hard", priority=10, affects=("tasks",),
+    detect=lambda f: f.has_weak_point and f.has_hard_task,
+    resolve=lambda a, p, f: resolve_weak_hard_conflict(a, p, f.resources))
+CONFLICT_RULES.register(
+    "progress_vs_plan", priority=20, affects=("tasks",),
+    detect=lambda f: f.progress_lag > 2,
+    resolve=lambda a, p, f: resolve_progress_plan_conflict(p, f.progress_lag))
+CONFLICT_RULES.register(
+    "resource_vs_ability", priority=30, affects=("tasks", "resources"),
+    detect=lambda f: f.resource_mismatch,
+    resolve=lambda a, p, f: resolve_resource_ability_conflict(a, p, f.resources))
+CONFLICT_RULES.register(
+    "role_goal_conflict", priority=40, affects=("tasks",),
+    detect=lambda f: f.role_goal_conflict,
+    resolve=lambda a, p, f: resolve_role_goal_conflict(a, p))
+CONFLICT_RULES.register(
+    "data_conflict", priority=50, affects=("tasks",),
+    detect=lambda f: f.data_inconsistent,
+    resolve=lambda a, p, f: resolve_data_conflict(a, p, f.resources))
+
+def _prefetched_resolver(assessment: Dict[str, Any], plan: Dict[str, Any], db_agent: Optional[Any]) -> "ResourceResolver":
+    resources = ResourceResolver(db_agent)
+    resources.prefetch(
+        resource_ids=plan.get("resource_mapping", {}).values(),
+        knowledge_points=list(assessment.get("error_points", [])[:1]) + list(assessment.get("knowledge_mastery", {}).keys())
+    )
+    return resources
+
+def detect_and_resolve_conflicts(assessment: Dict[str, Any], plan: Dict[str, Any], db_agent: Optional[Any] = None,
+                                 order: Optional[List[str]] = None,
+                                 resources: Optional["ResourceResolver"] = None,
+                                 rules: Optional[ConflictRuleRegistry] = None) -> Dict[str, Any]:
+    """自动化冲突检测与解决（规则判断基于ConflictFeatures，解决策略只使其修改过的特征分组失效）
+    传入db_agent时资源查询走资源库：开始时一次批量预取规划中的资源与评估涉及的知识点
+    传入的规划不会被修改；每个解决策略生成一个结构共享的新版本并记录在 snapshots 中，
+    某个解决策略执行失败时回滚到上一版本继续处理其余冲突（记录状态为failed）
+    Args:
+        order: 冲突类型的处理顺序（默认按规则注册表给出的顺序；未列出的类型不处理）
+        resources: 已预取的资源查询器（多个候选顺序共享，避免重复查询）
+        rules: 冲突规则注册表（默认CONFLICT_RULES；检测/解决的调用次数、命中与耗时计入其统计）
+    """
     # 检测并解决冲突
     conflict_records = []
-    resolved_plan = plan.copy()
+    resolved_plan = plan
+    snapshots = PlanSnapshots(plan)
+    if resources is None:
+        resources = _prefetched_resolver(assessment, plan, db_agent)
+    features = ConflictFeatures(assessment, resolved_plan, resources)
+    rules = rules if rules is not None else CONFLICT_RULES
     
-    for conflict_type, rule in conflict_rules.items():
-        if rule["detect"](assessment, resolved_plan):
-            conflict_records.append({
+    for conflict_type in (order if order is not None else rules.ordered_names()):
+        if rules.detect(conflict_type, features):
+            record = {
                 "conflict_type": conflict_type,
                 "detected_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 "status": "resolved"
-            })
-            # 执行解决策略
-            if conflict_type in ["weak_vs_hard", "resource_vs_ability", "role_goal_conflict", "data_conflict"]:
-                resolved_plan = rule["resolve"](assessment, resolved_plan)
-            else:
-                resolved_plan = rule["resolve"](resolved_plan)
+            }
+            conflict_records.append(record)
+            # 执行解决策略，只重算受影响的特征
+            try:
+                resolved_plan = rules.resolve(conflict_type, assessment, resolved_plan, features)
+            except Exception as e:
+                # 上一版本未被修改，直接沿用即为回滚
+                print(f"⚠️ 冲突{conflict_type}解决失败，已回滚到上一版本规划：{str(e)}")
+                record.update({"status": "failed", "error": f"{type(e).__name__}: {e}"})
+                continue
+            snapshots.record(conflict_type, resolved_plan)
+            features.invalidate(resolved_plan, rules[conflict_type].affects)
     
     return {
         "resolved_plan": resolved_plan,
         "conflict_records": conflict_records,
-        "conflict_count": len(conflict_records)
+        "conflict_count": len(conflict_records),
+        "snapshots": snapshots
+    }
+
+# -------------------------- 解决顺序评估 --------------------------
+# 候选评分权重：覆盖率越高越好，总学时增幅与截止日期顺延越小越好
+DEFAULT_SCORE_WEIGHTS = {"coverage": 0.4, "early_coverage": 0.3, "hours": 0.2, "slip": 0.1}
+EARLY_WEEKS = 4  # 近期覆盖：前4周内安排了薄弱知识点
+
+def _total_hours(plan: Dict[str, Any]) -> float:
+    return sum(task.get("duration_hour", 0) for week in plan.get("weekly_tasks", []) for task in week.get("tasks", []))
+
+def score_resolved_plan(assessment: Dict[str, Any], base_plan: Dict[str, Any], plan: Dict[str, Any],
+                        weights: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """候选规划评分
+    - total_hours：总学时（相对原规划的增幅计入扣分）
+    - deadline_slip_weeks：月度截止日期相对原规划的最大顺延周数（每顺延4周扣满该项权重）
+    - weak_point_coverage / early_weak_point_coverage：薄弱知识点（错题知识点 + 掌握度<60）
+      在全部任务 / 前EARLY_WEEKS周任务中出现的比例
+    """
+    weights = {**DEFAULT_SCORE_WEIGHTS, **(weights or {})}
+    weak_points = list(dict.fromkeys(
+        list(assessment.get("error_points", [])) +
+        [kp for kp, value in assessment.get("knowledge_mastery", {}).items() if value < 60]
+    ))
+    weeks = plan.get("weekly_tasks", [])
+    all_content = "\n".join(task.get("content", "") for week in weeks for task in week.get("tasks", []))
+    early_content = "\n".join(task.get("content", "") for week in weeks[:EARLY_WEEKS] for task in week.get("tasks", []))
+    coverage = sum(kp in all_content for kp in weak_points) / len(weak_points) if weak_points else 1.0
+    early_coverage = sum(kp in early_content for kp in weak_points) / len(weak_points) if weak_points else 1.0
+
+    slip_days = 0
+    for old, new in zip(base_plan.get("monthly_plans", []), plan.get("monthly_plans", [])):
+        if old is not new and old.get("deadline") and new.get("deadline"):
+            delta = datetime.strptime(new["deadline"], "%Y-%m-%d") - datetime.strptime(old["deadline"], "%Y-%m-%d")
+            slip_days = max(slip_days, delta.days)
+    slip_weeks = slip_days / 7
+
+    base_hours, hours = _total_hours(base_plan), _total_hours(plan)
+    hours_increase = max(0.0, hours / base_hours - 1) if base_hours else 0.0
+    score = (weights["coverage"] * coverage + weights["early_coverage"] * early_coverage
+             - weights["hours"] * hours_increase - weights["slip"] * slip_weeks / 4)
+    return {
+        "score": round(score, 4),
+        "total_hours": round(hours, 2),
+        "hours_increase": round(hours_increase, 4),
+        "deadline_slip_weeks": round(slip_weeks, 2),
+        "weak_point_coverage": round(coverage, 4),
+        "early_weak_point_coverage": round(early_coverage, 4),
+    }
+
+def candidate_orders(assessment: Dict[str, Any], plan: Dict[str, Any], resources: "ResourceResolver",
+                     max_candidates: int = 24, rules: Optional[ConflictRuleRegistry] = None) -> List[List[str]]:
+    """候选解决顺序：原规划上已检测到的冲突类型的排列（违反规则依赖的排列跳过），
+    其余类型按默认顺序接在后面（它们可能在其他冲突解决后才出现）。
+    按首个处理的冲突类型分组轮流取候选（默认顺序排第一），截断到max_candidates时每种类型都有机会排在最前
+    """
+    rules = rules if rules is not None else CONFLICT_RULES
+    features = ConflictFeatures(assessment, plan, resources)
+    names = rules.ordered_names()
+    detected = [name for name in names if rules.detect(name, features)]
+    rest = [name for name in names if name not in detected]
+
+    def orders_starting_with(first: str) -> Iterator[List[str]]:
+        others = [name for name in detected if name != first]
+        orders = ([first] + list(perm) + rest for perm in permutations(others))
+        return (order for order in orders if rules.respects_dependencies(order))
+
+    groups = [orders_starting_with(first) for first in detected] or [iter([rest])]
+    candidates: List[List[str]] = []
+    while groups and len(candidates) < max_candidates:
+        for group in list(groups):
+            order = next(group, None)
+            if order is None:
+                groups.remove(group)
+                continue
+            candidates.append(order)
+            if len(candidates) >= max_candidates:
+                break
+    return candidates
+
+def search_resolution_orders(assessment: Dict[str, Any], plan: Dict[str, Any], db_agent: Optional[Any] = None,
+                             orders: Optional[List[List[str]]] = None, max_candidates: int = 24,
+                             weights: Optional[Dict[str, float]] = None,
+                             rules: Optional[ConflictRuleRegistry] = None) -> Dict[str, Any]:
+    """评估多个冲突解决顺序，返回得分最高的结果
+    各候选都从同一份原规划出发（解决策略写时复制，候选之间互不影响、无需深拷贝），共享一次预取的资源查询器。
+    资源预取后各候选都是纯Python计算，受GIL限制多线程并不会更快，因此依次执行（单个候选通常为毫秒级）。
+    候选评估使用不计统计的规则注册表副本，假设性的候选不计入线上规则的调用/命中/耗时统计。
+    Args:
+        orders: 自定义候选顺序（默认由candidate_orders生成）
+    Returns:
+        与detect_and_resolve_conflicts相同的结构（最优候选），另含 strategy_evaluation：
+        {"best_order", "candidates": [{"order", "score", 各指标, "duration_ms", "conflict_types"}], "total_ms"}
+    """
+    start = time.perf_counter()
+    rules = (rules if rules is not None else CONFLICT_RULES).without_stats()
+    resources = _prefetched_resolver(assessment, plan, db_agent)
+    orders = orders or candidate_orders(assessment, plan, resources, max_candidates, rules)
+
+    def evaluate(order: List[str]) -> Dict[str, Any]:
+        candidate_start = time.perf_counter()
+        result = detect_and_resolve_conflicts(assessment, plan, order=order, resources=resources, rules=rules)
+        metrics = score_resolved_plan(assessment, plan, result["resolved_plan"], weights)
+        return {
+            "order": order,
+            **metrics,
+            "conflict_types": [record["conflict_type"] for record in result["conflict_records"]],
+            "duration_ms": round((time.perf_counter() - candidate_start) * 1000, 2),
+            "_result": result,
+        }
+
+    candidates = [evaluate(order) for order in orders]
+
+    # 得分相同时保留靠前的候选（默认顺序排第一）
+    best = max(candidates, key=lambda c: c["score"])
+    result = dict(best["_result"])
+    result["strategy_evaluation"] = {
+        "best_order": best["order"],
+        "candidates": sorted(({k: v for k, v in c.items() if k != "_result"} for c in candidates),
+                             key=lambda c: c["score"], reverse=True),
+        "total_ms": round((time.perf_counter() - start) * 1000, 2),
     }
+    return result
 
 # -------------------------- 服务输出整合函数 --------------------------
 def integrate_service_output(assessment: Dict[str, Any], conflict_result: Dict[str, Any]) -> Dict[str, Any]:
@@ -353,9 +715,37 @@ def integrate_service_output(assessment: Dict[str, Any], conflict_result: Dict[s
         },
         "resolved_plan": conflict_result["resolved_plan"],
         "conflict_records": conflict_result["conflict_records"],
+        **({"strategy_evaluation": conflict_result["strategy_evaluation"]}
+           if "strategy_evaluation" in conflict_result else {}),
         "next_steps": [
             "按调整后的规划执行任务",
             "完成补充评估任务（如有）",
             "定期反馈任务完成情况以优化规划"
         ]
-    }
\ No newline at end of file
+    }
+
+# -------------------------- 功能测试 --------------------------
+def test_detect_and_resolve_conflicts_keeps_input():
+    """冲突解决不修改传入的规划与评估结果，解决后的规划为新版本"""
+    import copy
+    from agents.Agent_dbmanager import DatabaseManagerAgent
+    from functions.academic_assessment_core import get_default_assessment_result, integrate_assessment_result
+    from functions.academic_planning_core import generate_initial_plan
+
+    db_agent = DatabaseManagerAgent(data_path="x.csv")  # 数据集不存在时使用模拟数据
+    assessment = integrate_assessment_result(get_default_assessment_result("math"), "S1", "math", {})
+    plan = generate_initial_plan(assessment, "期末数学成绩提升至90分以上", "math", db_agent)
+    for week in plan["weekly_tasks"]:
+        for task in week["tasks"]:
+            task["completion_rate"] = 0  # 制造进度滞后，触发任务调整类冲突
+    plan_before, assessment_before = copy.deepcopy(plan), copy.deepcopy(assessment)
+
+    result = detect_and_resolve_conflicts(assessment, plan, db_agent, rules=CONFLICT_RULES.without_stats())
+    assert result["conflict_count"] >= 2
+    assert plan == plan_before and assessment == assessment_before
+    assert result["resolved_plan"] is not plan and result["resolved_plan"] != plan_before
+    print(f"✅ 冲突解决：处理{result['conflict_count']}个冲突，传入的规划与评估结果未被修改")
+
+
+if __name__ == "__main__":
+    test_detect_and_resolve_conflicts_keeps_input()
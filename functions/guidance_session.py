@@ -0,0 +1,256 @@
+# guidance_session.py
+"""多轮问题引导会话
+设计意图：第一轮追问时已算出的评估结果、场景化拆解和追问列表保存在会话中，
+后续轮次（携带inquiry_answers）直接复用，只需支付迁移化方案这一次LLM调用；
+会话空闲超时自动淘汰，并限制最大会话数（超出时淘汰最久未活跃的会话）控制内存占用。
+可选持久化到目录（每个会话一个JSON文件）：多个worker进程共用同一目录时，后续轮次落到任一worker都能恢复会话。
+"""
+from typing import Dict, List, Any, Optional
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+_SESSION_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+@dataclass
+class GuidanceSession:
+    """单个引导会话（保存第一轮的中间结果及每轮学生回答）"""
+    session_id: str
+    student_id: str
+    subject: str
+    question_desc: str
+    assessment: Dict[str, Any]
+    scenario_decomp: List[str]
+    inquiry_questions: List[str] = field(default_factory=list)
+    practice_resources: Optional[List[Dict[str, Any]]] = None  # 第一轮预取的练习资源
+    answer_history: List[List[str]] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    last_active: float = field(default_factory=time.time)  # 墙上时钟（持久化后跨进程比较）
+
+    def touch(self) -> None:
+        self.last_active = time.time()
+
+
+class GuidanceSessionStore:
+    """引导会话存储（空闲超时淘汰 + 最大会话数LRU淘汰，线程安全；可选按会话分文件持久化）"""
+
+    def __init__(self, idle_timeout_seconds: float = 1800, max_sessions: int = 1000,
+                 persist_path: Optional[str] = None, purge_interval_seconds: float = 10):
+        """
+        Args:
+            idle_timeout_seconds: 会话空闲超时（秒），超时后视为失效
+            max_sessions: 最大会话数，超出时淘汰最久未活跃的会话
+            persist_path: 持久化目录（None表示仅保存在内存中）；设置后会话读写都以目录中的文件为准
+            purge_interval_seconds: 持久化模式下新建会话时清理目录的最小间隔（按文件修改时间清理超时会话，
+                并删除最旧的文件使会话数不超过max_sessions；间隔内新建的会话可能暂时超出上限）
+        """
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self.max_sessions = max_sessions
+        self.persist_path = persist_path
+        self.purge_interval_seconds = purge_interval_seconds
+        self._last_sweep = float("-inf")
+        self._sessions: "OrderedDict[str, GuidanceSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"created": 0, "resumed": 0, "expired": 0, "evicted": 0}
+        if persist_path:
+            os.makedirs(persist_path, exist_ok=True)
+
+    def create(self, student_id: str, subject: str, question_desc: str, assessment: Dict[str, Any],
+               scenario_decomp: List[str], inquiry_questions: Optional[List[str]] = None,
+               practice_resources: Optional[List[Dict[str, Any]]] = None) -> GuidanceSession:
+        """新建会话（保存第一轮结果）"""
+        session = GuidanceSession(
+            session_id=uuid.uuid4().hex,
+            student_id=student_id,
+            subject=subject,
+            question_desc=question_desc,
+            assessment=assessment,
+            scenario_decomp=scenario_decomp,
+            inquiry_questions=list(inquiry_questions or []),
+            practice_resources=practice_resources
+        )
+        if self.persist_path:
+            self.save(session)
+            with self._lock:
+                self.stats["created"] += 1
+                sweep = time.monotonic() - self._last_sweep >= self.purge_interval_seconds
+                if sweep:
+                    self._last_sweep = time.monotonic()
+            if sweep:
+                self._sweep_persisted()
+            return session
+        with self._lock:
+            self._purge_expired_locked()
+            self._sessions[session.session_id] = session
+            self.stats["created"] += 1
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.stats["evicted"] += 1
+        return session
+
+    def get(self, session_id: str) -> Optional[GuidanceSession]:
+        """获取会话并刷新活跃时间（不存在或已超时返回None）"""
+        if self.persist_path:
+            return self._get_persisted(session_id)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if time.time() - session.last_active > self.idle_timeout_seconds:
+                del self._sessions[session_id]
+                self.stats["expired"] += 1
+                return None
+            session.touch()
+            self._sessions.move_to_end(session_id)
+            self.stats["resumed"] += 1
+            return session
+
+    def save(self, session: GuidanceSession) -> None:
+        """会话内容变更（记录回答、保存追问）后写回（内存模式下会话即存储中的对象，无需写回）"""
+        if not self.persist_path:
+            return
+        path = self._session_path(session.session_id)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(session), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def close(self, session_id: str) -> bool:
+        """主动结束会话"""
+        if self.persist_path:
+            return self._remove_persisted(session_id)
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def purge_expired(self) -> int:
+        """清理全部超时会话，返回清理数量（持久化模式下同时按max_sessions淘汰最旧的会话文件）"""
+        if self.persist_path:
+            return self._sweep_persisted()
+        with self._lock:
+            return self._purge_expired_locked()
+
+    def _purge_expired_locked(self) -> int:
+        # 会话按活跃时间有序（最久未活跃在前），遇到未超时的即可停止
+        now, purged = time.time(), 0
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_active <= self.idle_timeout_seconds:
+                break
+            del self._sessions[session_id]
+            purged += 1
+        self.stats["expired"] += purged
+        return purged
+
+    def __len__(self) -> int:
+        if self.persist_path:
+            return sum(1 for name in os.listdir(self.persist_path)
+                       if name.endswith(".json") and _SESSION_ID_PATTERN.fullmatch(name[:-len(".json")]))
+        return len(self._sessions)
+
+    # -------------------------- 文件持久化 --------------------------
+    def _session_path(self, session_id: str) -> str:
+        return os.path.join(self.persist_path, f"{session_id}.json")
+
+    def _load_persisted(self, session_id: str) -> Optional[GuidanceSession]:
+        """读取会话文件（超时的会话删除文件并返回None）"""
+        if not _SESSION_ID_PATTERN.fullmatch(session_id):  # 会话ID来自请求参数，只接受create生成的格式
+            return None
+        try:
+            with open(self._session_path(session_id), encoding="utf-8") as f:
+                session = GuidanceSession(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            print(f"⚠️ 引导会话文件{session_id}读取失败：{str(e)}")
+            return None
+        if time.time() - session.last_active > self.idle_timeout_seconds:
+            if self._remove_persisted(session_id):
+                with self._lock:
+                    self.stats["expired"] += 1
+            return None
+        return session
+
+    def _get_persisted(self, session_id: str) -> Optional[GuidanceSession]:
+        session = self._load_persisted(session_id)
+        if session is None:
+            return None
+        session.touch()
+        self.save(session)
+        with self._lock:
+            self.stats["resumed"] += 1
+        return session
+
+    def _sweep_persisted(self) -> int:
+        """按文件修改时间（即最后活跃时间）删除超时会话，再删除最旧的会话使总数不超过max_sessions；
+        只统计实际删除的文件（其他worker已删除的不计），返回删除的超时会话数"""
+        now = time.time()
+        sessions = []
+        for entry in os.scandir(self.persist_path):
+            try:
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith(".tmp"):  # 写入中途崩溃残留的临时文件
+                if now - mtime > self.idle_timeout_seconds:
+                    self._remove_file(entry.path)
+            elif entry.name.endswith(".json") and _SESSION_ID_PATTERN.fullmatch(entry.name[:-len(".json")]):
+                sessions.append((mtime, entry.path))
+
+        expired = evicted = 0
+        sessions.sort()
+        live = []
+        for mtime, path in sessions:
+            if now - mtime > self.idle_timeout_seconds:
+                expired += self._remove_file(path)
+            else:
+                live.append(path)
+        for path in live[:max(0, len(live) - self.max_sessions)]:
+            evicted += self._remove_file(path)
+        with self._lock:
+            self.stats["expired"] += expired
+            self.stats["evicted"] += evicted
+        return expired
+
+    @staticmethod
+    def _remove_file(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _remove_persisted(self, session_id: str) -> bool:
+        if not _SESSION_ID_PATTERN.fullmatch(session_id):
+            return False
+        return self._remove_file(self._session_path(session_id))
+
+
+# -------------------------- 功能测试 --------------------------
+def test_persisted_store_purge_and_cap():
+    """持久化模式：新建会话时清理超时会话文件，并按max_sessions删除最旧的会话文件"""
+    import tempfile
+    with tempfile.TemporaryDirectory() as persist_dir:
+        store = GuidanceSessionStore(idle_timeout_seconds=60, max_sessions=3, persist_path=persist_dir,
+                                     purge_interval_seconds=0)
+        sessions = [store.create("S1", "math", f"问题{i}", {}, []) for i in range(3)]
+        stale = time.time() - 120
+        os.utime(store._session_path(sessions[0].session_id), (stale, stale))
+        open(os.path.join(persist_dir, "broken.json"), "w").close()  # 非会话文件不计入也不删除
+
+        newest = [store.create("S1", "math", f"问题{i}", {}, []) for i in range(3, 5)]
+        assert store.stats["expired"] == 1 and store.stats["evicted"] == 1
+        assert len(store) == 3
+        assert store.get(sessions[0].session_id) is None and store.get(sessions[1].session_id) is None
+        assert all(store.get(s.session_id) is not None for s in [sessions[2]] + newest)
+        assert store.purge_expired() == 0
+    print("✅ 引导会话：持久化模式超时清理与会话数上限正常")
+
+
+if __name__ == "__main__":
+    test_persisted_store_purge_and_cap()
@@ -0,0 +1,344 @@
+# indexed_plan.py
+"""带索引的学业规划
+设计意图：规划是嵌套的字典/列表，延长周期、提前进阶、资源适配、补漏周插入等操作都要遍历全部周次与任务，
+资源适配还对resource_mapping的每一项各扫描一遍全部任务（平方复杂度），多学期的长规划编辑明显变慢。
+IndexedPlan 包装规划字典，维护 task_id → (周次, 任务) 与 resource_id → task_id 两个索引；
+插入/替换/移动任务、插入周次都通过方法完成并同步更新索引，底层字典始终保持原有结构，
+to_dict() 直接返回该字典，API输出格式不变。
+写时复制模式（IndexedPlan.evolve）下不修改传入的规划，新版本与旧版本共享未修改的周与任务，
+冲突处理可以低成本地保存每一步的规划快照、比较差异和回滚。
+支持按键读取（plan["weekly_tasks"] / plan.get(...)），只读的检测函数可直接接收IndexedPlan。
+"""
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Set, Tuple
+import time
+
+# 任务位置：(所在周字典, 任务字典)；周次下标由周字典反查，插入周次时无需逐个更新任务位置
+_Location = Tuple[Dict[str, Any], Dict[str, Any]]
+
+
+class IndexedPlan:
+    """规划索引包装
+    默认原地修改底层规划字典；copy_on_write=True 时不修改传入的规划：顶层字典与周列表各复制一份，
+    被修改的周/任务/月度计划/资源映射在第一次修改前才复制（路径复制），未修改的部分与原规划共享，
+    to_dict() 得到的新版本与原版本结构共享，保存版本快照无需深拷贝。
+    """
+
+    def __init__(self, plan: Dict[str, Any], copy_on_write: bool = False):
+        self.copy_on_write = copy_on_write
+        if copy_on_write:
+            plan = {**plan, "weekly_tasks": list(plan.get("weekly_tasks", []))}
+        self.plan = plan
+        plan.setdefault("weekly_tasks", [])
+        plan.setdefault("resource_mapping", {})
+        self._tasks: Optional[Dict[str, List[_Location]]] = None  # 首次按ID查询时建立
+        self._resource_tasks: Dict[str, Set[str]] = {}
+        self._week_pos: Optional[Dict[int, int]] = None
+        self._owned: Dict[int, Any] = {}  # 本版本新建（可直接修改）的对象，id → 对象（持有引用保证id不被复用）
+        if copy_on_write:
+            self._own(plan["weekly_tasks"])
+        self.reindex()
+
+    @classmethod
+    def of(cls, plan: Any) -> "IndexedPlan":
+        """已是IndexedPlan时直接返回（多个操作共享同一份索引），否则为规划字典建立索引"""
+        return plan if isinstance(plan, cls) else cls(plan)
+
+    @classmethod
+    def evolve(cls, plan: Any) -> "IndexedPlan":
+        """基于规划（字典或IndexedPlan）创建写时复制的新版本，原规划保持不变"""
+        return cls(plan.plan if isinstance(plan, cls) else plan, copy_on_write=True)
+
+    # -------------------------- 字典兼容 --------------------------
+    def __getitem__(self, key: str) -> Any:
+        return self.plan[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in ("weekly_tasks", "resource_mapping"):
+            raise KeyError(f"{key}需通过IndexedPlan的方法修改以保持索引一致")
+        self.plan[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.plan
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.plan.get(key, default)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self.plan
+
+    # -------------------------- 索引 --------------------------
+    @property
+    def weeks(self) -> List[Dict[str, Any]]:
+        return self.plan["weekly_tasks"]
+
+    def reindex(self) -> None:
+        """重建全部索引（底层字典被直接修改后调用；任务索引惰性重建）"""
+        self._tasks = None
+        self._resource_tasks = {}
+        for task_id, resource_id in self.plan["resource_mapping"].items():
+            self._resource_tasks.setdefault(resource_id, set()).add(task_id)
+        self._week_pos = None
+
+    @property
+    def _task_index(self) -> Dict[str, List[_Location]]:
+        if self._tasks is None:
+            self._tasks = {}
+            for week in self.weeks:
+                for task in week.get("tasks", []):
+                    self._tasks.setdefault(task["task_id"], []).append((week, task))
+        return self._tasks
+
+    def week_index(self, week: Dict[str, Any]) -> int:
+        if self._week_pos is None:  # 插入周次后惰性重建
+            self._week_pos = {id(w): i for i, w in enumerate(self.weeks)}
+        return self._week_pos[id(week)]
+
+    def _sort_key(self, location: _Location) -> Tuple[int, int]:
+        week, task = location
+        return self.week_index(week), _position(week["tasks"], task)
+
+    def find(self, task_id: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """按规划顺序返回首个该ID任务的 (周次下标, 任务)"""
+        locations = self._task_index.get(task_id)
+        if not locations:
+            return None
+        week, task = locations[0] if len(locations) == 1 else min(locations, key=self._sort_key)
+        return self.week_index(week), task
+
+    def find_all(self, task_id: str) -> List[Tuple[int, Dict[str, Any]]]:
+        """返回全部该ID任务（延长任务等可能出现重复ID）"""
+        return [(self.week_index(week), task) for week, task in self._task_index.get(task_id, [])]
+
+    def task_ids(self) -> Iterable[str]:
+        return self._task_index.keys()
+
+    def iter_tasks(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """按规划顺序遍历 (周次下标, 任务)"""
+        for idx, week in enumerate(self.weeks):
+            for task in week.get("tasks", []):
+                yield idx, task
+
+    def resource_of(self, task_id: str) -> Optional[str]:
+        return self.plan["resource_mapping"].get(task_id)
+
+    def tasks_for_resource(self, resource_id: str) -> List[Dict[str, Any]]:
+        """使用该资源的全部任务"""
+        return [task for task_id in self._resource_tasks.get(resource_id, ())
+                for _, task in self._task_index.get(task_id, [])]
+
+    # -------------------------- 写时复制 --------------------------
+    def _own(self, obj: Any) -> Any:
+        """登记本版本复制出的对象（只登记内部复制的对象；调用方传入的对象可能与其他版本共享，首次修改时仍会复制）"""
+        if self.copy_on_write:
+            self._owned[id(obj)] = obj
+        return obj
+
+    def _is_owned(self, obj: Any) -> bool:
+        return not self.copy_on_write or id(obj) in self._owned
+
+    def _own_week(self, week_index: int) -> Dict[str, Any]:
+        """返回可修改的周（共享的周先复制：新周字典 + 新任务列表，任务本身仍共享）"""
+        week = self.weeks[week_index]
+        if self._is_owned(week):
+            return week
+        copied = self._own({**week, "tasks": list(week.get("tasks", []))})
+        self.weeks[week_index] = copied
+        if self._week_pos is not None:
+            del self._week_pos[id(week)]
+            self._week_pos[id(copied)] = week_index
+        if self._tasks is not None:
+            for task in copied["tasks"]:
+                self._tasks[task["task_id"]] = [(copied, t) if w is week else (w, t)
+                                                for w, t in self._tasks[task["task_id"]]]
+        return copied
+
+    def _own_task(self, week_index: int, task: Dict[str, Any]) -> Dict[str, Any]:
+        week = self._own_week(week_index)
+        if self._is_owned(task):
+            return task
+        copied = self._own(dict(task))
+        week["tasks"][_position(week["tasks"], task)] = copied
+        if self._tasks is not None:
+            self._tasks[task["task_id"]] = [(w, copied) if t is task else (w, t) for w, t in self._tasks[task["task_id"]]]
+        return copied
+
+    def _own_mapping(self) -> Dict[str, str]:
+        mapping = self.plan["resource_mapping"]
+        if not self._is_owned(mapping):
+            mapping = self.plan["resource_mapping"] = self._own(dict(mapping))
+        return mapping
+
+    def edit_task_at(self, week_index: int, position: int) -> Dict[str, Any]:
+        """返回指定位置可直接修改的任务"""
+        return self._own_task(week_index, self.weeks[week_index]["tasks"][position])
+
+    def edit_tasks(self, task_id: str) -> List[Dict[str, Any]]:
+        """返回该ID全部任务的可修改版本"""
+        edited = []
+        for i in range(len(self._task_index.get(task_id, []))):
+            # 复制周/任务会原位更新位置列表，每次重新读取
+            week, task = self._task_index[task_id][i]
+            edited.append(self._own_task(self.week_index(week), task))
+        return edited
+
+    def edit_monthly_plan(self, index: int) -> Dict[str, Any]:
+        """返回可直接修改的月度计划"""
+        monthly_plans = self.plan["monthly_plans"]
+        if not self._is_owned(monthly_plans):
+            monthly_plans = self.plan["monthly_plans"] = self._own(list(monthly_plans))
+        if not self._is_owned(monthly_plans[index]):
+            monthly_plans[index] = self._own(dict(monthly_plans[index]))
+        return monthly_plans[index]
+
+    # -------------------------- 修改操作 --------------------------
+    def insert_task(self, week_index: int, task: Dict[str, Any], position: int = 0) -> None:
+        week = self._own_week(week_index)
+        week.setdefault("tasks", []).insert(position, task)
+        if self._tasks is not None:
+            self._tasks.setdefault(task["task_id"], []).append((week, task))
+
+    def replace_week_tasks(self, week_index: int, tasks: List[Dict[str, Any]]) -> None:
+        """整体替换某周的任务列表"""
+        week = self._own_week(week_index)
+        week["tasks"] = tasks
+        self._tasks = None
+
+    def insert_weeks(self, index: int, weeks: List[Dict[str, Any]]) -> None:
+        """在index处一次性插入多个周次（单次列表切片插入，避免逐个insert的平方开销）"""
+        self.weeks[index:index] = weeks
+        if self._tasks is not None:
+            for week in weeks:
+                for task in week.get("tasks", []):
+                    self._tasks.setdefault(task["task_id"], []).append((week, task))
+        self._week_pos = None
+
+    def append_week(self, week: Dict[str, Any]) -> int:
+        self.insert_weeks(len(self.weeks), [week])
+        return len(self.weeks) - 1
+
+    def remove_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """移除首个该ID任务并返回（资源映射保持不变）"""
+        found = self.find(task_id)
+        if found is None:
+            return None
+        week_index, task = found
+        week = self._own_week(week_index)
+        del week["tasks"][_position(week["tasks"], task)]
+        self._drop_location(task_id, task)
+        return task
+
+    def replace_task(self, task_id: str, new_task: Dict[str, Any]) -> bool:
+        """把首个该ID任务原位替换为new_task（新任务ID可以不同）"""
+        found = self.find(task_id)
+        if found is None:
+            return False
+        week_index, task = found
+        week = self._own_week(week_index)
+        week["tasks"][_position(week["tasks"], task)] = new_task
+        self._drop_location(task_id, task)
+        self._task_index.setdefault(new_task["task_id"], []).append((week, new_task))
+        return True
+
+    def move_task(self, task_id: str, to_week_index: int, position: int = 0) -> bool:
+        """把首个该ID任务移动到指定周次的指定位置"""
+        task = self.remove_task(task_id)
+        if task is None:
+            return False
+        self.insert_task(to_week_index, task, position)
+        return True
+
+    def set_resource(self, task_id: str, resource_id: str) -> None:
+        mapping = self._own_mapping()
+        old = mapping.get(task_id)
+        if old is not None:
+            self._resource_tasks.get(old, set()).discard(task_id)
+        mapping[task_id] = resource_id
+        self._resource_tasks.setdefault(resource_id, set()).add(task_id)
+
+    def replace_resource_mapping(self, mapping: Dict[str, str]) -> None:
+        """整体替换资源映射（与原实现一致，替换为新的字典对象）"""
+        self.plan["resource_mapping"] = mapping
+        self._resource_tasks = {}
+        for task_id, resource_id in mapping.items():
+            self._resource_tasks.setdefault(resource_id, set()).add(task_id)
+
+    def _drop_location(self, task_id: str, task: Dict[str, Any]) -> None:
+        locations = [loc for loc in self._task_index.get(task_id, []) if loc[1] is not task]
+        if locations:
+            self._task_index[task_id] = locations
+        else:
+            self._task_index.pop(task_id, None)
+
+
+def _position(tasks: List[Dict[str, Any]], task: Dict[str, Any]) -> int:
+    """按对象身份定位任务（内容相同的重复任务不会误匹配）"""
+    return next(i for i, t in enumerate(tasks) if t is task)
+
+
+# -------------------------- 长规划编辑耗时测试 --------------------------
+def _synthetic_plan(num_weeks: int, tasks_per_week: int) -> Dict[str, Any]:
+    weekly_tasks, mapping = [], {}
+    for w in range(num_weeks):
+        tasks = []
+        for t in range(tasks_per_week):
+            task_id, resource_id = f"t_{w}_{t}", f"r_kp{w % 40}_{t % 5 + 1}"
+            tasks.append({"task_id": task_id, "content": f"学习kp{w % 40}（资源ID：{resource_id}）", "duration_hour": 3,
+                          "completion_standard": "完成练习", "completion_rate": 100 if (w + t) % 3 else 0})
+            mapping[task_id] = resource_id
+        weekly_tasks.append({"week": f"第{w + 1}周", "tasks": tasks})
+    return {"long_term_goal": "g", "semester_goal": "s", "weekly_tasks": weekly_tasks, "resource_mapping": mapping,
+            "monthly_plans": [{"month": m + 1, "goal": "g", "deadline": "2026-01-01"} for m in range(num_weeks // 4)]}
+
+
+def _legacy_resolve_resource_ability_conflict(assessment: Dict[str, Any], plan: Dict[str, Any]) -> Dict[str, Any]:
+    """原实现：资源映射每一项都扫描全部任务"""
+    from functions.coordinator_core import query_resource_detail, query_matched_resource
+    student_ability = assessment["ability_level"].get("comprehensive", 3)
+    learning_preference = assessment["learning_habits"].get("preference", "text")
+    new_resource_mapping = {}
+    for task_id, resource_id in plan.get("resource_mapping", {}).items():
+        old_resource = query_resource_detail(resource_id)
+        new_resource = query_matched_resource(old_resource["knowledge_point"], student_ability, learning_preference)
+        new_resource_mapping[task_id] = new_resource["resource_id"]
+        for week in plan.get("weekly_tasks", []):
+            for task in week.get("tasks", []):
+                if task["task_id"] == task_id:
+                    task["content"] = task["content"].replace(resource_id, new_resource["resource_id"])
+                    task["completion_standard"] = new_resource["completion_standard"]
+    plan["resource_mapping"] = new_resource_mapping
+    return plan
+
+
+def run_plan_edit_benchmark(semesters: Iterable[int] = (1, 4, 8), tasks_per_week: int = 5) -> List[Dict[str, Any]]:
+    """按规划长度（学期数，每学期20周）对比资源适配的 原实现 vs IndexedPlan 耗时，并记录结果一致性"""
+    import copy
+    import json
+    from functions.coordinator_core import resolve_resource_ability_conflict
+    assessment = {"ability_level": {"comprehensive": 3}, "learning_habits": {"preference": "visual"}}
+    rows = []
+    for semester_count in semesters:
+        plan = _synthetic_plan(semester_count * 20, tasks_per_week)
+        legacy_plan, indexed_plan = copy.deepcopy(plan), copy.deepcopy(plan)
+        start = time.perf_counter()
+        _legacy_resolve_resource_ability_conflict(assessment, legacy_plan)
+        legacy_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        indexed_plan = resolve_resource_ability_conflict(assessment, indexed_plan)
+        indexed_ms = (time.perf_counter() - start) * 1000
+        rows.append({
+            "weeks": semester_count * 20,
+            "tasks": semester_count * 20 * tasks_per_week,
+            "legacy_ms": round(legacy_ms, 2),
+            "indexed_ms": round(indexed_ms, 2),
+            "speedup": round(legacy_ms / indexed_ms, 1) if indexed_ms else None,
+            "identical": json.dumps(legacy_plan, sort_keys=True) == json.dumps(indexed_plan, sort_keys=True),
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    import json
+    import os
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    print(json.dumps(run_plan_edit_benchmark(), ensure_ascii=False, indent=2))
@@ -0,0 +1,202 @@
+# pipeline_dag.py
+"""Agent流水线DAG执行器
+设计意图：协调/引导流程原先严格串行，即使确定性的场景拆解、资源匹配与LLM调用互不依赖也要排队等待。
+这里把各 functions/*_core.py 的步骤声明为带依赖关系的阶段，互不依赖的阶段在线程池中并发执行，
+端到端耗时降为关键路径耗时；每次执行记录各阶段耗时，并按流水线/阶段累计统计供 /metrics 导出。
+"""
+from typing import Dict, Any, Callable, Iterable, List, Optional
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
+import os
+import threading
+import time
+
+
+# -------------------------- 共享线程池 --------------------------
+# 所有DAG共用一个进程级线程池，避免每次run()都创建/销毁线程；单个DAG的并发度仍由max_workers限制
+_POOL_SIZE = max(1, int(os.getenv("EDU_DAG_POOL_SIZE", "16")))
+_pool_lock = threading.Lock()
+_shared_pool: Optional[ThreadPoolExecutor] = None
+_worker_local = threading.local()
+
+def _mark_pool_worker() -> None:
+    _worker_local.in_pool = True
+
+def _get_shared_pool() -> ThreadPoolExecutor:
+    global _shared_pool
+    with _pool_lock:
+        if _shared_pool is None:
+            _shared_pool = ThreadPoolExecutor(max_workers=_POOL_SIZE, thread_name_prefix="dag",
+                                              initializer=_mark_pool_worker)
+        return _shared_pool
+
+def _in_pool_worker() -> bool:
+    """当前线程是否为共享线程池的工作线程（嵌套DAG在此情况下串行执行，避免占满线程池后互相等待死锁）"""
+    return getattr(_worker_local, "in_pool", False)
+
+
+class PipelineStageError(RuntimeError):
+    """流水线中某个阶段执行失败"""
+
+    def __init__(self, pipeline: str, stage: str, error: Exception):
+        super().__init__(f"流水线{pipeline}阶段{stage}执行失败：{type(error).__name__}: {error}")
+        self.pipeline = pipeline
+        self.stage = stage
+        self.error = error
+
+
+class _Stage:
+    __slots__ = ("name", "func", "deps")
+
+    def __init__(self, name: str, func: Callable[..., Any], deps: Iterable[str]):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+
+
+class PipelineResult:
+    """一次流水线执行的结果（各阶段返回值 + 耗时）"""
+
+    def __init__(self, pipeline: str, results: Dict[str, Any], timings: Dict[str, Dict[str, float]],
+                 total_ms: float, critical_path: List[str]):
+        self.pipeline = pipeline
+        self.results = results
+        self.timings = timings              # {阶段: {"start_ms": 相对开始时刻, "duration_ms": 耗时}}
+        self.total_ms = total_ms
+        self.critical_path = critical_path  # 决定端到端耗时的阶段链
+
+    def __getitem__(self, stage: str) -> Any:
+        return self.results[stage]
+
+    def timing_summary(self) -> Dict[str, Any]:
+        return {
+            "pipeline": self.pipeline,
+            "total_ms": round(self.total_ms, 2),
+            "stages": {name: {k: round(v, 2) for k, v in t.items()} for name, t in self.timings.items()},
+            "critical_path": self.critical_path,
+        }
+
+
+class PipelineDAG:
+    """阶段依赖图执行器
+    用法：
+        dag = PipelineDAG("guidance")
+        dag.add_stage("assessment", lambda: run_academic_assessment(...))
+        dag.add_stage("inquiry", lambda assessment: generate_inquiry_questions(..., assessment), deps=["assessment"])
+        result = dag.run()
+    阶段函数以依赖阶段名为关键字参数接收其返回值；同一个DAG可重复执行。
+    """
+
+    def __init__(self, name: str, max_workers: int = 4):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self._stages: Dict[str, _Stage] = {}
+
+    def add_stage(self, name: str, func: Callable[..., Any], deps: Optional[Iterable[str]] = None) -> "PipelineDAG":
+        """添加阶段（依赖阶段必须先添加，保证无环）"""
+        if name in self._stages:
+            raise ValueError(f"阶段{name}重复定义")
+        deps = tuple(deps or ())
+        missing = [dep for dep in deps if dep not in self._stages]
+        if missing:
+            raise ValueError(f"阶段{name}依赖的阶段{missing}未定义")
+        self._stages[name] = _Stage(name, func, deps)
+        return self
+
+    def run(self) -> PipelineResult:
+        """执行全部阶段；只有一个可执行阶段且无其他阶段在运行时直接在当前线程执行，避免线程切换开销；
+        在共享线程池的工作线程内（嵌套DAG）所有阶段串行执行"""
+        results: Dict[str, Any] = {}
+        timings: Dict[str, Dict[str, float]] = {}
+        remaining = dict(self._stages)
+        running: Dict[Future, str] = {}
+        origin = time.perf_counter()
+
+        def execute(stage: _Stage) -> Any:
+            start = time.perf_counter()
+            try:
+                return stage.func(**{dep: results[dep] for dep in stage.deps})
+            finally:
+                end = time.perf_counter()
+                timings[stage.name] = {"start_ms": (start - origin) * 1000, "duration_ms": (end - start) * 1000}
+
+        inline = self.max_workers == 1 or _in_pool_worker()
+        queued: List[_Stage] = []
+        try:
+            while remaining or running or queued:
+                ready = [s for s in remaining.values() if all(dep in results for dep in s.deps)]
+                for stage in ready:
+                    del remaining[stage.name]
+                queued.extend(ready)
+                if queued and (inline or (len(queued) == 1 and not running)):
+                    stage = queued.pop(0)
+                    try:
+                        results[stage.name] = execute(stage)
+                    except Exception as e:
+                        raise PipelineStageError(self.name, stage.name, e) from e
+                    continue
+                if queued:
+                    pool = _get_shared_pool()
+                    while queued and len(running) < self.max_workers:
+                        stage = queued.pop(0)
+                        running[pool.submit(execute, stage)] = stage.name
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage_name = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        raise PipelineStageError(self.name, stage_name, error) from error
+                    results[stage_name] = future.result()
+        finally:
+            # 共享线程池不关闭，只取消本次执行尚未开始的阶段
+            for future in running:
+                future.cancel()
+
+        total_ms = (time.perf_counter() - origin) * 1000
+        _record_timings(self.name, timings, total_ms)
+        return PipelineResult(self.name, results, timings, total_ms, self._critical_path(timings))
+
+    def _critical_path(self, timings: Dict[str, Dict[str, float]]) -> List[str]:
+        """按阶段耗时计算最长依赖链"""
+        longest: Dict[str, float] = {}
+        previous: Dict[str, Optional[str]] = {}
+        for name, stage in self._stages.items():  # 添加顺序即拓扑序
+            best_dep = max(stage.deps, key=lambda dep: longest[dep], default=None)
+            longest[name] = timings.get(name, {}).get("duration_ms", 0.0) + (longest[best_dep] if best_dep else 0.0)
+            previous[name] = best_dep
+        if not longest:
+            return []
+        node: Optional[str] = max(longest, key=longest.get)
+        path = []
+        while node is not None:
+            path.append(node)
+            node = previous[node]
+        return path[::-1]
+
+
+# -------------------------- 阶段耗时累计统计 --------------------------
+_stats_lock = threading.Lock()
+_stage_stats: Dict[str, Dict[str, Dict[str, float]]] = {}
+
+def _record_timings(pipeline: str, timings: Dict[str, Dict[str, float]], total_ms: float) -> None:
+    with _stats_lock:
+        stages = _stage_stats.setdefault(pipeline, {})
+        for name, timing in list(timings.items()) + [("__total__", {"duration_ms": total_ms})]:
+            entry = stages.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] += timing["duration_ms"]
+            entry["max_ms"] = max(entry["max_ms"], timing["duration_ms"])
+
+def get_stage_timing_stats() -> Dict[str, Dict[str, Dict[str, float]]]:
+    """按流水线/阶段返回累计耗时统计（__total__为端到端耗时）"""
+    with _stats_lock:
+        return {
+            pipeline: {
+                name: {**entry, "avg_ms": round(entry["total_ms"] / entry["count"], 2) if entry["count"] else 0.0}
+                for name, entry in stages.items()
+            }
+            for pipeline, stages in _stage_stats.items()
+        }
+
+def reset_stage_timing_stats() -> None:
+    with _stats_lock:
+        _stage_stats.clear()
@@ -0,0 +1,114 @@
+# plan_snapshot.py
+"""冲突处理的规划版本快照
+设计意图：冲突解决策略基于写时复制的IndexedPlan生成新版本，不修改上一版本，新旧版本共享未修改的周与任务。
+因此每解决一个冲突保存一次快照只需保留一个引用；比较两个版本时按对象身份跳过共享部分，
+只需检查被复制过的周；回滚即取回旧版本的引用。
+"""
+from typing import Dict, List, Any, Optional, Tuple
+
+
+def diff_plans(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """比较两个规划版本（按对象身份跳过共享的周/任务，耗时只与被修改的部分相关）
+    Returns:
+        {"changed_fields": 变化的顶层字段（不含周任务）, "added_weeks": 新增周名,
+         "removed_weeks": 删除周名, "modified_weeks": {周名: {"added": 任务ID, "removed": 任务ID, "modified": 任务ID}}}
+    """
+    changed_fields = sorted(
+        key for key in set(old) | set(new)
+        if key != "weekly_tasks" and old.get(key) is not new.get(key) and old.get(key) != new.get(key)
+    )
+    old_weeks, new_weeks = old.get("weekly_tasks", []), new.get("weekly_tasks", [])
+    old_ids = {id(week) for week in old_weeks}
+    new_ids = {id(week) for week in new_weeks}
+    # 非共享的旧周按周名配对，配上的视为被修改，其余为删除/新增
+    unmatched_old: Dict[str, List[Dict[str, Any]]] = {}
+    for week in old_weeks:
+        if id(week) not in new_ids:
+            unmatched_old.setdefault(week.get("week", ""), []).append(week)
+    added_weeks, modified_weeks = [], {}
+    for week in new_weeks:
+        if id(week) in old_ids:
+            continue
+        name = week.get("week", "")
+        candidates = unmatched_old.get(name)
+        if candidates:
+            task_diff = _diff_tasks(candidates.pop(0).get("tasks", []), week.get("tasks", []))
+            if any(task_diff.values()):
+                modified_weeks[name] = task_diff
+        else:
+            added_weeks.append(name)
+    removed_weeks = [name for name, weeks in unmatched_old.items() for _ in weeks]
+    return {
+        "changed_fields": changed_fields,
+        "added_weeks": added_weeks,
+        "removed_weeks": removed_weeks,
+        "modified_weeks": modified_weeks,
+    }
+
+
+def _diff_tasks(old_tasks: List[Dict[str, Any]], new_tasks: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    old_by_id: Dict[str, Dict[str, Any]] = {}
+    for task in old_tasks:
+        old_by_id.setdefault(task["task_id"], task)
+    new_ids = {task["task_id"] for task in new_tasks}
+    return {
+        "added": [task["task_id"] for task in new_tasks if task["task_id"] not in old_by_id],
+        "removed": [task_id for task_id in old_by_id if task_id not in new_ids],
+        "modified": [task["task_id"] for task in new_tasks
+                     if task["task_id"] in old_by_id and old_by_id[task["task_id"]] is not task
+                     and old_by_id[task["task_id"]] != task],
+    }
+
+
+def shared_week_count(old: Dict[str, Any], new: Dict[str, Any]) -> int:
+    """新版本中与旧版本共享（未复制）的周数"""
+    old_ids = {id(week) for week in old.get("weekly_tasks", [])}
+    return sum(1 for week in new.get("weekly_tasks", []) if id(week) in old_ids)
+
+
+class PlanSnapshots:
+    """规划版本链（初始版本 + 每个解决策略之后的版本）"""
+
+    def __init__(self, base_plan: Dict[str, Any], label: str = "original"):
+        self.versions: List[Tuple[str, Dict[str, Any]]] = [(label, base_plan)]
+
+    def record(self, label: str, plan: Dict[str, Any]) -> None:
+        self.versions.append((label, plan))
+
+    @property
+    def latest(self) -> Dict[str, Any]:
+        return self.versions[-1][1]
+
+    def _index(self, ref: Any) -> int:
+        if isinstance(ref, int):
+            return ref
+        for idx in range(len(self.versions) - 1, -1, -1):
+            if self.versions[idx][0] == ref:
+                return idx
+        raise KeyError(f"快照{ref}不存在")
+
+    def get(self, ref: Any) -> Dict[str, Any]:
+        """按下标或标签（同名取最近一个）获取版本"""
+        return self.versions[self._index(ref)][1]
+
+    def rollback(self, ref: Any) -> Dict[str, Any]:
+        """回滚到指定版本（丢弃其后的版本），返回该版本"""
+        idx = self._index(ref)
+        del self.versions[idx + 1:]
+        return self.versions[idx][1]
+
+    def diff(self, old_ref: Any = -2, new_ref: Any = -1) -> Dict[str, Any]:
+        return diff_plans(self.get(old_ref), self.get(new_ref))
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """各版本的周数及与上一版本共享的周数"""
+        rows = []
+        for idx, (label, plan) in enumerate(self.versions):
+            row = {"label": label, "weeks": len(plan.get("weekly_tasks", []))}
+            if idx:
+                row["shared_weeks"] = shared_week_count(self.versions[idx - 1][1], plan)
+            rows.append(row)
+        return rows
+
+    def __len__(self) -> int:
+        return len(self.versions)
@@ -0,0 +1,178 @@
+# plan_store.py
+"""学业规划持久化存储
+设计意图：run_academic_planning 每次调用都重新生成整份规划（重复全部资源查询），再把反馈套用到新规划上，
+之前的调整全部丢失。这里按 (学生ID, 学科, 长期目标) 保存规划，新的执行反馈作为增量（延长/进阶）
+直接作用于已保存的规划并记录调整历史；只有影响规划生成的评估字段发生变化时才整体重新生成。
+可选持久化到目录（每份规划一个JSON文件，变更后只原子写入该文件，不持有全局锁），服务重启后规划与历史不丢失；
+持久化模式下读写都以文件为准并按规划加文件锁，多个worker进程可共用同一目录。
+"""
+from typing import Dict, List, Any, Callable, Iterator, Optional, Tuple
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+import copy
+import hashlib
+import json
+import threading
+import time
+import os
+
+try:  # 跨进程文件锁（多worker共用持久化目录时串行化同一规划的更新；Windows上不可用）
+    import fcntl
+except ImportError:
+    fcntl = None
+
+PlanKey = Tuple[str, str, str]
+
+
+def plan_fingerprint(assessment: Dict[str, Any]) -> str:
+    """评估结果中决定规划内容的字段指纹（首要薄弱点/学习偏好/综合能力等级）
+    诊断文本等LLM生成字段每次都可能不同，不参与比较，避免无意义的整体重新生成。
+    """
+    error_points = assessment.get("error_points") or []
+    relevant = {
+        "error_point": error_points[0] if error_points else None,
+        "preference": (assessment.get("learning_habits") or {}).get("preference", "text"),
+        "ability": (assessment.get("ability_level") or {}).get("comprehensive", 2),
+    }
+    return hashlib.sha1(json.dumps(relevant, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class PlanRecord:
+    """单份已保存的规划"""
+    student_id: str
+    subject: str
+    long_term_goal: str
+    plan: Dict[str, Any]
+    assessment_fingerprint: str
+    version: int = 1
+    history: List[Dict[str, Any]] = field(default_factory=list)  # 生成/反馈调整记录（按时间顺序）
+    created_at: str = field(default_factory=lambda: time.strftime("%Y-%m-%d %H:%M:%S"))
+    updated_at: str = field(default_factory=lambda: time.strftime("%Y-%m-%d %H:%M:%S"))
+
+    @property
+    def key(self) -> PlanKey:
+        return PlanStore.make_key(self.student_id, self.subject, self.long_term_goal)
+
+
+class PlanStore:
+    """规划存储（按键加锁串行化同一规划的更新，线程安全；可选按规划分文件持久化）"""
+
+    def __init__(self, persist_path: Optional[str] = None, max_history: int = 200):
+        """
+        Args:
+            persist_path: 持久化目录（None表示仅保存在内存中）
+            max_history: 每份规划保留的最大调整记录数
+        """
+        self.persist_path = persist_path
+        self.max_history = max_history
+        self._records: Dict[PlanKey, PlanRecord] = {}  # 仅内存模式使用；持久化模式以目录中的文件为准
+        self._lock = threading.Lock()
+        self._key_locks: Dict[PlanKey, threading.Lock] = {}
+        self.stats = {"generated": 0, "regenerated": 0, "reused": 0, "adjusted": 0}
+        if persist_path:
+            os.makedirs(persist_path, exist_ok=True)
+
+    @staticmethod
+    def make_key(student_id: str, subject: str, long_term_goal: str) -> PlanKey:
+        return (student_id, subject.lower(), long_term_goal.strip())
+
+    def get(self, student_id: str, subject: str, long_term_goal: str) -> Optional[PlanRecord]:
+        """查询已保存的规划（返回副本）"""
+        key = self.make_key(student_id, subject, long_term_goal)
+        if self.persist_path:
+            return self._read(key)
+        with self._lock:
+            record = self._records.get(key)
+            return copy.deepcopy(record) if record is not None else None
+
+    def get_history(self, student_id: str, subject: str, long_term_goal: str) -> List[Dict[str, Any]]:
+        record = self.get(student_id, subject, long_term_goal)
+        return record.history if record is not None else []
+
+    def update(self, student_id: str, subject: str, long_term_goal: str,
+               updater: Callable[[Optional[PlanRecord]], Tuple[PlanRecord, Optional[str]]]) -> PlanRecord:
+        """在该规划的锁内执行 updater(当前记录副本或None) → (新记录, 统计项)，保存并返回新记录的副本
+        统计项为None表示未发生变更（不写入、不持久化）
+        持久化模式下另持有该规划的文件锁，并从文件读取最新记录（多个worker进程共用同一目录时更新不会互相覆盖）
+        """
+        key = self.make_key(student_id, subject, long_term_goal)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock, self._file_lock(key):
+            if self.persist_path:
+                current = self._read(key)
+            else:
+                with self._lock:
+                    current = copy.deepcopy(self._records.get(key))
+            record, stat = updater(current)
+            if stat is None:
+                with self._lock:
+                    self.stats["reused"] += 1
+                return record
+            record.history = record.history[-self.max_history:]
+            record.updated_at = time.strftime("%Y-%m-%d %H:%M:%S")
+            if self.persist_path:
+                self._save(key, record)  # 只持有该规划的锁，其他规划的更新不受影响
+            else:
+                with self._lock:
+                    self._records[key] = copy.deepcopy(record)
+            with self._lock:
+                self.stats[stat] += 1
+            return record
+
+    def delete(self, student_id: str, subject: str, long_term_goal: str) -> bool:
+        key = self.make_key(student_id, subject, long_term_goal)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock, self._file_lock(key):
+            if not self.persist_path:
+                with self._lock:
+                    return self._records.pop(key, None) is not None
+            try:
+                os.remove(self._record_path(key))
+                return True
+            except FileNotFoundError:
+                return False
+
+    def __len__(self) -> int:
+        if self.persist_path:
+            return sum(1 for name in os.listdir(self.persist_path) if name.endswith(".json"))
+        return len(self._records)
+
+    # -------------------------- 文件持久化 --------------------------
+    def _record_path(self, key: PlanKey) -> str:
+        name = hashlib.sha1(json.dumps(key, ensure_ascii=False).encode("utf-8")).hexdigest()[:24]
+        return os.path.join(self.persist_path, f"{name}.json")
+
+    @contextmanager
+    def _file_lock(self, key: PlanKey) -> Iterator[None]:
+        """跨进程的单规划排他锁（仅持久化模式且支持fcntl的平台）"""
+        if not self.persist_path or fcntl is None:
+            yield
+            return
+        with open(f"{self._record_path(key)[:-len('.json')]}.lock", "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _read(self, key: PlanKey) -> Optional[PlanRecord]:
+        path = self._record_path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                return PlanRecord(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            print(f"⚠️ 规划文件{os.path.basename(path)}读取失败，按无已保存规划处理：{str(e)}")
+            return None
+
+    def _save(self, key: PlanKey, record: PlanRecord) -> None:
+        """写入该规划的临时文件（文件名含进程号与线程号）后原子替换，避免崩溃或并发写入时留下半份文件"""
+        path = self._record_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(record), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
@@ -1,6 +1,11 @@
 import uvicorn
+import argparse
+import gc
+import signal
+import socket
 import sys
 import os
+import tempfile
 import json
 import pandas as pd
 import numpy as np
@@ -13,8 +18,8 @@ project_root = os.path.dirname(current_file_path)
 sys.path.append(project_root)
 
 # ============================== API 应用导入 ==============================
-# 从 utils.api 模块中导入 FastAPI 的 app 实例
-from utils.api import app
+# 从 utils.api 模块中导入 FastAPI 的 app 实例（preload_manager 用于fork前预加载数据）
+from utils.api import app, preload_manager
 
 # ============================== 实验数据处理代码 (从 api.py 移动到这里) ==============================
 
@@ -108,17 +113,87 @@ def analyze_plan_effectiveness(pre_test_path: str, post_test_path: str, group_co
 
     return result
 
-# ============================== 服务启动和数据分析入口 ==============================
+# ============================== 服务启动（预加载 + prefork） ==============================
 HOST = "0.0.0.0"
 PORT = 8000
 
+# 多worker时必须跨进程共享的状态：规划存储与引导会话（未指定目录时使用本次启动的临时目录）
+SHARED_STATE_DIRS = {"EDU_PLAN_STORE_PATH": "plans", "EDU_GUIDANCE_SESSION_PATH": "guidance_sessions"}
+
+def ensure_shared_state_dirs() -> None:
+    """各worker的内存状态互不可见：规划更新会互相覆盖、引导的后续轮次落到其他worker时找不到会话。
+    未设置持久化目录的存储改用本次启动的临时目录（服务重启后不保留），所有worker共用同一目录
+    """
+    missing = [name for name in SHARED_STATE_DIRS if not os.environ.get(name)]
+    if not missing:
+        return
+    base_dir = tempfile.mkdtemp(prefix="edu-api-state-")
+    for name in missing:
+        os.environ[name] = os.path.join(base_dir, SHARED_STATE_DIRS[name])
+        print(f"[*] 多worker模式未设置 {name}，使用临时目录 {os.environ[name]}（重启后不保留）")
+
+def serve(host: str = HOST, port: int = PORT, workers: int = 1) -> None:
+    """启动API服务
+    workers>1 时主进程先加载数据集与全部Agent、冻结GC，再绑定监听端口并fork出各worker：
+    worker继承已加载的数据（写时复制共享物理内存，不再各自加载），共用同一个监听套接字由内核分发连接。
+    （uvicorn自带的 --workers 以spawn方式启动子进程，每个worker都会重新加载数据）
+    规划存储与引导会话通过共享目录在worker间共享；请求合并（single-flight）只在单个worker内生效。
+    """
+    if workers <= 1 or not hasattr(os, "fork"):
+        uvicorn.run(app, host=host, port=port)
+        return
+
+    ensure_shared_state_dirs()
+    preload_manager()
+    gc.collect()
+    gc.freeze()  # 预加载对象移出GC跟踪，避免worker中GC扫描写脏共享页
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            server = uvicorn.Server(uvicorn.Config(app, host=host, port=port))
+            server.run(sockets=[sock])
+            os._exit(0)
+        children.append(pid)
+    print(f"[*] 主进程 {os.getpid()} 已预加载数据，启动 {workers} 个worker：{children}")
+
+    def stop(signum, frame):
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for child in children:
+        os.waitpid(child, 0)
+    sock.close()
+
 if __name__ == "__main__":
     """
     应用程序主入口。
-    - 无参数: 启动 API 服务。
+    - 无参数: 启动 API 服务（--workers N 启用多进程）。
     - 带 '--analyze' 参数: 运行数据分析。
     """
-    if len(sys.argv) > 1 and sys.argv[1] == '--analyze':
+    parser = argparse.ArgumentParser(description="学业领航框架 API 服务 / 实验数据分析")
+    parser.add_argument("--analyze", action="store_true", help="运行实验数据分析")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("EDU_API_WORKERS", "1")),
+                        help="worker进程数（>1时预加载数据后fork）")
+    args = parser.parse_args()
+
+    if args.analyze:
         print("="*50)
         print("          运行实验数据分析")
         print("="*50)
@@ -143,8 +218,7 @@ if __name__ == "__main__":
 
     else:
         print(f"[*] 正在启动 API 服务...")
-        print(f"[*] 访问 http://{HOST}:{PORT}/docs 查看 API 文档")
+        print(f"[*] 访问 http://{args.host}:{args.port}/docs 查看 API 文档")
         print(f"[*] 要运行数据分析，请使用命令: python main.py --analyze")
         
-        # 启动 FastAPI 服务
-        uvicorn.run("main:app", host=HOST, port=PORT, reload=True)
\ No newline at end of file
+        serve(args.host, args.port, args.workers)
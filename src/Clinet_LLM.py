@@ -1,35 +1,91 @@
-from openai import OpenAI
+import os
+import time
+from typing import Dict, Iterator, List, Optional
+
+from src.llm_backends import LLMBackend, create_backend
+from src.llm_telemetry import telemetry
+from src.prompt_builder import count_tokens
+
 class LLMClient:
     """LLM客户端封装（创新点：支持多模型无缝切换+教育场景适配）
     设计意图：解决通用LLM在教育场景的学科知识不准确问题，同时降低模型替换成本
     """
-    def __init__(self, model_type: str = "cloud", model_name: str = "llama3-edu"):
+    def __init__(self, model_type: Optional[str] = None, model_name: str = "llama3-edu", compact_preamble: bool = True,
+                 backend: Optional[LLMBackend] = None):
         """
         Args:
-            model_type: 模型部署类型（local=本地Ollama，cloud=云端GPT-4）
+            model_type: 模型部署类型（local=本地Ollama，cloud=云端GPT-4，fake=离线Fake后端；
+                        未指定时读取环境变量EDU_LLM_BACKEND，默认cloud）
             model_name: 模型名称（本地模型已通过教育语料微调）
+            compact_preamble: 是否使用精简版教育约束前言（每次调用都会附带，精简可明显减少输入Token）
+            backend: 直接注入的后端实例（优先于model_type，用于测试/压测）
         """
-        if model_type == "local":
-            # 本地部署：适配教育微调后的Llama 3
-            self.llm = Ollama(model=model_name, base_url="http://localhost:11434")
-        elif model_type == "cloud":
-            # 云端部署：支持GPT-4等通用模型
-            self.llm = OpenAI(
-                # api_key=os.environ.get(''),
-                api_key="sk-3f32a7a2e0b34fe1b9d6439770cdd2b9",
-                base_url="https://api.deepseek.com")
+        self.compact_preamble = compact_preamble
+        if backend is not None:
+            self.backend = backend
         else:
-            raise ValueError("model_type must be 'local' or 'cloud'")
+            # local：适配教育微调后的Llama 3；cloud：支持GPT-4等通用模型；fake：离线确定性输出
+            self.backend = create_backend(model_type or os.environ.get("EDU_LLM_BACKEND", "cloud"), model_name)
+        self.model_type = self.backend.name
 
-    def generate_edu_response(self, prompt: str, temperature: float = 0.3) -> str:
+    def generate_edu_response(self, prompt: str, temperature: float = 0.3, json_mode: bool = False,
+                              call_site: str = "default") -> str:
         """生成教育场景响应（低温度保障结果稳定性）
         Args:
             prompt: 教育场景专属Prompt（含学科知识约束、输出格式要求）
             temperature: 生成温度（0.3→确定性优先，适配评估/规划场景）
+            json_mode: 是否启用后端原生JSON模式（response_format/format=json）
+            call_site: 调用点标识（遥测按此聚合延迟/Token/费用）
         Returns:
             str: 结构化响应（JSON格式）
         """
+        start = time.perf_counter()
+        try:
+            response = self.backend.complete(self._build_messages(prompt), temperature, json_mode=json_mode)
+        except Exception as e:
+            telemetry.record(call_site, time.perf_counter() - start, error_class=type(e).__name__, backend=self.model_type)
+            raise
+        telemetry.record(call_site, time.perf_counter() - start, usage=response.usage, backend=self.model_type)
+        return response.text
+
+    def stream_edu_response(self, prompt: str, temperature: float = 0.3, call_site: str = "default_stream") -> Iterator[str]:
+        """流式生成教育场景响应（逐段返回token，首字延迟远低于整段生成）
+        Args:
+            prompt: 教育场景专属Prompt
+            temperature: 生成温度
+            call_site: 调用点标识
+        Yields:
+            str: 模型实时返回的文本片段
+        """
+        messages = self._build_messages(prompt)
+        start = time.perf_counter()
+        chunks = []
+        try:
+            for chunk in self.backend.stream(messages, temperature):
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            telemetry.record(call_site, time.perf_counter() - start, error_class=type(e).__name__, backend=self.model_type)
+            raise
+        # 流式接口不返回usage，按本地计数估算
+        usage = {
+            "prompt_tokens": sum(count_tokens(m["content"]) for m in messages),
+            "completion_tokens": count_tokens("".join(chunks))
+        }
+        telemetry.record(call_site, time.perf_counter() - start, usage=usage, backend=self.model_type)
+
+    def _build_messages(self, prompt: str) -> List[Dict[str, str]]:
+        """构造对话消息（流式/非流式共用同一套教育场景约束）"""
         # 教育场景增强：注入学科知识约束（创新点：避免通用LLM的学科错误）
+        if self.compact_preamble:
+            edu_enhanced_prompt = (
+                f"Rules: knowledge must follow {self._get_subject_standard()}; "
+                f"output valid JSON only; K12-friendly language.\nTask: {prompt}"
+            )
+            return [
+                {"role": "system", "content": "You are an education expert."},
+                {"role": "user", "content": edu_enhanced_prompt},
+            ]
         edu_enhanced_prompt = f"""
             You are a professional educational AI. Please follow these rules:
             1. Subject knowledge must strictly comply with {self._get_subject_standard()} (e.g., High School Mathematics Curriculum Standards).
@@ -37,17 +93,10 @@ class LLMClient:
             3. Language should be easy to understand, suitable for students from K12 to university level.
             Core Task: {prompt}
         """
-
-        response = self.llm.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": "You are a expert in the field of education"},
-                {"role": "user", "content": edu_enhanced_prompt},
-            ],
-            stream=False,
-            temperature=temperature 
-        )
-        return response.choices[0].message.content
+        return [
+            {"role": "system", "content": "You are a expert in the field of education"},
+            {"role": "user", "content": edu_enhanced_prompt},
+        ]
 
     def _get_subject_standard(self) -> str:
         """私有方法：获取对应学段学科标准（简化实现，实际对接edu_standard数据库）"""
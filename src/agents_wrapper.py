@@ -1,7 +1,7 @@
 # src/agents_wrapper.py
 import sys
 import os
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Iterator
 
 # 将项目根目录加入Python路径
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -9,46 +9,65 @@ sys.path.append(ROOT_DIR)
 
 # 导入项目模块
 from src.Clinet_LLM import LLMClient
+from src.basemodel import InvalidRequestError
 from agents.Agent_dbmanager import DatabaseManagerAgent
 from agents.Agent_accesment import AcademicAssessmentAgent
 from agents.Agent_planner import AcademicPlanningAgent
 from agents.Agent_guidence import AcademicGuidanceAgent
 from agents.Agent_cooridinator import CoordinatorAgent
+from functions.assessment_cache import AssessmentCache
+from functions.plan_store import PlanStore
+from functions.guidance_session import GuidanceSessionStore
 
 
 class AgentsManager:
     """Agent管理器（统一初始化+调用接口）"""
     
-    def __init__(self, data_path: str = "/home/lst/data/assistment2009/skill_builder_data.csv"):
+    def __init__(self, data_path: str = "/home/lst/data/assistment2009/skill_builder_data.csv", model_type: Optional[str] = None):
         """
         初始化所有Agent依赖
         :param data_path: 数据集路径（支持外部传入，增强灵活性）
+        :param model_type: LLM部署类型（local/cloud/fake，默认读取环境变量EDU_LLM_BACKEND，未设置时为cloud）
         """
         try:
             # 1. 初始化基础组件
-            self.llm_client = LLMClient(model_type="cloud", model_name="llama3-edu")
+            self.llm_client = LLMClient(model_type=model_type, model_name="llama3-edu")
             self.db_agent = DatabaseManagerAgent(data_path=data_path)
+            # 各Agent共享的评估结果缓存（学生数据更新时自动失效）
+            self.assessment_cache = AssessmentCache(
+                ttl_seconds=float(os.environ.get("EDU_ASSESSMENT_CACHE_TTL", "900"))
+            ).bind(self.db_agent)
+            # 规划Agent与协调Agent共享的已保存规划（设置EDU_PLAN_STORE_PATH时按规划分文件持久化到该目录）
+            self.plan_store = PlanStore(persist_path=os.environ.get("EDU_PLAN_STORE_PATH") or None)
             print("✅ 基础组件（LLM客户端/数据库）初始化成功！")
 
             # 2. 初始化业务Agent（严格匹配各Agent构造函数参数）
             self.assessment_agent = AcademicAssessmentAgent(
                 llm_client=self.llm_client,
-                db_agent=self.db_agent
+                db_agent=self.db_agent,
+                assessment_cache=self.assessment_cache
             )
             
             self.planning_agent = AcademicPlanningAgent(
                 llm_client=self.llm_client,
-                db_agent=self.db_agent
+                db_agent=self.db_agent,
+                assessment_cache=self.assessment_cache,
+                plan_store=self.plan_store
             )
             
             self.guidance_agent = AcademicGuidanceAgent(
                 llm_client=self.llm_client,
-                db_agent=self.db_agent  # 修复：移除多余的assessment_agent参数
+                db_agent=self.db_agent,  # 修复：移除多余的assessment_agent参数
+                assessment_cache=self.assessment_cache,
+                # 设置EDU_GUIDANCE_SESSION_PATH时会话按文件保存到该目录（多worker共用）
+                session_store=GuidanceSessionStore(persist_path=os.environ.get("EDU_GUIDANCE_SESSION_PATH") or None)
             )
             
             self.coordinator_agent = CoordinatorAgent(
                 llm_client=self.llm_client,  # 修复：匹配CoordinatorAgent所需参数
-                db_agent=self.db_agent
+                db_agent=self.db_agent,
+                assessment_cache=self.assessment_cache,
+                plan_store=self.plan_store
             )
             
             print("✅ 所有业务Agent初始化成功！")
@@ -59,7 +78,7 @@ class AgentsManager:
     def run_assessment(self, student_id: str, subject: str) -> Dict[str, Any]:
         """调用学业评估Agent"""
         if not all([student_id, subject]):
-            raise ValueError("学生ID和科目不能为空")
+            raise InvalidRequestError("学生ID和科目不能为空")
         return self.assessment_agent.run(student_id, subject)
 
     def run_planning(self, 
@@ -69,25 +88,38 @@ class AgentsManager:
                     execution_feedback: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """调用学习规划Agent（统一参数名：execution_feedback）"""
         if not all([student_id, subject, long_term_goal]):
-            raise ValueError("学生ID、科目和长期目标不能为空")
+            raise InvalidRequestError("学生ID、科目和长期目标不能为空")
         return self.planning_agent.run(student_id, subject, long_term_goal, execution_feedback)
 
     def run_guidance(self, 
                     student_id: str, 
                     subject: str, 
                     question_desc: str, 
-                    inquiry_answers: Optional[List[str]] = None) -> Dict[str, Any]:
-        """调用问题引导Agent（统一参数名：question_desc）"""
+                    inquiry_answers: Optional[List[str]] = None,
+                    session_id: Optional[str] = None) -> Dict[str, Any]:
+        """调用问题引导Agent（统一参数名：question_desc；session_id为上一轮返回的引导会话ID）"""
         if not all([student_id, subject, question_desc]):
-            raise ValueError("学生ID、科目和问题描述不能为空")
-        return self.guidance_agent.run(student_id, subject, question_desc, inquiry_answers)
+            raise InvalidRequestError("学生ID、科目和问题描述不能为空")
+        return self.guidance_agent.run(student_id, subject, question_desc, inquiry_answers, session_id)
+
+    def run_guidance_stream(self, 
+                    student_id: str, 
+                    subject: str, 
+                    question_desc: str, 
+                    inquiry_answers: Optional[List[str]] = None,
+                    session_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """调用问题引导Agent（流式输出，逐段返回LLM生成内容）"""
+        if not all([student_id, subject, question_desc]):
+            raise InvalidRequestError("学生ID、科目和问题描述不能为空")
+        return self.guidance_agent.run_stream(student_id, subject, question_desc, inquiry_answers, session_id)
 
     def run_coordination(self, 
                         student_id: str, 
                         subject: str, 
                         long_term_goal: str, 
-                        execution_feedback: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """调用协调Agent（统一参数名：execution_feedback）"""
+                        execution_feedback: Optional[Dict[str, Any]] = None,
+                        search_orders: bool = False) -> Dict[str, Any]:
+        """调用协调Agent（统一参数名：execution_feedback；search_orders为True时评估多个冲突解决顺序）"""
         if not all([student_id, subject, long_term_goal]):
-            raise ValueError("学生ID、科目和长期目标不能为空")
-        return self.coordinator_agent.run(student_id, subject, long_term_goal, execution_feedback)
\ No newline at end of file
+            raise InvalidRequestError("学生ID、科目和长期目标不能为空")
+        return self.coordinator_agent.run(student_id, subject, long_term_goal, execution_feedback, search_orders)
\ No newline at end of file
@@ -1,6 +1,10 @@
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Union, Literal
 from pydantic import BaseModel
 
+
+class InvalidRequestError(ValueError):
+    """请求参数错误（必填参数为空、学生不存在等），API按400返回；其他异常（包括其他ValueError）按500返回"""
+
 class StudentAssessment(BaseModel):
     """评估结果数据模型"""
     student_id: str
@@ -37,6 +41,8 @@ class ExecutionFeedback(BaseModel):
     task_id: str
     completion_rate: int
     score: Optional[int] = None
+    postpone_weeks: Optional[int] = None  # 整体顺延（负数为提前）的周数，只调整截止日期、不增加任务
+    feedback_id: Optional[str] = None  # 反馈标识（重复提交同一标识的反馈只应用一次；缺省时每次提交都应用）
 
 class PlanningRequest(BaseModel):
     """规划API请求模型"""
@@ -51,3 +57,29 @@ class PlanningResponse(BaseModel):
     personalized_plan: PersonalizedPlan
     conflict_resolution_log: List[str]
     recommended_resources: List[str]
+
+class AssessmentLLMOutput(BaseModel):
+    """评估LLM输出模型（校验call_llm_for_assessment的返回）"""
+    knowledge_mastery: Dict[str, Union[int, float]]
+    ability_level: Dict[str, int]
+    learning_habits: Dict[str, Any]
+    role_goals: Dict[str, str] = {}
+    diagnosis: str
+    error_points: List[str]
+    improvement_suggestions: Dict[str, Any] = {}
+
+class IntentLLMOutput(BaseModel):
+    """意图确认LLM输出模型"""
+    intent: Literal["学业评估", "学习规划", "问题引导", "智能协调", "未知意图"]
+
+class EntityLLMOutput(BaseModel):
+    """实体提取LLM输出模型（字段均可缺省，空字符串视为未提取）"""
+    student_id: Optional[str] = None
+    subject: Optional[str] = None
+    question: Optional[str] = None
+    goal: Optional[str] = None
+    long_term_goal: Optional[str] = None
+    goal_score: Optional[Union[int, str]] = None
+    feedback_task_id: Optional[str] = None
+    feedback_completion_rate: Optional[Union[int, str]] = None
+    feedback_note: Optional[str] = None
@@ -0,0 +1,247 @@
+"""本地轻量意图分类器（字符n-gram TF-IDF + 最近质心，纯NumPy实现）
+设计意图：替代 AgentNLU._llm_based_intent_confirm 的LLM往返。用线上记录的（用户输入, 确认意图）对离线训练，
+模型保存为紧凑的npz文件，AgentNLU加载后单次分类仅需微秒级；只有分类置信度不足时才调用LLM。
+
+命令行：
+    python -m src.intent_classifier train --log nlu_utterances.jsonl --model intent_model.npz --holdout 0.2
+    python -m src.intent_classifier evaluate --log heldout.jsonl --model intent_model.npz
+"""
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+
+# -------------------------- 特征提取 --------------------------
+def char_ngrams(text: str, n_range: Tuple[int, int] = (1, 3)) -> Counter:
+    """字符n-gram计数（小写、首尾加边界符，中文按字切分天然适用）"""
+    text = f"^{text.strip().lower()}$"
+    low, high = n_range
+    grams = Counter()
+    for n in range(low, high + 1):
+        for i in range(len(text) - n + 1):
+            grams[text[i:i + n]] += 1
+    return grams
+
+
+class IntentClassifier:
+    """最近质心意图分类器（TF-IDF向量与各意图L2归一化质心的余弦相似度）"""
+
+    def __init__(self, n_range: Tuple[int, int] = (1, 3), temperature: float = 20.0):
+        """
+        Args:
+            n_range: 字符n-gram长度范围
+            temperature: 相似度softmax温度（越大置信度越"尖锐"）
+        """
+        self.n_range = tuple(n_range)
+        self.temperature = temperature
+        self.vocab: Dict[str, int] = {}
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.labels: List[str] = []
+
+    # -------------------------- 训练 --------------------------
+    def fit(self, texts: List[str], labels: List[str], min_df: int = 1, max_features: int = 20000) -> "IntentClassifier":
+        """训练（按文档频率保留前max_features个n-gram）"""
+        if not texts or len(texts) != len(labels):
+            raise ValueError("训练数据为空或文本与标签数量不一致")
+        doc_grams = [char_ngrams(text, self.n_range) for text in texts]
+        df = Counter(gram for grams in doc_grams for gram in grams)
+        kept = [gram for gram, count in df.most_common(max_features) if count >= min_df]
+        self.vocab = {gram: i for i, gram in enumerate(sorted(kept))}
+        num_docs = len(texts)
+        self.idf = np.array([math.log((1 + num_docs) / (1 + df[gram])) + 1 for gram in sorted(kept)], dtype=np.float32)
+
+        self.labels = sorted(set(labels))
+        label_index = {label: i for i, label in enumerate(self.labels)}
+        centroids = np.zeros((len(self.labels), len(self.vocab)), dtype=np.float32)
+        for grams, label in zip(doc_grams, labels):
+            indices, values = self._weights(grams)
+            centroids[label_index[label], indices] += values
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.centroids = centroids / np.where(norms == 0, 1, norms)
+        return self
+
+    # -------------------------- 预测 --------------------------
+    def _weights(self, grams: Counter) -> Tuple[np.ndarray, np.ndarray]:
+        """n-gram计数 → (词表下标, L2归一化的TF-IDF权重)，只保留词表内n-gram"""
+        pairs = [(self.vocab[gram], count) for gram, count in grams.items() if gram in self.vocab]
+        if not pairs:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        indices = np.fromiter((i for i, _ in pairs), dtype=np.int64, count=len(pairs))
+        counts = np.fromiter((c for _, c in pairs), dtype=np.float32, count=len(pairs))
+        values = (1 + np.log(counts)) * self.idf[indices]
+        return indices, values / np.linalg.norm(values)
+
+    def predict_scores(self, text: str) -> np.ndarray:
+        """各意图的余弦相似度"""
+        indices, values = self._weights(char_ngrams(text, self.n_range))
+        if not len(indices):
+            return np.zeros(len(self.labels), dtype=np.float32)
+        return self.centroids[:, indices] @ values
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """返回（意图, 置信度0~1），置信度为相似度softmax后的最大概率；无任何已知n-gram时置信度为0"""
+        scores = self.predict_scores(text)
+        if not scores.any():
+            return self.labels[0] if self.labels else "", 0.0
+        logits = (scores - scores.max()) * self.temperature
+        probs = np.exp(logits)
+        probs /= probs.sum()
+        best = int(np.argmax(probs))
+        return self.labels[best], float(probs[best])
+
+    # -------------------------- 评估 --------------------------
+    def evaluate(self, texts: List[str], labels: List[str], threshold: float = 0.7) -> Dict[str, Any]:
+        """在留出集上评估：准确率、各意图召回、置信度≥threshold的覆盖率及其准确率、单次分类耗时"""
+        if not texts:
+            raise ValueError("评估数据为空")
+        correct, confident, confident_correct = 0, 0, 0
+        per_intent: Dict[str, Dict[str, int]] = {}
+        start = time.perf_counter()
+        predictions = [self.predict(text) for text in texts]
+        elapsed = time.perf_counter() - start
+        for (pred, conf), label in zip(predictions, labels):
+            entry = per_intent.setdefault(label, {"total": 0, "correct": 0})
+            entry["total"] += 1
+            hit = pred == label
+            correct += hit
+            entry["correct"] += hit
+            if conf >= threshold:
+                confident += 1
+                confident_correct += hit
+        return {
+            "samples": len(texts),
+            "accuracy": round(correct / len(texts), 4),
+            "threshold": threshold,
+            "confident_coverage": round(confident / len(texts), 4),
+            "confident_accuracy": round(confident_correct / confident, 4) if confident else 0.0,
+            "per_intent_recall": {k: round(v["correct"] / v["total"], 4) for k, v in sorted(per_intent.items())},
+            "avg_latency_us": round(elapsed / len(texts) * 1e6, 1),
+        }
+
+    # -------------------------- 持久化 --------------------------
+    def save(self, path: str) -> str:
+        """保存为压缩npz（词表/IDF/质心/标签），返回实际写入的路径（np.savez_compressed会补全.npz后缀）"""
+        path = model_file_path(path)
+        vocab = sorted(self.vocab, key=self.vocab.get)
+        np.savez_compressed(
+            path,
+            vocab=np.array(vocab, dtype=np.str_),
+            idf=self.idf,
+            centroids=self.centroids.astype(np.float16),  # 质心已归一化，半精度足够且体积减半
+            labels=np.array(self.labels, dtype=np.str_),
+            n_range=np.array(self.n_range, dtype=np.int32),
+            temperature=np.array(self.temperature, dtype=np.float32),
+        )
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "IntentClassifier":
+        with np.load(model_file_path(path), allow_pickle=False) as data:
+            model = cls(n_range=tuple(int(n) for n in data["n_range"]), temperature=float(data["temperature"]))
+            model.vocab = {gram: i for i, gram in enumerate(data["vocab"].tolist())}
+            model.idf = data["idf"].astype(np.float32)
+            model.centroids = data["centroids"].astype(np.float32)
+            model.labels = data["labels"].tolist()
+        return model
+
+
+def model_file_path(path: str) -> str:
+    """模型文件路径（统一补全.npz后缀，与np.savez_compressed实际写入的文件名一致）"""
+    return path if path.endswith(".npz") else path + ".npz"
+
+
+# -------------------------- 用户输入日志 --------------------------
+# 训练默认只使用经LLM确认的样本：规则快速路径的标签未经确认，分类器自身的预测不再记录（避免用自己的输出训练自己）
+CONFIRMED_SOURCES = ["llm"]
+
+class UtteranceLogger:
+    """记录（用户输入, 确认意图, 来源）到JSONL，作为分类器训练数据"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def log(self, text: str, intent: str, source: str, confidence: Optional[float] = None) -> None:
+        record = {"text": text, "intent": intent, "source": source, "ts": time.strftime("%Y-%m-%d %H:%M:%S")}
+        if confidence is not None:
+            record["confidence"] = round(confidence, 4)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def load_logged_utterances(path: str, sources: Optional[List[str]] = None) -> Tuple[List[str], List[str]]:
+    """读取日志中的（输入, 意图）对；sources可限定来源（如只用LLM确认/高置信规则的样本）"""
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if sources and record.get("source") not in sources:
+                continue
+            if record.get("text") and record.get("intent"):
+                texts.append(record["text"])
+                labels.append(record["intent"])
+    return texts, labels
+
+
+def split_holdout(texts: List[str], labels: List[str], holdout: float, seed: int = 0) -> Tuple[Tuple[List[str], List[str]], Tuple[List[str], List[str]]]:
+    """随机划分训练集/留出集"""
+    order = list(range(len(texts)))
+    random.Random(seed).shuffle(order)
+    cut = int(len(order) * (1 - holdout))
+    pick = lambda idx: ([texts[i] for i in idx], [labels[i] for i in idx])
+    return pick(order[:cut]), pick(order[cut:])
+
+
+# -------------------------- 命令行 --------------------------
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="本地意图分类器训练/评估")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    train = sub.add_parser("train", help="从用户输入日志训练并保存模型")
+    train.add_argument("--log", required=True, help="用户输入日志（JSONL）")
+    train.add_argument("--model", required=True, help="模型输出路径（.npz）")
+    train.add_argument("--holdout", type=float, default=0.2, help="留出评估比例（0表示全部用于训练）")
+    train.add_argument("--sources", nargs="*", default=CONFIRMED_SOURCES,
+                       help="只使用指定来源的样本（默认只用LLM确认的样本，可加上rule使用高置信规则样本）")
+    train.add_argument("--max-features", type=int, default=20000)
+    train.add_argument("--seed", type=int, default=0)
+
+    evaluate = sub.add_parser("evaluate", help="在日志上评估已有模型")
+    evaluate.add_argument("--log", required=True)
+    evaluate.add_argument("--model", required=True)
+    evaluate.add_argument("--threshold", type=float, default=0.7)
+    evaluate.add_argument("--sources", nargs="*", default=CONFIRMED_SOURCES, help="只使用指定来源的样本")
+
+    args = parser.parse_args(argv)
+    if args.command == "train":
+        texts, labels = load_logged_utterances(args.log, args.sources)
+        if args.holdout > 0:
+            (train_x, train_y), (test_x, test_y) = split_holdout(texts, labels, args.holdout, args.seed)
+        else:
+            (train_x, train_y), (test_x, test_y) = (texts, labels), ([], [])
+        model = IntentClassifier().fit(train_x, train_y, max_features=args.max_features)
+        model_path = model.save(args.model)
+        print(f"✅ 模型已保存：{model_path}（训练样本{len(train_x)}，特征{len(model.vocab)}，"
+              f"大小{os.path.getsize(model_path) / 1024:.1f}KB）")
+        if test_x:
+            print(json.dumps(model.evaluate(test_x, test_y), ensure_ascii=False, indent=2))
+    else:
+        texts, labels = load_logged_utterances(args.log, args.sources)
+        model = IntentClassifier.load(args.model)
+        print(json.dumps(model.evaluate(texts, labels, args.threshold), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
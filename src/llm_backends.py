@@ -0,0 +1,404 @@
+"""LLM后端实现（可插拔：云端OpenAI兼容接口 / 本地Ollama / 进程内离线Fake）
+设计意图：LLMClient只负责教育场景的Prompt增强，具体模型调用交给后端；
+Fake后端无需网络和付费API即可跑通全部流水线，用于压测与回归测试。
+"""
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Iterator, Optional
+
+
+@dataclass
+class BackendResponse:
+    """后端单次调用结果（文本 + Token用量）"""
+    text: str
+    usage: Dict[str, int] = field(default_factory=dict)
+
+
+class LLMBackend(ABC):
+    """后端接口：子类必须实现complete，stream默认退化为一次性返回
+    json_mode=True 时要求后端以原生JSON模式输出（支持时），保证返回合法JSON
+    """
+    name = "base"
+
+    @abstractmethod
+    def complete(self, messages: List[Dict[str, str]], temperature: float, json_mode: bool = False) -> BackendResponse:
+        ...
+
+    def stream(self, messages: List[Dict[str, str]], temperature: float) -> Iterator[str]:
+        yield self.complete(messages, temperature).text
+
+
+# -------------------------- 云端后端 --------------------------
+class OpenAICompatibleBackend(LLMBackend):
+    """云端后端（OpenAI兼容协议，默认DeepSeek）"""
+    name = "cloud"
+
+    def __init__(self, model: str = "deepseek-chat", api_key: Optional[str] = None, base_url: str = "https://api.deepseek.com"):
+        from openai import OpenAI
+        api_key = api_key or os.environ.get("DEEPSEEK_API_KEY")
+        if not api_key:
+            raise RuntimeError("云端模型需要API Key：请设置环境变量 DEEPSEEK_API_KEY 或显式传入 api_key")
+        self.model = model
+        self.client = OpenAI(api_key=api_key, base_url=base_url)
+
+    def complete(self, messages: List[Dict[str, str]], temperature: float, json_mode: bool = False) -> BackendResponse:
+        options = {"response_format": {"type": "json_object"}} if json_mode else {}
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=False,
+            temperature=temperature,
+            **options
+        )
+        usage = response.usage
+        return BackendResponse(
+            text=response.choices[0].message.content,
+            usage={"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens} if usage else {}
+        )
+
+    def stream(self, messages: List[Dict[str, str]], temperature: float) -> Iterator[str]:
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            temperature=temperature
+        )
+        for chunk in response:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+
+# -------------------------- 本地后端 --------------------------
+class OllamaBackend(LLMBackend):
+    """本地后端（Ollama部署的教育微调模型，需安装ollama包）"""
+    name = "local"
+
+    def __init__(self, model: str = "llama3-edu", base_url: str = "http://localhost:11434"):
+        try:
+            import ollama
+        except ImportError as e:
+            raise ImportError("本地模型需要安装ollama：pip install ollama") from e
+        self.model = model
+        self.client = ollama.Client(host=base_url)
+
+    def complete(self, messages: List[Dict[str, str]], temperature: float, json_mode: bool = False) -> BackendResponse:
+        options = {"format": "json"} if json_mode else {}
+        response = self.client.chat(model=self.model, messages=messages, options={"temperature": temperature}, **options)
+        return BackendResponse(
+            text=response["message"]["content"],
+            usage={"prompt_tokens": response.get("prompt_eval_count", 0), "completion_tokens": response.get("eval_count", 0)}
+        )
+
+    def stream(self, messages: List[Dict[str, str]], temperature: float) -> Iterator[str]:
+        for chunk in self.client.chat(model=self.model, messages=messages, options={"temperature": temperature},
+                                      stream=True):
+            delta = chunk["message"]["content"]
+            if delta:
+                yield delta
+
+
+# -------------------------- 离线Fake后端 --------------------------
+class FakeLLMError(RuntimeError):
+    """Fake后端按错误率注入的模拟故障"""
+
+
+def prompt_fingerprint(messages: List[Dict[str, str]]) -> str:
+    """消息指纹（录制/回放用，取最后一条用户消息内容的SHA1）"""
+    content = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+class FakeLLMBackend(LLMBackend):
+    """进程内离线后端（确定性结构化输出 + 录制回放 + 延迟/错误注入）
+    Args:
+        seed: 随机种子（延迟与错误注入可复现）
+        fixture_path: 回放文件（JSONL，每行 {"prompt_sha1": ..., "response": ...} 或 {"match": 子串, "response": ...}）
+        latency: 延迟分布，如 {"type": "constant", "ms": 200} / {"type": "uniform", "low_ms": 100, "high_ms": 400}
+                 / {"type": "normal", "mean_ms": 300, "std_ms": 50} / {"type": "lognormal", "median_ms": 300, "sigma": 0.5}
+        error_rate: 每次调用抛出FakeLLMError的概率
+        stream_chunk_size: 流式输出时每段字符数
+    """
+    name = "fake"
+
+    def __init__(self, seed: int = 0, fixture_path: Optional[str] = None, latency: Optional[Dict[str, Any]] = None,
+                 error_rate: float = 0.0, stream_chunk_size: int = 8):
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.latency = latency or {"type": "constant", "ms": 0}
+        self.error_rate = error_rate
+        self.stream_chunk_size = max(1, stream_chunk_size)
+        self.fixtures_by_hash: Dict[str, str] = {}
+        self.fixtures_by_match: List[Any] = []
+        if fixture_path:
+            self.load_fixtures(fixture_path)
+
+    def load_fixtures(self, fixture_path: str) -> None:
+        """加载录制的响应（按指纹精确匹配优先，其次按子串匹配）"""
+        with open(fixture_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record["response"]
+                if not isinstance(response, str):
+                    response = json.dumps(response, ensure_ascii=False)
+                if "prompt_sha1" in record:
+                    self.fixtures_by_hash[record["prompt_sha1"]] = response
+                elif "match" in record:
+                    self.fixtures_by_match.append((record["match"], response))
+
+    def complete(self, messages: List[Dict[str, str]], temperature: float, json_mode: bool = False) -> BackendResponse:
+        self._inject_latency_and_errors()
+        prompt = messages[-1]["content"] if messages else ""
+        text = self._replay(messages, prompt)
+        if text is None:
+            text = self._synthesize(prompt)
+        return BackendResponse(text=text, usage={
+            "prompt_tokens": sum(_estimate_tokens(m["content"]) for m in messages),
+            "completion_tokens": _estimate_tokens(text)
+        })
+
+    def stream(self, messages: List[Dict[str, str]], temperature: float) -> Iterator[str]:
+        text = self.complete(messages, temperature).text
+        for i in range(0, len(text), self.stream_chunk_size):
+            yield text[i:i + self.stream_chunk_size]
+
+    # -------------------------- 延迟与错误注入 --------------------------
+    def sample_latency_ms(self) -> float:
+        """按配置的分布采样一次延迟（毫秒）"""
+        spec = self.latency
+        kind = spec.get("type", "constant")
+        with self._rng_lock:
+            if kind == "uniform":
+                value = self._rng.uniform(spec.get("low_ms", 0), spec.get("high_ms", 0))
+            elif kind == "normal":
+                value = self._rng.gauss(spec.get("mean_ms", 0), spec.get("std_ms", 0))
+            elif kind == "lognormal":
+                value = self._rng.lognormvariate(math.log(max(spec.get("median_ms", 1), 1e-6)), spec.get("sigma", 0.5))
+            else:
+                value = spec.get("ms", 0)
+        return max(0.0, value)
+
+    def _inject_latency_and_errors(self) -> None:
+        delay_ms = self.sample_latency_ms()
+        if delay_ms:
+            time.sleep(delay_ms / 1000.0)
+        if self.error_rate:
+            with self._rng_lock:
+                failed = self._rng.random() < self.error_rate
+            if failed:
+                raise FakeLLMError("FakeLLMBackend注入的模拟调用失败")
+
+    # -------------------------- 录制回放 --------------------------
+    def _replay(self, messages: List[Dict[str, str]], prompt: str) -> Optional[str]:
+        fingerprint = prompt_fingerprint(messages)
+        if fingerprint in self.fixtures_by_hash:
+            return self.fixtures_by_hash[fingerprint]
+        for match, response in self.fixtures_by_match:
+            if match in prompt:
+                return response
+        return None
+
+    # -------------------------- 结构化结果合成 --------------------------
+    def _synthesize(self, prompt: str) -> str:
+        """按Prompt类型合成符合结构要求的确定性输出"""
+        if "请分析用户输入的意图" in prompt:
+            return json.dumps({"intent": _fake_intent(prompt)}, ensure_ascii=False)
+        if "从用户输入中提取" in prompt:
+            return json.dumps(_fake_entities(prompt), ensure_ascii=False)
+        if "批量学业评估" in prompt:
+            keys = _extract_json_after(prompt, "键为学生编号") or []
+            return json.dumps({key: _fake_assessment(_batch_section(prompt, key), key) for key in keys}, ensure_ascii=False)
+        if "学业评估" in prompt or "knowledge_mastery" in prompt:
+            return json.dumps(_fake_assessment(prompt, _digest(prompt)), ensure_ascii=False)
+        if "inquiry questions" in prompt:
+            return "\n".join([
+                "- Can you describe a daily-life situation that follows the same pattern?",
+                "- Which step of the method are you least sure about?",
+                "- How is this problem different from ones you solved before?"
+            ])
+        if "transferable solutions" in prompt:
+            return "\n".join([
+                "1. 先回顾题目涉及的核心概念与判定方法",
+                "2. 标出题目中的关键条件，尝试自己写出第一步",
+                "3. 用场景类比检验你的推理",
+                "迁移应用：",
+                "- 场景1：同类变化趋势问题可使用相同的分析步骤",
+                "- 场景2：实际应用题中先抽象变量再套用方法"
+            ])
+        return json.dumps({"mock_response": "edu_optimized_result"}, ensure_ascii=False)
+
+
+# -------------------------- 合成辅助函数 --------------------------
+_INTENT_KEYWORDS = [
+    ("学业评估", ["评估", "成绩", "薄弱点", "能力等级", "分析", "水平"]),
+    ("学习规划", ["计划", "规划", "目标", "任务", "安排"]),
+    ("问题引导", ["问题", "为什么", "怎么做", "解题", "讲解", "知识点"]),
+    ("智能协调", ["冲突", "调整", "优化", "不匹配", "进度", "协调"]),
+]
+
+
+def _estimate_tokens(text: str) -> int:
+    from src.prompt_builder import count_tokens
+    return count_tokens(text)
+
+
+def _digest(text: str) -> int:
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def _extract_json_after(text: str, marker: str) -> Any:
+    """解析marker之后紧跟的JSON值（如批量Prompt中的学生编号列表）"""
+    idx = text.find(marker)
+    if idx < 0:
+        return None
+    try:
+        value, _ = json.JSONDecoder().raw_decode(text[idx + len(marker):].lstrip())
+        return value
+    except ValueError:
+        return None
+
+
+def _batch_section(prompt: str, key: str) -> str:
+    """截取批量Prompt中某个学生的段落"""
+    start = prompt.find(f"[{key}]\n")
+    if start < 0:
+        return ""
+    end = prompt.find("\n\n", start)
+    return prompt[start:end if end >= 0 else len(prompt)]
+
+
+def _user_input(prompt: str) -> str:
+    match = re.search(r"用户输入：(.*)", prompt)
+    return match.group(1).strip() if match else ""
+
+
+def _fake_assessment(prompt: str, key: Any) -> Dict[str, Any]:
+    """合成评估结果（掌握度取Prompt中多源数据的均值，否则按种子生成）"""
+    seed = key if isinstance(key, int) else _digest(f"{key}|{prompt}")
+    rng = random.Random(seed)
+    kp_rows = _extract_json_after(prompt, '"kp":') if '"kp":' in prompt else None
+    if isinstance(kp_rows, dict) and kp_rows:
+        mastery = {
+            kp: int(sum(v for v in row if isinstance(v, (int, float))) / max(1, sum(isinstance(v, (int, float)) for v in row)))
+            for kp, row in kp_rows.items()
+        }
+    else:
+        mastery = {kp: rng.randint(40, 95) for kp in ["函数单调性", "导数应用", "几何证明"]}
+    error_points = [kp for kp, score in mastery.items() if score < 60]
+    comprehensive = max(1, min(5, round(sum(mastery.values()) / len(mastery) / 20)))
+    return {
+        "knowledge_mastery": mastery,
+        "ability_level": {"comprehensive": comprehensive, "understand": comprehensive, "apply": max(1, comprehensive - 1)},
+        "learning_habits": {"preference": rng.choice(["visual", "auditory", "text"]), "delay_rate": round(rng.random() * 0.5, 2)},
+        "role_goals": {"student": "巩固薄弱知识点", "parent": "成绩稳步提升", "teacher": "重点辅导高频错误点"},
+        "diagnosis": f"薄弱知识点：{'、'.join(error_points) or '无'}",
+        "error_points": error_points,
+        "improvement_suggestions": {"knowledge": "优先练习薄弱知识点基础题型", "resource": "使用低错误率资源循序渐进"}
+    }
+
+
+def _fake_intent(prompt: str) -> str:
+    text = _user_input(prompt)
+    for intent, keywords in _INTENT_KEYWORDS:
+        if any(k in text for k in keywords):
+            return intent
+    match = re.search(r"初步识别结果：(\S+)", prompt)
+    return match.group(1) if match else "未知意图"
+
+
+def _fake_entities(prompt: str) -> Dict[str, Any]:
+    text = _user_input(prompt)
+    student = re.search(r"S\d+", text)
+    subject = re.search(r"(math|语文|英语)", text)
+    rate = re.search(r"(\d+)%", text)
+    task = re.search(r"T\d+|t_\w+", text)
+    return {
+        "student_id": student.group(0) if student else "",
+        "subject": subject.group(0) if subject else "",
+        "question": text if any(k in text for k in ["为什么", "怎么", "?", "？"]) else "",
+        "goal": text if any(k in text for k in ["目标", "提分", "提升"]) else "",
+        "feedback_task_id": task.group(0) if task else "",
+        "feedback_completion_rate": int(rate.group(1)) if rate else "",
+        "feedback_note": ""
+    }
+
+
+# -------------------------- 录制包装器 --------------------------
+class RecordingBackend(LLMBackend):
+    """录制包装器：透传真实后端调用，并把响应追加写入回放文件（供FakeLLMBackend回放）"""
+    name = "recording"
+
+    def __init__(self, inner: LLMBackend, fixture_path: str):
+        self.inner = inner
+        self.fixture_path = fixture_path
+        self._lock = threading.Lock()
+
+    def complete(self, messages: List[Dict[str, str]], temperature: float, json_mode: bool = False) -> BackendResponse:
+        response = self.inner.complete(messages, temperature, json_mode=json_mode)
+        with self._lock, open(self.fixture_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"prompt_sha1": prompt_fingerprint(messages), "response": response.text}, ensure_ascii=False) + "\n")
+        return response
+
+
+def create_backend(model_type: str, model_name: Optional[str] = None, **kwargs) -> LLMBackend:
+    """按部署类型创建后端（local/cloud/fake）"""
+    if model_type == "local":
+        return OllamaBackend(model=model_name or "llama3-edu", **kwargs)
+    if model_type == "cloud":
+        return OpenAICompatibleBackend(**kwargs)
+    if model_type == "fake":
+        return FakeLLMBackend(**kwargs)
+    raise ValueError("model_type must be 'local', 'cloud' or 'fake'")
+
+
+# -------------------------- 离线吞吐量测试 --------------------------
+def run_offline_throughput_benchmark(num_requests: int = 200, concurrency: int = 16,
+                                     latency: Optional[Dict[str, Any]] = None, error_rate: float = 0.0) -> Dict[str, Any]:
+    """用Fake后端离线压测评估流水线（端到端：数据查询→Prompt→LLM→结果整合）"""
+    from concurrent.futures import ThreadPoolExecutor
+    from src.Clinet_LLM import LLMClient
+    from agents.Agent_dbmanager import DatabaseManagerAgent
+    from functions.academic_assessment_core import run_academic_assessment
+
+    llm_client = LLMClient(backend=FakeLLMBackend(seed=42, latency=latency or {"type": "lognormal", "median_ms": 50, "sigma": 0.4},
+                                                  error_rate=error_rate))
+    db_agent = DatabaseManagerAgent(data_path=os.environ.get("EDU_DATA_PATH", "skill_builder_data.csv"))
+    student_ids = list(db_agent.student_basic_data.keys())
+
+    latencies = []
+    def one(i: int) -> None:
+        start = time.perf_counter()
+        run_academic_assessment(db_agent, llm_client, student_ids[i % len(student_ids)], "math")
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(num_requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": num_requests,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(num_requests / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2], 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 1),
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    print(json.dumps(run_offline_throughput_benchmark(), ensure_ascii=False, indent=2))
@@ -0,0 +1,229 @@
+"""LLM调用遥测（按调用点统计延迟直方图、Token用量、费用、缓存命中与错误类型）
+设计意图：定位最耗时/最费钱的Prompt并据此做容量规划；数据在进程内聚合，
+通过Prometheus文本格式（/metrics）导出，也可定期落盘为JSON。
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Any, List, Optional, Tuple
+
+# 延迟直方图桶上界（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 每百万Token单价（元，按 输入/输出 计费，可按实际合同价调整）
+DEFAULT_PRICING = {
+    "cloud": (2.0, 8.0),
+    "local": (0.0, 0.0),
+    "fake": (0.0, 0.0),
+}
+
+
+class Histogram:
+    """固定桶直方图（Prometheus累计桶语义）"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个为+Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """返回[(le, 累计计数)]，最后一项le为+Inf"""
+        result, running = [], 0
+        for bound, count in zip(list(self.buckets) + [float("inf")], self.counts):
+            running += count
+            result.append(("+Inf" if bound == float("inf") else repr(bound), running))
+        return result
+
+    def quantile(self, q: float) -> float:
+        """按桶上界估算分位数"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        for le, running in self.cumulative():
+            if running >= target:
+                return float("inf") if le == "+Inf" else float(le)
+        return float("inf")
+
+
+class LLMTelemetry:
+    """LLM调用遥测注册表（线程安全）"""
+
+    def __init__(self, pricing: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.pricing = pricing or dict(DEFAULT_PRICING)
+        self._lock = threading.Lock()
+        self._latency: Dict[str, Histogram] = {}
+        self._calls: Dict[Tuple[str, str, str], int] = {}   # (call_site, cache, error_class) -> 次数
+        self._tokens: Dict[Tuple[str, str], int] = {}       # (call_site, prompt/completion) -> Token数
+        self._cost: Dict[str, float] = {}                   # call_site -> 费用
+        self._cache_events: Dict[Tuple[str, str], int] = {} # (call_site, hit/coalesced) -> 次数（未调用模型，不计入延迟）
+        self._dump_thread: Optional[threading.Thread] = None
+        self._dump_stop = threading.Event()
+
+    # -------------------------- 记录 --------------------------
+    def record(self, call_site: str, latency_s: float, usage: Optional[Dict[str, int]] = None,
+               cache: str = "miss", error_class: str = "none", backend: str = "cloud") -> None:
+        """记录一次调用
+        Args:
+            call_site: Agent/调用点标识
+            latency_s: 耗时（秒）
+            usage: {"prompt_tokens": x, "completion_tokens": y}
+            cache: 缓存状态（miss=实际调用模型；结果缓存命中/合并用record_cache_event单独计数）
+            error_class: 异常类名（成功为none）
+            backend: 后端类型（用于计费）
+        """
+        usage = usage or {}
+        prompt_tokens = int(usage.get("prompt_tokens", 0) or 0)
+        completion_tokens = int(usage.get("completion_tokens", 0) or 0)
+        prompt_price, completion_price = self.pricing.get(backend, (0.0, 0.0))
+        cost = (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+        with self._lock:
+            self._latency.setdefault(call_site, Histogram()).observe(latency_s)
+            key = (call_site, cache, error_class)
+            self._calls[key] = self._calls.get(key, 0) + 1
+            for kind, value in (("prompt", prompt_tokens), ("completion", completion_tokens)):
+                self._tokens[(call_site, kind)] = self._tokens.get((call_site, kind), 0) + value
+            self._cost[call_site] = self._cost.get(call_site, 0.0) + cost
+
+    def record_cache_event(self, call_site: str, result: str) -> None:
+        """记录一次由结果缓存直接返回（hit）或合并到进行中调用（coalesced）的请求（不计入调用数与延迟直方图）"""
+        with self._lock:
+            key = (call_site, result)
+            self._cache_events[key] = self._cache_events.get(key, 0) + 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._cache_events.clear()
+            self._latency.clear()
+            self._calls.clear()
+            self._tokens.clear()
+            self._cost.clear()
+
+    # -------------------------- 导出 --------------------------
+    def snapshot(self) -> Dict[str, Any]:
+        """按调用点汇总（调用数/错误数/缓存命中/Token/费用/延迟分位数），按费用降序"""
+        with self._lock:
+            sites: Dict[str, Dict[str, Any]] = {}
+            for (site, cache, error_class), count in self._calls.items():
+                entry = sites.setdefault(site, {"calls": 0, "errors": {}, "cache": {}})
+                entry["calls"] += count
+                entry["cache"][cache] = entry["cache"].get(cache, 0) + count
+                if error_class != "none":
+                    entry["errors"][error_class] = entry["errors"].get(error_class, 0) + count
+            for site, entry in sites.items():
+                hist = self._latency.get(site, Histogram())
+                entry.update({
+                    "prompt_tokens": self._tokens.get((site, "prompt"), 0),
+                    "completion_tokens": self._tokens.get((site, "completion"), 0),
+                    "cost": round(self._cost.get(site, 0.0), 6),
+                    "latency_avg_s": round(hist.sum / hist.count, 4) if hist.count else 0.0,
+                    "latency_p50_s": hist.quantile(0.5),
+                    "latency_p95_s": hist.quantile(0.95),
+                })
+            cache_events: Dict[str, Dict[str, int]] = {}
+            for (site, result), count in self._cache_events.items():
+                cache_events.setdefault(site, {})[result] = count
+        return {
+            "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "call_sites": dict(sorted(sites.items(), key=lambda kv: kv[1]["cost"], reverse=True)),
+            "cache_events": cache_events,
+        }
+
+    def render_prometheus(self) -> str:
+        """Prometheus文本格式导出"""
+        lines = [
+            "# HELP edu_llm_calls_total LLM calls by call site, cache status and error class",
+            "# TYPE edu_llm_calls_total counter",
+        ]
+        with self._lock:
+            for (site, cache, error_class), count in sorted(self._calls.items()):
+                lines.append(f'edu_llm_calls_total{{call_site="{site}",cache="{cache}",error_class="{error_class}"}} {count}')
+            lines += ["# HELP edu_llm_tokens_total LLM tokens by call site and kind", "# TYPE edu_llm_tokens_total counter"]
+            for (site, kind), value in sorted(self._tokens.items()):
+                lines.append(f'edu_llm_tokens_total{{call_site="{site}",kind="{kind}"}} {value}')
+            lines += ["# HELP edu_llm_cost_total Estimated LLM cost by call site", "# TYPE edu_llm_cost_total counter"]
+            for site, value in sorted(self._cost.items()):
+                lines.append(f'edu_llm_cost_total{{call_site="{site}"}} {value:.6f}')
+            lines += ["# HELP edu_llm_cache_events_total Requests served from a result cache or coalesced (no model call)",
+                      "# TYPE edu_llm_cache_events_total counter"]
+            for (site, result), count in sorted(self._cache_events.items()):
+                lines.append(f'edu_llm_cache_events_total{{call_site="{site}",result="{result}"}} {count}')
+            lines += ["# HELP edu_llm_latency_seconds LLM call latency", "# TYPE edu_llm_latency_seconds histogram"]
+            for site, hist in sorted(self._latency.items()):
+                for le, running in hist.cumulative():
+                    lines.append(f'edu_llm_latency_seconds_bucket{{call_site="{site}",le="{le}"}} {running}')
+                lines.append(f'edu_llm_latency_seconds_sum{{call_site="{site}"}} {hist.sum:.6f}')
+                lines.append(f'edu_llm_latency_seconds_count{{call_site="{site}"}} {hist.count}')
+        return "\n".join(lines) + "\n"
+
+    def dump_json(self, path: str) -> None:
+        """写出一次JSON快照（先写临时文件再替换，避免读到半截文件）"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def start_periodic_dump(self, path: str, interval_s: float = 60.0) -> None:
+        """启动后台线程，每interval_s秒落盘一次JSON快照"""
+        if self._dump_thread and self._dump_thread.is_alive():
+            return
+        self._dump_stop.clear()
+
+        def loop() -> None:
+            while not self._dump_stop.wait(interval_s):
+                try:
+                    self.dump_json(path)
+                except OSError as e:
+                    print(f"⚠️ 遥测数据落盘失败：{e}")
+
+        self._dump_thread = threading.Thread(target=loop, name="llm-telemetry-dump", daemon=True)
+        self._dump_thread.start()
+
+    def stop_periodic_dump(self) -> None:
+        self._dump_stop.set()
+
+
+# 全局遥测实例（所有LLMClient共享）
+telemetry = LLMTelemetry()
+
+
+def render_metrics() -> str:
+    """/metrics完整导出：LLM调用遥测 + 各Prompt类型解析失败统计 + 各Agent Prompt Token统计 + 流水线阶段耗时
+    + 冲突规则命中/耗时 + 请求合并次数"""
+    from src.prompt_builder import get_prompt_token_stats
+    from utils.llm_json import get_parse_failure_stats
+    from functions.pipeline_dag import get_stage_timing_stats
+    from functions.coordinator_core import CONFLICT_RULES
+    from utils.singleflight import get_singleflight_stats
+
+    lines = [telemetry.render_prometheus().rstrip("\n")]
+    lines += ["# HELP edu_llm_parse_events_total Structured-output parse events by prompt type",
+              "# TYPE edu_llm_parse_events_total counter"]
+    for prompt_type, stats in sorted(get_parse_failure_stats().items()):
+        for event in ("calls", "parse_failures", "schema_failures", "retries", "gave_up"):
+            lines.append(f'edu_llm_parse_events_total{{prompt_type="{prompt_type}",event="{event}"}} {stats[event]}')
+    lines += ["# HELP edu_prompt_tokens_total Locally counted prompt tokens by agent",
+              "# TYPE edu_prompt_tokens_total counter"]
+    for agent, stats in sorted(get_prompt_token_stats().items()):
+        lines.append(f'edu_prompt_tokens_total{{agent="{agent}"}} {stats["total_tokens"]}')
+    lines += ["# HELP edu_pipeline_stage_milliseconds Agent pipeline stage durations (stage=__total__ is end-to-end)",
+              "# TYPE edu_pipeline_stage_milliseconds summary"]
+    for pipeline, stages in sorted(get_stage_timing_stats().items()):
+        for stage, stats in sorted(stages.items()):
+            labels = f'pipeline="{pipeline}",stage="{stage}"'
+            lines.append(f'edu_pipeline_stage_milliseconds_sum{{{labels}}} {stats["total_ms"]:.3f}')
+            lines.append(f'edu_pipeline_stage_milliseconds_count{{{labels}}} {stats["count"]}')
+    lines.append(CONFLICT_RULES.render_prometheus().rstrip("\n"))
+    lines += ["# HELP edu_singleflight_calls_total Calls executed vs coalesced onto an identical in-flight call",
+              "# TYPE edu_singleflight_calls_total counter"]
+    for name, stats in sorted(get_singleflight_stats().items()):
+        for result in ("executed", "coalesced", "errors"):
+            lines.append(f'edu_singleflight_calls_total{{name="{name}",result="{result}"}} {stats[result]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,228 @@
+"""NLU多模式匹配器（Aho-Corasick关键词自动机 + 预编译实体正则）
+设计意图：规则意图识别对每个意图的每个关键词逐一做 in 判断，实体提取对每个键用未编译的正则 re.findall
+（其中兜底的 GOAL: r".+" 还会扫描全文）；批量回放聊天日志时开销明显。
+这里把全部意图关键词和已知知识点名构建为一个Aho-Corasick自动机，一次扫描得到所有意图命中与知识点，
+扫描耗时只与句长有关、与词表规模无关；实体正则预编译且只取首个匹配（search代替findall），
+兜底的整句正则不再执行。实体正则未合并为单个交替式：各实体的匹配片段可能重叠
+（如 t_\w+ 会吞掉其后的"50"，使"50%"无法再匹配完成率），合并会改变提取结果。
+
+离线吞吐量测试：python -m src.nlu_matcher
+"""
+import re
+import time
+from collections import deque
+from typing import Dict, Any, Hashable, Iterable, Iterator, List, Optional, Pattern, Tuple
+
+# 兜底的"整句"正则无需真正执行，直接取首个非空行（与re.findall(".+")的首个结果一致）
+_CATCH_ALL_PATTERNS = {".+"}
+
+
+class AhoCorasickMatcher:
+    """Aho-Corasick多模式串匹配（一次扫描找出全部模式串的所有出现位置）"""
+
+    def __init__(self, patterns: Iterable[Tuple[str, Hashable]]):
+        """
+        Args:
+            patterns: (模式串, 负载) 对；同一模式串可携带多个负载
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, Hashable]]] = [[]]
+        for pattern, payload in patterns:
+            if pattern:
+                self._add(pattern, payload)
+        self._build_fail_links()
+
+    def _add(self, pattern: str, payload: Hashable) -> None:
+        state = 0
+        for char in pattern:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = nxt
+        self._output[state].append((pattern, payload))
+
+    def _build_fail_links(self) -> None:
+        """BFS构建失败指针，并展开为完整转移表（DFA）：扫描时每个字符只需一次字典查找"""
+        self._delta: List[Dict[str, int]] = [dict(self._goto[0])]
+        self._delta.extend({} for _ in range(len(self._goto) - 1))
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            fail = self._fail[state]
+            # 先继承失败状态的转移（失败状态更浅，BFS保证已构建完成），再覆盖自身的goto边
+            self._delta[state] = {**self._delta[fail], **self._goto[state]} if state else self._delta[state]
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                self._fail[nxt] = self._delta[fail].get(char, 0) if state else 0
+                # 合并失败链上的输出，扫描时无需再沿失败链回溯
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def findall(self, text: str) -> List[Tuple[str, Hashable]]:
+        """返回全部 (模式串, 负载) 命中（按结束位置顺序，含重叠命中）"""
+        delta, output = self._delta, self._output
+        found: List[Tuple[str, Hashable]] = []
+        state = 0
+        for char in text:
+            state = delta[state].get(char, 0)
+            if output[state]:
+                found.extend(output[state])
+        return found
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, str, Hashable]]:
+        """产出 (结束位置, 模式串, 负载)"""
+        delta, output = self._delta, self._output
+        state = 0
+        for pos, char in enumerate(text):
+            state = delta[state].get(char, 0)
+            for pattern, payload in output[state]:
+                yield pos + 1, pattern, payload
+
+
+class NLUScanResult:
+    """单句扫描结果"""
+    __slots__ = ("intent_hits", "entities", "skills")
+
+    def __init__(self, intent_hits: Dict[Any, int], entities: Dict[str, Any], skills: List[str]):
+        self.intent_hits = intent_hits  # {意图: 命中的不同关键词数}
+        self.entities = entities        # 规则提取的实体
+        self.skills = skills            # 命中的知识点名（按出现顺序，去重）
+
+
+class NLUMatcher:
+    """意图关键词 + 知识点名 + 实体正则的一次性扫描器"""
+
+    def __init__(self, intent_keywords: Dict[Any, List[str]], entity_patterns: Dict[str, str],
+                 skill_names: Optional[Iterable[str]] = None,
+                 value_converters: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            intent_keywords: {意图: 关键词列表}（按小写匹配）
+            entity_patterns: {实体键: 正则}，有分组时取第1个分组，否则取整个匹配
+            skill_names: 已知知识点名（按小写匹配，返回原始写法）
+            value_converters: {实体键: 转换函数}，如完成率转int、科目别名归一化
+        """
+        # 负载：意图关键词为 (意图, 关键词)，知识点为 (None, 原始写法)
+        patterns: List[Tuple[str, Hashable]] = []
+        for intent, keywords in intent_keywords.items():
+            patterns += [(keyword.lower(), (intent, keyword.lower())) for keyword in keywords]
+        skill_lookup: Dict[str, str] = {}
+        for name in skill_names or []:
+            if name and name.strip():
+                skill_lookup.setdefault(name.lower(), name)
+        patterns += [(key, (None, name)) for key, name in skill_lookup.items()]
+        self.automaton = AhoCorasickMatcher(patterns)
+
+        # (实体键, 预编译正则, 取值分组)；兜底整句正则的正则为None
+        self._entity_regexes: List[Tuple[str, Optional[Pattern], int]] = []
+        for key, pattern in entity_patterns.items():
+            if pattern in _CATCH_ALL_PATTERNS:
+                self._entity_regexes.append((key, None, 0))
+            else:
+                regex = re.compile(pattern)
+                self._entity_regexes.append((key, regex, 1 if regex.groups else 0))
+        self.value_converters = value_converters or {}
+
+    def scan(self, text: str) -> NLUScanResult:
+        """扫描一次，同时返回意图命中、规则实体和知识点"""
+        hit_payloads = dict.fromkeys(payload for _, payload in self.automaton.findall(text.lower()))  # 去重保序
+        intent_hits: Dict[Any, int] = {}
+        skills: List[str] = []
+        for intent, value in hit_payloads:
+            if intent is None:
+                skills.append(value)
+            else:
+                intent_hits[intent] = intent_hits.get(intent, 0) + 1
+
+        entities: Dict[str, Any] = {}
+        converters = self.value_converters
+        for key, regex, group in self._entity_regexes:
+            if regex is None:
+                value = next((line for line in text.split("\n") if line), None)
+                if value is None:
+                    continue
+            else:
+                match = regex.search(text)
+                if match is None:
+                    continue
+                value = match.group(group)
+            entities[key] = converters[key](value) if key in converters else value
+        return NLUScanResult(intent_hits, entities, skills)
+
+
+# -------------------------- 离线吞吐量测试 --------------------------
+def _legacy_scan(text: str, intent_keywords: Dict[Any, List[str]], entity_patterns: Dict[str, str],
+                 skill_names: List[str]) -> Tuple[Dict[Any, int], Dict[str, Any], List[str]]:
+    """原实现：逐关键词in判断 + 未编译正则re.findall（知识点名同样逐个in判断）"""
+    text_lower = text.lower()
+    hits = {}
+    for intent, keywords in intent_keywords.items():
+        count = sum(1 for keyword in keywords if keyword in text_lower)
+        if count:
+            hits[intent] = count
+    entities = {}
+    for key, pattern in entity_patterns.items():
+        matches = re.findall(pattern, text)
+        if matches:
+            entities[key] = matches[0]
+    skills = [name for name in skill_names if name.lower() in text_lower]
+    return hits, entities, skills
+
+
+def run_matcher_benchmark(num_utterances: int = 100000, num_skills: int = 120, seed: int = 0) -> Dict[str, Any]:
+    """在合成的大规模用户输入语料上对比 原实现 vs NLUMatcher 的吞吐量
+    num_skills: 知识点名数量（模拟数据只有十余个，不足时补充合成知识点名，接近真实数据集规模）
+    """
+    import random
+    import sys
+    import os
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from agents.Agent_nlu import AgentNLU
+
+    nlu_agent = AgentNLU(model_type="fake")
+    rng = random.Random(seed)
+    skills = list(nlu_agent.skill_names)
+    skills += [f"Skill-{i:03d}" for i in range(max(0, num_skills - len(skills)))]
+    matcher = NLUMatcher(nlu_agent.intent_keywords, nlu_agent.entity_patterns, skill_names=skills)
+    templates = [
+        "帮我评估S{sid}的{subject}水平，{skill}是不是薄弱点",
+        "给S{sid}制定{subject}学习计划，目标期末{score}分，重点是{skill}",
+        "S{sid}的{subject}问题：为什么{skill}这道题要这样做？",
+        "S{sid}的{subject}计划进度落后了，任务T{task}只完成了{rate}%，帮我协调一下",
+        "老师说{skill}和{skill2}很重要，我该怎么复习{subject}",
+    ]
+    corpus = [
+        rng.choice(templates).format(
+            sid=rng.randint(10000, 99999), subject=rng.choice(["math", "数学", "语文", "英语"]),
+            skill=rng.choice(skills), skill2=rng.choice(skills), score=rng.randint(60, 100),
+            task=rng.randint(1, 999), rate=rng.randint(0, 100))
+        for _ in range(num_utterances)
+    ]
+
+    start = time.perf_counter()
+    for text in corpus:
+        _legacy_scan(text, nlu_agent.intent_keywords, nlu_agent.entity_patterns, skills)
+    legacy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for text in corpus:
+        matcher.scan(text)
+    matcher_s = time.perf_counter() - start
+
+    return {
+        "utterances": num_utterances,
+        "keywords": sum(len(v) for v in nlu_agent.intent_keywords.values()),
+        "skill_names": len(skills),
+        "legacy_per_s": round(num_utterances / legacy_s),
+        "matcher_per_s": round(num_utterances / matcher_s),
+        "speedup": round(legacy_s / matcher_s, 2),
+    }
+
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(run_matcher_benchmark(), ensure_ascii=False, indent=2))
@@ -0,0 +1,174 @@
+"""Prompt构建工具（紧凑编码学生上下文 + Token预算控制 + 按Agent统计Prompt Token数）
+设计意图：学生上下文原样json.dumps会携带大量冗余字段（如完整mastered_skills列表），
+推高输入Token、费用和延迟；这里统一做去重、Top-N截断、短键名编码，并在预算内逐级压缩。
+"""
+import json
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:  # 可选依赖：安装tiktoken时使用真实分词器，否则使用本地近似计数
+    import tiktoken
+    _ENCODER = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODER = None
+
+_CJK_PATTERN = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+
+# -------------------------- Token计数 --------------------------
+def count_tokens(text: str) -> int:
+    """本地计算Token数（tiktoken可用时精确计数，否则按 中文1字≈1token、其他4字符≈1token 估算）"""
+    if not text:
+        return 0
+    if _ENCODER is not None:
+        return len(_ENCODER.encode(text))
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + math.ceil(other_count / 4)
+
+
+# -------------------------- 按Agent统计Prompt Token --------------------------
+_stats_lock = threading.Lock()
+_prompt_token_stats: Dict[str, Dict[str, int]] = {}
+
+def log_prompt_tokens(agent: str, prompt: str) -> int:
+    """记录某个Agent本次Prompt的Token数（累计次数/总量/最大值），返回本次Token数"""
+    tokens = count_tokens(prompt)
+    with _stats_lock:
+        stats = _prompt_token_stats.setdefault(agent, {"calls": 0, "total_tokens": 0, "max_tokens": 0})
+        stats["calls"] += 1
+        stats["total_tokens"] += tokens
+        stats["max_tokens"] = max(stats["max_tokens"], tokens)
+    logger.info("prompt tokens agent=%s tokens=%d", agent, tokens)
+    return tokens
+
+def get_prompt_token_stats() -> Dict[str, Dict[str, Any]]:
+    """获取各Agent的Prompt Token统计（含平均值）"""
+    with _stats_lock:
+        return {
+            agent: {**stats, "avg_tokens": round(stats["total_tokens"] / stats["calls"], 1) if stats["calls"] else 0.0}
+            for agent, stats in _prompt_token_stats.items()
+        }
+
+def reset_prompt_token_stats() -> None:
+    """清空Prompt Token统计"""
+    with _stats_lock:
+        _prompt_token_stats.clear()
+
+
+# -------------------------- 学生上下文紧凑编码 --------------------------
+def rank_skills(skills: List[str], top_n: int) -> Tuple[List[str], int]:
+    """技能去重+排序（出现次数降序，同频保持原顺序），返回(Top-N技能, 去重后总数)"""
+    counts = Counter(str(s) for s in skills if s)
+    first_seen = {}
+    for idx, skill in enumerate(str(s) for s in skills if s):
+        first_seen.setdefault(skill, idx)
+    ranked = sorted(counts, key=lambda s: (-counts[s], first_seen[s]))
+    return ranked[:top_n], len(ranked)
+
+def compact_student_context(basic_data: Dict[str, Any], dynamic_data: Dict[str, Any], top_n_skills: int = 10,
+                            include_resource: bool = True) -> Dict[str, Any]:
+    """将评估所需的学生上下文编码为短键名结构
+    键名说明：g=年级, pref=学习偏好, acc=正确率, n=答题数, sk=掌握技能Top-N, sk_n=掌握技能总数,
+             kp={知识点: [考试, 作业, 课堂]}, res=高错误率资源概况(kp/avg/n)
+    """
+    portrait = basic_data.get("behavior_portrait", {}) or {}
+    skills = basic_data.get("mastered_skills") or portrait.get("mastered_skills", [])
+    top_skills, total_skills = rank_skills(list(skills), top_n_skills)
+
+    context = {
+        "g": basic_data.get("grade", "未知年级"),
+        "pref": basic_data.get("learning_preference", "text"),
+    }
+    if "accuracy" in portrait:
+        context["acc"] = portrait["accuracy"]
+    if "total_problems" in portrait:
+        context["n"] = portrait["total_problems"]
+    if top_skills:
+        context["sk"] = top_skills
+    context["sk_n"] = total_skills
+
+    # 多源数据按知识点合并为 [考试, 作业, 课堂]，避免三份重复的知识点键名
+    sources = ("exam", "homework", "class_interaction")
+    knowledge_points = list(dict.fromkeys(kp for src in sources for kp in dynamic_data.get(src, {})))
+    if knowledge_points:
+        context["kp"] = {
+            kp: [dynamic_data.get(src, {}).get(kp) for src in sources]
+            for kp in knowledge_points
+        }
+
+    resource = dynamic_data.get("resource_interaction")
+    if include_resource and resource:
+        context["res"] = {
+            "kp": list(dict.fromkeys(resource.get("high_error_knowledge", []))),
+            "avg": resource.get("avg_error_rate", 0.0),
+            "n": resource.get("total_high_error_resources", 0)
+        }
+    return context
+
+
+# -------------------------- Prompt构建器 --------------------------
+# 评估输出格式说明（单独成常量，批量评估时只需在Prompt中出现一次）
+ASSESSMENT_OUTPUT_SPEC = (
+    "### 仅返回JSON ###\n"
+    '{"knowledge_mastery":{知识点:0-100(<60未掌握)},'
+    '"ability_level":{"comprehensive":1-5,"understand":1-5,"apply":1-5},'
+    '"learning_habits":{"preference":"visual/auditory/text","delay_rate":0-1},'
+    '"role_goals":{"student":"","parent":"","teacher":""},'
+    '"diagnosis":"核心问题结论","error_points":["未掌握知识点"],'
+    '"improvement_suggestions":{"knowledge":"","resource":""}}'
+)
+
+class PromptBuilder:
+    """带Token预算的Prompt构建器（超预算时按 技能Top-N减半→去掉资源概况→逐个裁剪知识点 的顺序逐级压缩）"""
+
+    def __init__(self, agent: str = "assessment", token_budget: int = 800, top_n_skills: int = 10):
+        """
+        Args:
+            agent: Agent/调用点标识（用于Token统计）
+            token_budget: Prompt Token预算上限
+            top_n_skills: 掌握技能最多保留的数量
+        """
+        self.agent = agent
+        self.token_budget = token_budget
+        self.top_n_skills = top_n_skills
+
+    def build_assessment_prompt(self, basic_data: Dict[str, Any], dynamic_data: Dict[str, Any], subject: str) -> str:
+        """生成预算内的学业评估Prompt"""
+        top_n = self.top_n_skills
+        include_resource = True
+        max_kp = None
+        while True:
+            context = compact_student_context(basic_data, dynamic_data, top_n, include_resource)
+            if max_kp is not None and "kp" in context:
+                context["kp"] = dict(list(context["kp"].items())[:max_kp])
+            prompt = self._render_assessment_prompt(basic_data, context, subject)
+            tokens = count_tokens(prompt)
+            if tokens <= self.token_budget:
+                break
+            if top_n > 0:
+                top_n //= 2
+            elif include_resource:
+                include_resource = False
+            elif context.get("kp"):
+                max_kp = len(context["kp"]) - 1
+            else:
+                # 输出格式说明不可裁剪，已压缩到最小仍超预算时仅告警
+                logger.warning("prompt over budget agent=%s tokens=%d budget=%d", self.agent, tokens, self.token_budget)
+                break
+        log_prompt_tokens(self.agent, prompt)
+        return prompt
+
+    def _render_assessment_prompt(self, basic_data: Dict[str, Any], context: Dict[str, Any], subject: str) -> str:
+        return (
+            f"### 学业评估 ###\n"
+            f"对象：{basic_data.get('grade', '未知年级')}学生 ID={basic_data.get('student_id')} 学科={subject}\n"
+            f"上下文(g年级 pref偏好 acc正确率 n题数 sk掌握技能 sk_n技能总数 kp知识点[考试,作业,课堂] res高错资源)："
+            f"{json.dumps(context, ensure_ascii=False, separators=(',', ':'))}\n"
+            f"{ASSESSMENT_OUTPUT_SPEC}"
+        )
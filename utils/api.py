@@ -1,7 +1,29 @@
+"""学业领航框架 HTTP API（基于 AgentsManager）
+设计意图：Agent调用（数据查询、LLM请求、冲突处理）都是阻塞的同步代码，直接在 async 处理函数里执行会卡住事件循环，
+并发请求只能串行。这里所有阻塞调用都提交到有上限的线程池执行（等待队列超过上限时直接返回503，避免积压拖垮进程）；
+数据集与全部Agent在 lifespan 中加载一次；参数相同的并发评估/规划/协调请求只执行一次，其余请求等待并共享结果。多进程部署时由 main.py 在主进程预加载后再fork出各worker，
+worker之间按写时复制共享已加载的数据；线程池在各worker的lifespan中创建（线程不会随fork继承）。
+JSON接口的结果直接编码并按Accept-Encoding压缩（见 utils/fast_response.py），不再经 response_model 重新校验。
+
+环境变量：
+    EDU_DATA_PATH           数据集路径
+    EDU_API_THREADS         每个worker执行Agent调用的线程数（默认32）
+    EDU_API_MAX_PENDING     每个worker同时在途（执行中+排队）的请求上限（默认256）
+    EDU_METRICS_DUMP_PATH   定期落盘遥测JSON快照（路径中的{pid}替换为worker进程号）
+"""
 import os
 import sys
-from typing import List, Optional
-from fastapi import FastAPI
+import json
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel
 
 # ============================== 路径配置 ==============================
 current_file_path = os.path.abspath(__file__)
@@ -10,74 +32,216 @@ project_root = os.path.dirname(utils_dir)
 sys.path.append(project_root)
 
 # ============================== 核心逻辑导入 ==============================
-from src.Clinet_LLM import LLMClient
-from src.Agent_accesment import AcademicAssessmentAgent
-from src.Agent_cooridinator import CoordinatorAgent
-from src.Agent_dbmanager import DatabaseManagerAgent
-from src.Agent_guidence import AcademicGuidanceAgent
-from src.Agent_planner import AcademicPlanningAgent
-from schemas import PlanningRequest, PlanningResponse, ExecutionFeedback
+from src.agents_wrapper import AgentsManager
+from src.basemodel import PlanningRequest, PlanningResponse, ExecutionFeedback, InvalidRequestError
+from src.llm_telemetry import telemetry, render_metrics
+from utils.singleflight import SingleFlight, make_key
+from utils.fast_response import json_response, shape_to_model
+
+# ============================== 配置 ==============================
+DEFAULT_DATA_PATH = "/home/lst/data/assistment2009/skill_builder_data.csv"
+API_THREADS = int(os.environ.get("EDU_API_THREADS", "32"))
+API_MAX_PENDING = int(os.environ.get("EDU_API_MAX_PENDING", "256"))
+
+# 进程级AgentsManager：prefork部署时由主进程在fork前创建，各worker直接复用
+_manager: Optional[AgentsManager] = None
+
+
+def preload_manager(data_path: Optional[str] = None) -> AgentsManager:
+    """加载数据集并初始化全部Agent（已加载时直接返回）"""
+    global _manager
+    if _manager is None:
+        _manager = AgentsManager(data_path=data_path or os.environ.get("EDU_DATA_PATH", DEFAULT_DATA_PATH))
+    return _manager
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    app.state.manager = preload_manager()
+    app.state.executor = ThreadPoolExecutor(max_workers=API_THREADS, thread_name_prefix="api-agent")
+    app.state.pending = 0
+    dump_path = os.environ.get("EDU_METRICS_DUMP_PATH")
+    if dump_path:
+        telemetry.start_periodic_dump(dump_path.replace("{pid}", str(os.getpid())),
+                                      float(os.environ.get("EDU_METRICS_DUMP_INTERVAL", "60")))
+    try:
+        yield
+    finally:
+        telemetry.stop_periodic_dump()
+        app.state.executor.shutdown(wait=False, cancel_futures=True)
+
 
 # ============================== FastAPI 应用初始化 ==============================
-app = FastAPI(title="LLM多智能体协同学业领航框架API")
+app = FastAPI(title="LLM多智能体协同学业领航框架API", lifespan=lifespan)
+
+
+def _acquire_pending(state: Any) -> None:
+    """占用一个在途名额，超过上限时返回503（只在事件循环线程中修改，无需加锁）"""
+    if state.pending >= API_MAX_PENDING:
+        raise HTTPException(status_code=503, detail="服务繁忙，请稍后重试")
+    state.pending += 1
+
+async def _call_in_executor(state: Any, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """在线程池中执行阻塞调用；InvalidRequestError（含被Agent或流水线阶段包装后抛出的）按400返回，其余按500"""
+    try:
+        return await asyncio.get_running_loop().run_in_executor(state.executor, partial(func, *args, **kwargs))
+    except Exception as e:
+        cause: Optional[BaseException] = e
+        while cause is not None and not isinstance(cause, InvalidRequestError):
+            cause = getattr(cause, "error", None) or cause.__cause__ or cause.__context__
+        if cause is not None:
+            raise HTTPException(status_code=400, detail=str(cause)) from e
+        raise
+
+async def run_blocking(request: Request, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """在线程池中执行阻塞调用；在途请求超过上限时返回503"""
+    state = request.app.state
+    _acquire_pending(state)
+    try:
+        return await _call_in_executor(state, func, *args, **kwargs)
+    finally:
+        state.pending -= 1
+
+
+# 相同参数的并发请求合并（规划与协调接口都执行run_coordination，共用一个合并实例）
+_assessment_flight = SingleFlight("api_assessment")
+_coordination_flight = SingleFlight("api_coordination")
+
+
+async def run_coalesced(request: Request, flight: SingleFlight, key: str, func: Callable[..., Any], *args: Any) -> Any:
+    """相同键已有请求在执行时等待其结果（不占用线程池与在途名额），否则在线程池中执行"""
+    return await flight.do_async(key, lambda: run_blocking(request, func, *args))
+
+
+def _coordination_args(body: PlanningRequest, search_orders: bool = False) -> Tuple[str, Tuple[Any, ...]]:
+    """规范化后的协调参数及其合并键（实际执行也使用规范化参数，合并的请求结果与各自单独执行一致）"""
+    args = (body.student_id.strip(), body.subject.strip().lower(), body.long_term_goal.strip(),
+            _feedback_dict(body.execution_feedback), search_orders)
+    return make_key("coordination", *args), args
+
+
+# ============================== 请求模型 ==============================
+class AssessmentRequest(BaseModel):
+    student_id: str
+    subject: str
+
+
+class CoordinationRequest(PlanningRequest):
+    search_orders: bool = False  # 评估多个冲突解决顺序并采用得分最高者
+
+
+def _feedback_dict(feedback: Optional[ExecutionFeedback]) -> Optional[Dict[str, Any]]:
+    return feedback.model_dump(exclude_none=True) if feedback is not None else None
 
-# ============================== 全局组件初始化 ==============================
-global_llm = LLMClient(model_type="local", model_name="llama3-edu")
-db_agent = DatabaseManagerAgent()
-assessment_agent = AcademicAssessmentAgent(global_llm, db_agent)
-planning_agent = AcademicPlanningAgent(global_llm, assessment_agent, db_agent)
-coordinator_agent = CoordinatorAgent(assessment_agent, planning_agent, db_agent)
-guidance_agent = AcademicGuidanceAgent(global_llm, assessment_agent, db_agent)
 
 # ============================== API 接口实现 ==============================
+@app.get("/healthz", summary="存活检查")
+async def healthz(request: Request):
+    return {"status": "ok", "pid": os.getpid(), "pending": request.app.state.pending}
+
+
+@app.post("/api/v1/assessment", summary="学业评估")
+async def get_assessment(body: AssessmentRequest, request: Request):
+    args = (body.student_id.strip(), body.subject.strip().lower())
+    result = await run_coalesced(request, _assessment_flight, make_key("assessment", *args),
+                                 request.app.state.manager.run_assessment, *args)
+    return json_response(request, result)
+
+
 @app.post("/api/v1/planning", response_model=PlanningResponse, summary="获取个性化学习规划")
-async def get_planning(request: PlanningRequest):
-    initial_plan = planning_agent.run(
-        student_id=request.student_id,
-        subject=request.subject,
-        long_term_goal=request.long_term_goal,
-        execution_feedback=request.execution_feedback
-    )
-    assessment_result = assessment_agent.run(request.student_id, request.subject)
-    conflicts = coordinator_agent.detect_conflict(assessment_result, initial_plan)
-    conflict_log = [f"冲突类型：{c['conflict_type']}，详情：{c['detail']['diagnosis'] if 'diagnosis' in c['detail'] else '数据矛盾/目标冲突'}" for c in conflicts]
-    
-    optimized_plan = initial_plan
-    for conflict in conflicts:
-        optimized_plan = coordinator_agent.resolve_conflict(conflict, optimized_plan, assessment_result)
-    
-    recommended_resources = list(optimized_plan.resource_mapping.values())[:5]
-    
-    return PlanningResponse(
-        student_id=request.student_id,
-        personalized_plan=optimized_plan,
-        conflict_resolution_log=conflict_log,
-        recommended_resources=recommended_resources
-    )
+async def get_planning(body: PlanningRequest, request: Request):
+    """规划 → 评估 → 冲突检测与解决，返回优化后的规划（按PlanningResponse字段输出，response_model用于接口文档）"""
+    key, args = _coordination_args(body)
+    result = await run_coalesced(request, _coordination_flight, key, request.app.state.manager.run_coordination, *args)
+    plan = result["resolved_plan"]
+    conflict_log = [
+        f"冲突类型：{record['conflict_type']}，状态：{record['status']}"
+        + (f"，错误：{record['error']}" if record.get("error") else "")
+        for record in result["conflict_records"]
+    ]
+    return json_response(request, shape_to_model(PlanningResponse, {
+        "student_id": body.student_id,
+        "personalized_plan": plan,
+        "conflict_resolution_log": conflict_log,
+        "recommended_resources": list(dict.fromkeys(plan.get("resource_mapping", {}).values()))[:5]
+    }))
+
+
+@app.post("/api/v1/coordination", summary="智能协调（完整输出）")
+async def get_coordination(body: CoordinationRequest, request: Request):
+    key, args = _coordination_args(body, body.search_orders)
+    result = await run_coalesced(request, _coordination_flight, key, request.app.state.manager.run_coordination, *args)
+    return json_response(request, result)
+
 
 @app.post("/api/v1/guidance", summary="学业问题交互式引导")
-async def get_guidance(student_id: str, subject: str, question_desc: str, inquiry_answers: Optional[List[str]] = None):
-    return guidance_agent.run(student_id, subject, question_desc, inquiry_answers)
-
-# ============================== 模块内测试代码 ==============================
-if __name__ == "__main__":
-    test_student_id = "S2023001"
-    test_subject = "math"
-    test_goal = "高考数学130+"
-    
-    print("--- 开始测试 API 核心功能 ---")
-    
-    try:
-        print(f"\n1. 测试评估智能体 (学生ID: {test_student_id}, 科目: {test_subject})")
-        assessment = assessment_agent.run(test_student_id, test_subject)
-        print("评估结果：", assessment.dict())
-    except Exception as e:
-        print(f"评估智能体测试失败: {e}")
-    
+async def get_guidance(request: Request, student_id: str, subject: str, question_desc: str,
+                       inquiry_answers: Optional[List[str]] = Query(None), session_id: Optional[str] = None):
+    result = await run_blocking(request, request.app.state.manager.run_guidance,
+                                student_id, subject, question_desc, inquiry_answers, session_id)
+    return json_response(request, result)
+
+
+@app.post("/api/v1/guidance/stream", summary="学业问题交互式引导（SSE流式输出）")
+async def get_guidance_stream(request: Request, student_id: str, subject: str, question_desc: str,
+                              inquiry_answers: Optional[List[str]] = Query(None), session_id: Optional[str] = None):
+    """Server-Sent Events：token事件逐段推送LLM输出，result事件推送完整结果（逐段读取同样在线程池中执行）
+    整个流在结束或客户端断开前占用一个在途名额；结束/断开时关闭Agent的生成器
+    """
+    state = request.app.state
+    _acquire_pending(state)
     try:
-        print(f"\n2. 测试规划智能体 (目标: {test_goal})")
-        feedback = ExecutionFeedback(task_id="t_adv_函数单调性_3", completion_rate=65, score=58)
-        plan = planning_agent.run(test_student_id, test_subject, test_goal, feedback)
-        print("规划结果：", plan.dict())
-    except Exception as e:
-        print(f"规划智能体测试失败: {e}")
\ No newline at end of file
+        events = await _call_in_executor(state, state.manager.run_guidance_stream,
+                                         student_id, subject, question_desc, inquiry_answers, session_id)
+    except BaseException:
+        state.pending -= 1
+        raise
+    done = object()
+    reading: List[Future] = []  # 正在线程池中执行的next调用
+    released = False
+
+    def release() -> None:
+        """归还在途名额并关闭生成器（流正常结束、出错、客户端断开时都会调用，只生效一次）"""
+        nonlocal released
+        if released:
+            return
+        released = True
+        state.pending -= 1
+        if reading and not reading[0].done():
+            reading[0].add_done_callback(lambda _: events.close())  # 生成器执行中不能关闭，待本次next返回后关闭
+            return
+        try:
+            state.executor.submit(events.close)
+        except RuntimeError:  # 线程池已关闭（进程退出中）
+            events.close()
+
+    async def release_after_response() -> None:
+        release()
+
+    async def event_source():
+        try:
+            while True:
+                reading[:] = [state.executor.submit(next, events, done)]
+                event = await asyncio.wrap_future(reading[0])
+                if event is done:
+                    break
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)}, ensure_ascii=False)}\n\n"
+        finally:
+            release()
+
+    # 客户端在流开始前断开时生成器不会执行finally，响应结束后的后台任务兜底归还名额
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(release_after_response)
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse, summary="Prometheus指标（LLM调用延迟/Token/费用/缓存/错误）")
+async def get_metrics(request: Request):
+    """指标为当前worker进程内的统计（多worker部署时由Prometheus分别抓取或按pid区分落盘）"""
+    text = await run_blocking(request, render_metrics)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
@@ -0,0 +1,227 @@
+"""API响应快速序列化与压缩协商
+设计意图：规划/协调结果（多月规划 + 补漏周 + 融合目标任务）体积较大，原先由FastAPI按 response_model 重新校验一遍
+内部生成的字典，再经 jsonable_encoder 逐层转换、标准库json编码，且不压缩。
+这里对内部生成、结构可信的结果按响应模型裁剪字段后直接编码（跳过模型校验与jsonable_encoder；response_model仍用于接口文档），
+安装orjson时用orjson编码，否则退回标准库json；响应体超过阈值时按请求的 Accept-Encoding 协商压缩
+（安装brotli时优先br，其次gzip）。SSE流式接口不经过这里（逐段压缩会破坏实时推送）。
+
+耗时与字节数对比：python -m utils.fast_response
+"""
+import gzip
+import json
+import time
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union, get_args, get_origin
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+try:  # 可选依赖：更快的JSON编码
+    import orjson
+except ImportError:
+    orjson = None
+
+try:  # 可选依赖：brotli压缩（同等CPU开销下压缩率高于gzip）
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_COMPRESS_BYTES = 1024  # 小响应压缩收益低于CPU开销，不压缩
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4  # 动态内容常用档位（11档适合静态资源预压缩）
+
+
+# -------------------------- 编码 --------------------------
+def _default(value: Any) -> Any:
+    """orjson不能直接编码的类型：pydantic模型、集合/元组、numpy标量"""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"无法序列化类型{type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """编码为UTF-8 JSON字节串（中文不转义，无多余空白）"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# -------------------------- 按响应模型裁剪（不校验） --------------------------
+@lru_cache(maxsize=None)
+def _model_layout(model: Type[BaseModel]) -> Tuple[Tuple[str, Optional[Type[BaseModel]], bool], ...]:
+    """响应模型各字段：(字段名, 嵌套模型或None, 是否为模型列表)"""
+    layout = []
+    for name, field in model.model_fields.items():
+        annotation, is_list = field.annotation, False
+        while get_origin(annotation) is Union:  # Optional[X]
+            annotation = next(arg for arg in get_args(annotation) if arg is not type(None))
+        if get_origin(annotation) in (list, List):
+            annotation, is_list = get_args(annotation)[0], True
+        nested = annotation if isinstance(annotation, type) and issubclass(annotation, BaseModel) else None
+        layout.append((name, nested, is_list))
+    return tuple(layout)
+
+
+def shape_to_model(model: Type[BaseModel], data: Dict[str, Any]) -> Dict[str, Any]:
+    """把内部生成的可信字典裁剪为响应模型声明的字段（与response_model输出的字段一致，但不做类型校验与转换）"""
+    shaped = {}
+    for name, nested, is_list in _model_layout(model):
+        if name not in data:
+            continue
+        value = data[name]
+        if nested is not None and value is not None:
+            value = [shape_to_model(nested, item) for item in value] if is_list else shape_to_model(nested, value)
+        shaped[name] = value
+    return shaped
+
+
+# -------------------------- 压缩协商 --------------------------
+def _accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """解析Accept-Encoding为 {编码: q值}"""
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """按客户端q值选择 br / gzip（q相同时优先br），都不接受时返回None"""
+    if not accept_encoding:
+        return None
+    accepted = _accepted_encodings(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_q = None, 0.0
+    for name in candidates:
+        q = accepted.get(name, wildcard)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def json_response(request: Request, content: Any, status_code: int = 200) -> Response:
+    """快速JSON响应：直接编码内部结果，超过阈值时按Accept-Encoding压缩"""
+    body = dumps(content)
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= MIN_COMPRESS_BYTES:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        if encoding is not None:
+            body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+# -------------------------- 耗时与字节数对比 --------------------------
+def _sample_payloads() -> List[Tuple[str, Callable[[], bytes], Callable[[], bytes]]]:
+    """(名称, 原路径, 快速路径)：真实流水线生成的规划（含反馈补漏周）与26/52周长规划经冲突解决后的
+    规划接口响应（原路径：response_model校验后按模型输出），以及协调接口完整输出（原路径：jsonable_encoder）
+    """
+    import os
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from src.basemodel import PlanningResponse
+    from src.agents_wrapper import AgentsManager
+    from functions.coordinator_core import detect_and_resolve_conflicts, integrate_service_output
+    from functions.indexed_plan import _synthetic_plan
+
+    def planning_payload(plan: Dict[str, Any], records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "student_id": "S1",
+            "personalized_plan": plan,
+            "conflict_resolution_log": [f"冲突类型：{r['conflict_type']}，状态：{r['status']}" for r in records],
+            "recommended_resources": list(dict.fromkeys(plan.get("resource_mapping", {}).values()))[:5],
+        }
+
+    def planning_paths(payload: Dict[str, Any]) -> Tuple[Callable[[], bytes], Callable[[], bytes]]:
+        return (lambda: JSONResponse(PlanningResponse.model_validate(payload).model_dump(mode="json")).body,
+                lambda: dumps(shape_to_model(PlanningResponse, payload)))
+
+    def dict_paths(payload: Dict[str, Any]) -> Tuple[Callable[[], bytes], Callable[[], bytes]]:
+        return lambda: JSONResponse(jsonable_encoder(payload)).body, lambda: dumps(payload)
+
+    manager = AgentsManager(data_path=os.environ.get("EDU_DATA_PATH", "skill_builder_data.csv"), model_type="fake")
+    goal = "期末数学成绩提升至90分以上"
+    result = manager.run_coordination("S1", "math", goal)
+    for _ in range(6):  # 连续反馈完成率偏低，累积补漏周与调整历史
+        first_task = result["resolved_plan"]["weekly_tasks"][0]["tasks"][0]["task_id"]
+        result = manager.run_coordination("S1", "math", goal, {"task_id": first_task, "completion_rate": 30})
+    samples = [("planning/pipeline", *planning_paths(planning_payload(result["resolved_plan"], result["conflict_records"])))]
+
+    assessment = {
+        "student_id": "S1", "subject": "math",
+        "knowledge_mastery": {f"kp{i}": 45 + i * 3 for i in range(12)},
+        "ability_level": {"comprehensive": 2}, "learning_habits": {"preference": "visual"},
+        "role_goals": {"student": "期末补弱基础", "parent": "提分拔高", "teacher": "高考长期规划"},
+        "multi_source_data": {source: {f"kp{i}": 40 + (i * 7 + offset) % 50 for i in range(12)}
+                              for source, offset in (("exam", 0), ("homework", 20), ("class_interaction", 35))},
+        "error_points": ["kp0", "kp1"], "diagnosis": "",
+    }
+    for weeks in (26, 52):
+        plan = _synthetic_plan(weeks, 5)
+        plan["weekly_tasks"][0]["tasks"][0]["content"] += "（压轴题）"
+        resolved = detect_and_resolve_conflicts(assessment, plan)
+        samples.append((f"planning/{weeks}_weeks",
+                        *planning_paths(planning_payload(resolved["resolved_plan"], resolved["conflict_records"]))))
+        if weeks == 52:
+            samples.append(("coordination/52_weeks", *dict_paths(integrate_service_output(assessment, resolved))))
+    return samples
+
+
+def run_serialization_benchmark(rounds: int = 200) -> List[Dict[str, Any]]:
+    """原路径 vs 快速路径 的序列化耗时、输出是否一致，以及gzip/br压缩后字节数与压缩耗时"""
+    rows = []
+    for name, legacy, fast in _sample_payloads():
+        start = time.perf_counter()
+        for _ in range(rounds):
+            legacy_body = legacy()
+        legacy_ms = (time.perf_counter() - start) * 1000 / rounds
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fast_body = fast()
+        fast_ms = (time.perf_counter() - start) * 1000 / rounds
+
+        row = {
+            "payload": name,
+            "legacy_ms": round(legacy_ms, 3),
+            "fast_ms": round(fast_ms, 3),
+            "speedup": round(legacy_ms / fast_ms, 1),
+            "encoder": "orjson" if orjson is not None else "json",
+            "same_json": json.loads(legacy_body) == json.loads(fast_body),
+            "raw_bytes": len(legacy_body),
+        }
+        for encoding in ["gzip"] + (["br"] if brotli is not None else []):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                compressed = compress(fast_body, encoding)
+            row[f"{encoding}_bytes"] = len(compressed)
+            row[f"{encoding}_ms"] = round((time.perf_counter() - start) * 1000 / rounds, 3)
+        rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    for row in run_serialization_benchmark():
+        print(json.dumps(row, ensure_ascii=False))
@@ -0,0 +1,128 @@
+"""LLM结构化输出解析工具（容错JSON提取 + 模型校验 + 按Prompt类型统计解析失败率）
+设计意图：各调用点原先各自清洗LLM输出（如删除全部换行会破坏字符串值），解析失败就直接回退或返回垃圾结果；
+这里统一为一个快速的提取函数：能直接解析时零额外开销，否则依次去掉代码块包裹、定位首个JSON值；
+只有确实拿不到符合模型的JSON时才重试，避免浪费付费调用。
+"""
+import json
+import re
+import threading
+from typing import Any, Dict, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+
+_FENCE_PATTERN = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.S)
+_decoder = json.JSONDecoder()
+
+
+class LLMJSONError(ValueError):
+    """LLM输出中无法提取合法JSON"""
+
+
+class LLMSchemaError(ValueError):
+    """LLM输出的JSON不符合预期模型"""
+
+
+# -------------------------- JSON提取 --------------------------
+def extract_json(text: Any) -> Any:
+    """从LLM输出中提取JSON值
+    依次尝试：直接解析 → 代码块（```json ... ```）内容 → 从首个 { 或 [ 起解析（忽略前后说明文字）
+    """
+    if isinstance(text, (dict, list)):
+        return text
+    if not isinstance(text, str) or not text.strip():
+        raise LLMJSONError("LLM输出为空")
+    stripped = text.strip()
+    try:
+        return json.loads(stripped)
+    except ValueError:
+        pass
+
+    fence = _FENCE_PATTERN.search(stripped)
+    if fence:
+        try:
+            return json.loads(fence.group(1).strip())
+        except ValueError:
+            stripped = fence.group(1).strip()
+
+    for idx, char in enumerate(stripped):
+        if char in "{[":
+            try:
+                value, _ = _decoder.raw_decode(stripped, idx)
+                return value
+            except ValueError:
+                continue
+    raise LLMJSONError(f"无法从LLM输出中提取JSON：{text[:200]}")
+
+
+def validate_schema(data: Any, schema: Type[BaseModel]) -> Dict[str, Any]:
+    """按pydantic模型校验并返回规范化后的字典（兼容pydantic v1/v2）"""
+    try:
+        if hasattr(schema, "model_validate"):
+            return schema.model_validate(data).model_dump()
+        return schema.parse_obj(data).dict()
+    except ValidationError as e:
+        raise LLMSchemaError(str(e)) from e
+
+
+# -------------------------- 解析失败率统计 --------------------------
+_stats_lock = threading.Lock()
+_parse_stats: Dict[str, Dict[str, int]] = {}
+
+def _record(prompt_type: str, key: str) -> None:
+    with _stats_lock:
+        stats = _parse_stats.setdefault(prompt_type, {"calls": 0, "parse_failures": 0, "schema_failures": 0, "retries": 0, "gave_up": 0})
+        stats[key] += 1
+
+def get_parse_failure_stats() -> Dict[str, Dict[str, Any]]:
+    """按Prompt类型返回解析统计（调用数/JSON提取失败/模型校验失败/重试/最终放弃及失败率）"""
+    with _stats_lock:
+        return {
+            prompt_type: {
+                **stats,
+                "failure_rate": round((stats["parse_failures"] + stats["schema_failures"]) / stats["calls"], 4) if stats["calls"] else 0.0
+            }
+            for prompt_type, stats in _parse_stats.items()
+        }
+
+def reset_parse_failure_stats() -> None:
+    """清空解析统计"""
+    with _stats_lock:
+        _parse_stats.clear()
+
+
+# -------------------------- 结构化调用 --------------------------
+def parse_llm_json(text: Any, schema: Optional[Type[BaseModel]] = None, prompt_type: str = "default") -> Dict[str, Any]:
+    """解析并校验一次LLM输出（记录统计，失败时抛出LLMJSONError/LLMSchemaError）"""
+    _record(prompt_type, "calls")
+    try:
+        data = extract_json(text)
+    except LLMJSONError:
+        _record(prompt_type, "parse_failures")
+        raise
+    if schema is None:
+        return data
+    try:
+        return validate_schema(data, schema)
+    except LLMSchemaError:
+        _record(prompt_type, "schema_failures")
+        raise
+
+
+def generate_structured(llm_client: Any, prompt: str, schema: Type[BaseModel], prompt_type: str,
+                        temperature: float = 0.2, max_retries: int = 1) -> Dict[str, Any]:
+    """以JSON模式调用LLM并按模型校验
+    - 格式噪声（代码块、前后说明文字）由extract_json直接修复，不重试
+    - 仅在确实拿不到合法/符合模型的JSON时重试，最多max_retries次
+    - LLM调用本身的异常（网络等）直接抛出，由调用方决定兜底策略
+    """
+    last_error: Optional[Exception] = None
+    for attempt in range(max_retries + 1):
+        if attempt:
+            _record(prompt_type, "retries")
+        raw = llm_client.generate_edu_response(prompt, temperature=temperature, json_mode=True, call_site=prompt_type)
+        try:
+            return parse_llm_json(raw, schema, prompt_type)
+        except (LLMJSONError, LLMSchemaError) as e:
+            last_error = e
+    _record(prompt_type, "gave_up")
+    raise last_error
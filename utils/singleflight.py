@@ -0,0 +1,179 @@
+"""单飞（single-flight）请求合并
+设计意图：教师打开班级看板时，同一学生同一学科的评估/规划请求会在一秒内重复到达多次，每个请求都各自触发一次LLM评估。
+这里按规范化后的请求参数作键：同一键已有计算在进行时，后到的调用不再重复计算，而是等待进行中的那次并共享其结果
+（异常同样共享）；计算结束即移除该键，之后的调用重新计算（结果缓存由调用方自行负责）。
+提供线程版（do，在线程池/同步代码中使用）与协程版（do_async，在事件循环中使用）；按名称统计 实际执行/合并 次数，供 /metrics 导出。
+"""
+import asyncio
+import copy
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+def make_key(*parts: Any, **params: Any) -> str:
+    """规范化请求参数为合并键：字符串去除首尾空白，None与缺省等价，字典按键排序"""
+    def normalize(value: Any) -> Any:
+        if isinstance(value, str):
+            return value.strip()
+        if isinstance(value, dict):
+            return {str(k): normalize(v) for k, v in value.items() if v is not None}
+        if isinstance(value, (list, tuple)):
+            return [normalize(v) for v in value]
+        return value
+    return json.dumps([normalize(list(parts)), normalize(params)], ensure_ascii=False, sort_keys=True, default=str)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """按键合并并发的相同计算（线程安全）"""
+
+    def __init__(self, name: str, copy_result: bool = False):
+        """
+        Args:
+            name: 统计名称（同名实例共享统计）
+            copy_result: 合并方是否拿到结果的深拷贝（结果会被调用方修改时开启）
+        """
+        self.name = name
+        self.copy_result = copy_result
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Hashable, "asyncio.Future[Any]"] = {}  # 协程版（只在事件循环线程中访问）
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """执行fn或等待进行中的相同计算，返回结果"""
+        result, _ = self.do_with_status(key, fn)
+        return result
+
+    def do_with_status(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """同do，额外返回是否为合并结果（True表示未实际执行fn）"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            _record(self.name, "coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return (copy.deepcopy(call.result) if self.copy_result else call.result), True
+
+        _record(self.name, "executed")
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            _record(self.name, "errors")
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """协程版：同一事件循环中相同键的并发调用共享一次 await fn() 的结果
+        计算作为独立任务执行，发起方被取消（如客户端断开）时不影响其他等待方
+        """
+        task = self._tasks.get(key)
+        if task is not None:
+            _record(self.name, "coalesced")
+            result = await asyncio.shield(task)
+            return copy.deepcopy(result) if self.copy_result else result
+
+        _record(self.name, "executed")
+        task = asyncio.ensure_future(fn())
+        self._tasks[key] = task
+
+        def finished(done_task: "asyncio.Future[Any]") -> None:
+            if self._tasks.get(key) is done_task:
+                del self._tasks[key]
+            if not done_task.cancelled() and done_task.exception() is not None:
+                _record(self.name, "errors")
+
+        task.add_done_callback(finished)
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._tasks)
+
+
+# -------------------------- 合并统计 --------------------------
+_stats_lock = threading.Lock()
+_flight_stats: Dict[str, Dict[str, int]] = {}
+
+def _record(name: str, key: str) -> None:
+    with _stats_lock:
+        stats = _flight_stats.setdefault(name, {"executed": 0, "coalesced": 0, "errors": 0})
+        stats[key] += 1
+
+def get_singleflight_stats() -> Dict[str, Dict[str, Any]]:
+    """按名称返回 实际执行/合并/失败 次数及合并率"""
+    with _stats_lock:
+        return {
+            name: {
+                **stats,
+                "coalesce_rate": round(stats["coalesced"] / (stats["executed"] + stats["coalesced"]), 4)
+                if stats["executed"] + stats["coalesced"] else 0.0
+            }
+            for name, stats in _flight_stats.items()
+        }
+
+def reset_singleflight_stats() -> None:
+    with _stats_lock:
+        _flight_stats.clear()
+
+
+# -------------------------- 功能测试 --------------------------
+def test_singleflight_shares_errors():
+    """进行中的计算失败时，合并方收到同一个异常；计算结束后相同键重新执行"""
+    import time
+    flight = SingleFlight(f"test_errors_{time.monotonic_ns()}")  # 独立统计名称，不影响其他实例的统计
+    release = threading.Event()
+    calls = []
+    errors: Dict[str, BaseException] = {}
+
+    def failing():
+        calls.append(threading.current_thread().name)
+        release.wait(5)
+        raise ValueError("评估失败")
+
+    def caller(name: str) -> None:
+        try:
+            flight.do("S1|math", failing)
+        except ValueError as e:
+            errors[name] = e
+
+    threads = [threading.Thread(target=caller, args=(f"c{i}",), name=f"c{i}") for i in range(4)]
+    threads[0].start()
+    while not calls:
+        time.sleep(0.001)
+    for thread in threads[1:]:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while get_singleflight_stats()[flight.name]["coalesced"] < 3 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(errors) == 4 and len({id(e) for e in errors.values()}) == 1
+    assert get_singleflight_stats()[flight.name] == {"executed": 1, "coalesced": 3, "errors": 1, "coalesce_rate": 0.75}
+    assert flight.in_flight() == 0
+    assert flight.do("S1|math", lambda: "重新计算") == "重新计算"
+    print("✅ 单飞合并：异常共享、结束后重新执行正常")
+
+
+if __name__ == "__main__":
+    test_singleflight_shares_errors()